@@ -0,0 +1,276 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import io
+import math
+import multiprocessing
+import random
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+# Kinds of URLs found in the ImageNet lists. Every kind is served from
+# its own path, so a URL always behaves the same way.
+kinds = ['jpeg', 'placeholder', 'not_found', 'server_error', 'html',
+         'drip', 'refused', 'blackhole']
+
+html_page = b'''<html><head><title>Page not found</title></head>
+<body><h1>Sorry, the page you requested could not be found</h1></body>
+</html>'''
+
+
+def make_jpeg(width, height, seed):
+    # noise keeps the file about as large as a real photo of the size
+    rng = random.Random(seed)
+    pixels = bytes(rng.getrandbits(8) for _ in range(width * height * 3))
+    image = Image.frombytes('RGB', (width, height), pixels)
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=85)
+    return out.getvalue()
+
+
+def make_placeholder():
+    # a small valid image served instead of a removed photo
+    image = Image.new('RGB', (500, 374), (220, 220, 220))
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return out.getvalue()
+
+
+class LatencyDistribution:
+    # log-normal, as response times usually are; median and sigma in
+    # seconds, values are cut at the maximum
+    def __init__(self, median=0.05, sigma=0.5, maximum=10, seed=0):
+        self.median = median
+        self.sigma = sigma
+        self.maximum = maximum
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        if self.median <= 0:
+            return 0
+        with self._lock:
+            value = self._rng.lognormvariate(math.log(self.median),
+                                             self.sigma)
+        return min(value, self.maximum)
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        kind = self.path.strip('/').split('/', 1)[0]
+        time.sleep(server.latency.sample())
+
+        try:
+            if kind == 'jpeg':
+                index = zlib.crc32(self.path.encode()) % len(server.jpegs)
+                self._send(200, 'image/jpeg', server.jpegs[index])
+            elif kind == 'placeholder':
+                self._send(200, 'image/png', server.placeholder)
+            elif kind == 'not_found':
+                self._send(404, 'text/html', html_page)
+            elif kind == 'server_error':
+                self._send(503, 'text/html', html_page)
+            elif kind == 'html':
+                self._send(200, 'text/html', html_page)
+            elif kind == 'drip':
+                self._drip(server.jpegs[0], server.drip_chunk,
+                           server.drip_delay)
+            else:
+                self._send(400, 'text/plain', b'unknown kind')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _drip(self, body, chunk, delay):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), chunk):
+            self.wfile.write(body[start:start + chunk])
+            self.wfile.flush()
+            time.sleep(delay)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # many connections are opened at once, none of them should wait for
+    # the SYN to be sent again
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # clients give up on slow responses all the time
+        pass
+
+
+class Blackhole:
+    # accepts connections and never answers, like a host which is up
+    # but does not serve anything
+    def __init__(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(1024)
+        self._connections = []
+        self._thread = None
+        self._stopped = False
+
+    @property
+    def port(self):
+        return self._socket.getsockname()[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def _accept(self):
+        while not self._stopped:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            self._connections.append(connection)
+
+    def stop(self):
+        self._stopped = True
+        self._socket.close()
+        for connection in self._connections:
+            connection.close()
+
+
+def closed_port():
+    # nothing listens on it, connections are refused at once
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class ImageServer:
+    # A local stand-in for the hosts of the ImageNet URL lists
+    def __init__(self, latency=None, jpeg_sizes=((500, 375), (375, 500),
+                                                  (640, 480), (300, 200)),
+                 drip_chunk=4096, drip_delay=0.2):
+        self._server = QuietServer(('127.0.0.1', 0), ImageRequestHandler)
+        self._server.latency = latency or LatencyDistribution()
+        self._server.jpegs = [make_jpeg(width, height, seed)
+                              for seed, (width, height)
+                              in enumerate(jpeg_sizes)]
+        self._server.placeholder = make_placeholder()
+        self._server.drip_chunk = drip_chunk
+        self._server.drip_delay = drip_delay
+        self._blackhole = Blackhole()
+        self._refused_port = closed_port()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        self._blackhole.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._blackhole.stop()
+
+    @property
+    def ports(self):
+        return {
+            'http': self._server.server_address[1],
+            'blackhole': self._blackhole.port,
+            'refused': self._refused_port
+        }
+
+    def url(self, kind, index):
+        return url(self.ports, kind, index)
+
+    def population(self, count, mix, seed=0):
+        return population(self.ports, count, mix, seed)
+
+
+class ImageServerProcess:
+    # The server in a process of its own, so that it neither takes the
+    # interpreter lock nor adds to the CPU time of the measured process
+    def __init__(self, median_latency=0.05, sigma=0.5, **kwargs):
+        self._args = (median_latency, sigma, kwargs)
+        self._connection = None
+        self._process = None
+        self.ports = None
+
+    def start(self):
+        self._connection, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=serve,
+                                                args=(child,) + self._args,
+                                                daemon=True)
+        self._process.start()
+        self.ports = self._connection.recv()
+
+    def stop(self):
+        self._connection.send('stop')
+        self._process.join()
+
+    def url(self, kind, index):
+        return url(self.ports, kind, index)
+
+    def population(self, count, mix, seed=0):
+        return population(self.ports, count, mix, seed)
+
+
+def serve(connection, median_latency, sigma, kwargs):
+    server = ImageServer(latency=LatencyDistribution(median_latency, sigma),
+                         **kwargs)
+    server.start()
+    connection.send(server.ports)
+    connection.recv()
+    server.stop()
+
+
+def url(ports, kind, index):
+    if kind in ('refused', 'blackhole'):
+        port = ports[kind]
+    else:
+        port = ports['http']
+    return 'http://127.0.0.1:{}/{}/{}.jpg'.format(port, kind, index)
+
+
+def population(ports, count, mix, seed=0):
+    # mix maps kinds to their shares of the URLs
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    return [url(ports, kind, i)
+            for i, kind in enumerate(rng.choices(names, weights, k=count))]
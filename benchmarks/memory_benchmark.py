@@ -0,0 +1,159 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from config import config
+from image_net import batch_download, downloader, tracing
+from image_net.counts import word_net_ids
+from image_net.stateful_downloader import StatefulDownloader
+from util.app_state import AppState, DownloadConfiguration
+
+
+# A whole download is simulated without the network: URLs come from a
+# generated dump and every download succeeds or fails at once, so only
+# the memory kept by the download state itself is measured. Every request
+# is traced, so the time kept per host is measured as well. Resident
+# memory should stop growing once every category has been seen.
+class SimulatedDownloader(downloader.ThreadingDownloader):
+    success_share = 0.6
+
+    def download(self, urls, destinations, quota=None, cancellation=None):
+        self.downloaded_urls = []
+        self.failed_urls = []
+        self.cancelled_urls = []
+        self.interrupted_urls = []
+        self.failure_reasons = {}
+
+        for i, url in enumerate(urls):
+            trace = tracing.RequestTrace(url)
+            trace.add('body', 0, 0.001 * (i % 50))
+            self.tracer.finish(trace)
+
+            if (i * 7919) % 100 < self.success_share * 100:
+                self.downloaded_urls.append(url)
+            else:
+                self.failed_urls.append(url)
+                self.failure_reasons[url] = 'HTTP 404'
+        self.tracer.collect()
+
+
+class SimulatedFactory:
+    def new_threading_downloader(self):
+        return SimulatedDownloader()
+
+
+def write_dump(path, categories, urls_per_category, hosts):
+    with open(path, 'w') as f:
+        for i in range(categories):
+            for j in range(urls_per_category):
+                host = (i * urls_per_category + j) % hosts
+                f.write('n{:08d}_{}\thttp://farm{}.example.com/{}/{}.jpg\n'
+                        .format(i, j, host, i, j))
+
+
+def resident_memory():
+    # in megabytes; the peak is used where the current value is unknown
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(args, work_dir):
+    dump_path = os.path.join(work_dir, 'urls.tsv')
+    write_dump(dump_path, args.categories, args.urls_per_category,
+               args.hosts)
+    config.load(urls_dump_path=dump_path, auto_tune_workers=False)
+    batch_download.get_factory = SimulatedFactory
+
+    destination = os.path.join(work_dir, 'images')
+    os.makedirs(destination)
+    os.makedirs(config.app_data_folder, exist_ok=True)
+
+    app_state = AppState()
+    app_state.set_configuration(DownloadConfiguration(
+        number_of_images=args.categories * args.urls_per_category,
+        images_per_category=args.urls_per_category,
+        download_destination=destination,
+        batch_size=args.batch_size
+    ))
+    app_state.save()
+
+    samples = []
+    started = time.perf_counter()
+    for i, _ in enumerate(StatefulDownloader(app_state)):
+        if i % args.sample_every == 0:
+            samples.append(sample(app_state, started))
+    samples.append(sample(app_state, started))
+    return samples
+
+
+def sample(app_state, started):
+    return (app_state.progress_info.total_downloaded, len(word_net_ids),
+            resident_memory(), time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure memory over a simulated download'
+    )
+    parser.add_argument('--categories', type=int, default=21841)
+    parser.add_argument('--urls-per-category', type=int, default=100)
+    parser.add_argument('--hosts', type=int, default=40000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--sample-every', type=int, default=200)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        samples = run(args, work_dir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir)
+
+    print('{:>12} {:>12} {:>10} {:>10}'.format('images', 'categories',
+                                                'RSS, MB', 'seconds'))
+    for images, categories, rss, seconds in samples:
+        print('{:>12} {:>12} {:>10.1f} {:>10.1f}'.format(images, categories,
+                                                         rss, seconds))
+
+    # categories are opened one after another, so a little memory is
+    # added with every new one; nothing should grow with the images
+    half = samples[len(samples) // 2:]
+    print('Growth over the second half: {:.1f} MB'.format(
+        half[-1][2] - half[0][2]
+    ))
+
+
+if __name__ == '__main__':
+    main()
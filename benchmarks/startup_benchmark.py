@@ -0,0 +1,70 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# every statement runs in a fresh interpreter, so nothing is cached
+# between repetitions; interpreter startup itself is not measured
+cases = [
+    ('import config', 'import config'),
+    ('load settings', 'from config import config; config.load()'),
+    ('create thread pool',
+     'from config import config; config.pool_executor'),
+    ('import cli', 'import cli'),
+    ('import image_net.stateful_downloader',
+     'import image_net.stateful_downloader'),
+]
+
+timer = '''
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+'''
+
+
+def measure(statement, repeat):
+    code = timer.format(root=root, statement=statement)
+    times = []
+    for _ in range(repeat):
+        # running outside of the repository checks that nothing depends
+        # on the working directory
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.expanduser('~'))
+        times.append(float(output))
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure startup costs')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    for name, statement in cases:
+        seconds = measure(statement, args.repeat)
+        print('{:<40} {:>8.1f} ms'.format(name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
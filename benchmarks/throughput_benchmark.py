@@ -0,0 +1,240 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import contextlib
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import config
+from image_net import batch_download, downloader
+from image_net.stateful_downloader import StatefulDownloader
+from util.app_state import AppState, DownloadConfiguration
+from image_server import ImageServerProcess
+
+
+# shares of every kind of URL and the latency of the server
+scenarios = {
+    'clean': {
+        'mix': {'jpeg': 1.0},
+        'latency': (0.02, 0.3)
+    },
+    'imagenet': {
+        'mix': {'jpeg': 0.6, 'placeholder': 0.1, 'not_found': 0.12,
+                'server_error': 0.02, 'html': 0.06, 'drip': 0.02,
+                'refused': 0.05, 'blackhole': 0.03},
+        'latency': (0.08, 0.8)
+    },
+    'slow_tail': {
+        'mix': {'jpeg': 0.9, 'drip': 0.1},
+        'latency': (0.2, 1.2)
+    },
+    'errors': {
+        'mix': {'jpeg': 0.3, 'not_found': 0.3, 'server_error': 0.2,
+                'html': 0.1, 'refused': 0.1},
+        'latency': (0.05, 0.5)
+    }
+}
+
+
+# settings changed from the command line, kept when the settings are
+# loaded again with the URL dump of a scenario
+overrides = {}
+
+
+class MeasuredDownloader(downloader.ThreadingDownloader):
+    # keeps what every download of a run has measured
+    all_latencies = []
+    total_bytes = 0
+
+    def download(self, *args, **kwargs):
+        super().download(*args, **kwargs)
+        MeasuredDownloader.all_latencies.extend(self.latencies)
+        MeasuredDownloader.total_bytes += self.stats.bytes_downloaded
+
+    @classmethod
+    def reset(cls):
+        cls.all_latencies = []
+        cls.total_bytes = 0
+
+
+class MeasuredFactory:
+    def new_threading_downloader(self):
+        return MeasuredDownloader()
+
+
+def resident_memory():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def run_threading(urls, work_dir, workers):
+    destination = os.path.join(work_dir, 'threading')
+    os.makedirs(destination)
+    destinations = [os.path.join(destination, '{}.jpg'.format(i))
+                    for i in range(len(urls))]
+
+    d = MeasuredDownloader()
+    d.set_concurrency(workers)
+    d.download(urls, destinations)
+    return len(d.downloaded_urls), len(d.failed_urls)
+
+
+def run_stateful(urls, work_dir, batch_size, urls_per_category=100):
+    dump_path = os.path.join(work_dir, 'urls.tsv')
+    with open(dump_path, 'w') as f:
+        for i, url in enumerate(urls):
+            f.write('n{:08d}_{}\t{}\n'.format(i // urls_per_category, i,
+                                              url))
+    config.load(config.settings_path, **dict(overrides,
+                                              urls_dump_path=dump_path))
+
+    destination = os.path.join(work_dir, 'stateful')
+    os.makedirs(destination)
+    app_state = AppState()
+    app_state.set_configuration(DownloadConfiguration(
+        number_of_images=len(urls),
+        images_per_category=urls_per_category,
+        download_destination=destination,
+        batch_size=batch_size
+    ))
+    app_state.save()
+
+    for _ in StatefulDownloader(app_state):
+        pass
+    progress_info = app_state.progress_info
+    return progress_info.total_downloaded, progress_info.total_failed
+
+
+def measure(engine, run):
+    MeasuredDownloader.reset()
+    cpu = cpu_seconds()
+    started = time.perf_counter()
+    # failed downloads are reported on the standard output
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        images, failures = run()
+    seconds = time.perf_counter() - started
+    latencies = MeasuredDownloader.all_latencies
+
+    return {
+        'engine': engine,
+        'images': images,
+        'failures': failures,
+        'images_per_second': images / seconds,
+        'bytes_per_second': MeasuredDownloader.total_bytes / seconds,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'cpu_seconds': cpu_seconds() - cpu,
+        'rss': resident_memory()
+    }
+
+
+def run_scenario(name, args):
+    scenario = scenarios[name]
+    median, sigma = scenario['latency']
+    server = ImageServerProcess(median, sigma)
+    server.start()
+
+    work_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    results = []
+    try:
+        urls = server.population(args.urls, scenario['mix'], seed=args.seed)
+        if args.engine in ('threading', 'both'):
+            results.append(measure('threading', lambda: run_threading(
+                urls, work_dir, args.workers
+            )))
+        if args.engine in ('stateful', 'both'):
+            results.append(measure('stateful', lambda: run_stateful(
+                urls, work_dir, args.batch_size
+            )))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir)
+        server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure download throughput against a local server'
+    )
+    parser.add_argument('scenarios', nargs='*',
+                        help='one or more of {}, all of them by default'
+                        .format(', '.join(sorted(scenarios))))
+    parser.add_argument('--urls', type=int, default=2000)
+    parser.add_argument('--engine', choices=['threading', 'stateful',
+                                             'both'], default='both')
+    parser.add_argument('--workers', type=int, default=150)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--timeout', type=float, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in scenarios:
+            parser.error('unknown scenario {}'.format(name))
+
+    # downloads must go through the network, not the test doubles
+    os.environ.pop('TEST_ENV', None)
+    overrides.update(file_download_timeout=args.timeout,
+                     initial_workers=args.workers)
+    config.load(config.settings_path, **overrides)
+    batch_download.get_factory = MeasuredFactory
+
+    print('{:<10} {:<10} {:>7} {:>7} {:>9} {:>9} {:>7} {:>7} {:>7} {:>7}'
+          .format('scenario', 'engine', 'images', 'failed', 'images/s',
+                  'MB/s', 'p50, s', 'p99, s', 'CPU, s', 'RSS, MB'))
+    for name in args.scenarios or sorted(scenarios):
+        for r in run_scenario(name, args):
+            print('{:<10} {:<10} {:>7} {:>7} {:>9.1f} {:>9.2f} {:>7.3f} '
+                  '{:>7.3f} {:>7.1f} {:>7.1f}'.format(
+                      name, r['engine'], r['images'], r['failures'],
+                      r['images_per_second'],
+                      r['bytes_per_second'] / 1024 / 1024, r['p50'],
+                      r['p99'], r['cpu_seconds'], r['rss']))
+
+
+if __name__ == '__main__':
+    main()
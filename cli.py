@@ -0,0 +1,415 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from config import config, Config
+from image_net.sharding import create_downloader, ShardFailedError
+from image_net.iterators import WordNetIdsUnavailableError
+from image_net.categories import CategoriesUnavailableError, \
+    CategorySelection, import_ilsvrc2012_ids
+from image_net import metrics, tracing
+from image_net.sampling import Sampling
+from image_net.pipeline import bottleneck
+from util.app_state import AppState, DownloadConfiguration
+
+
+class Interruption:
+    # The first SIGINT or SIGTERM pauses the download: downloads in flight
+    # are aborted and the state is saved. The second one stops the
+    # program right away.
+    def __init__(self):
+        self.cancellation = threading.Event()
+        self._previous_handlers = {}
+
+    @property
+    def requested(self):
+        return self.cancellation.is_set()
+
+    def request(self):
+        self.cancellation.set()
+
+    def __enter__(self):
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            self._previous_handlers[signum] = signal.signal(signum,
+                                                            self._handle)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+
+    def _handle(self, signum, frame):
+        if self.requested:
+            raise KeyboardInterrupt()
+
+        self.request()
+        print('Pausing, interrupt again to stop right away',
+              file=sys.stderr)
+
+
+def configure(args):
+    app_state = AppState()
+    if app_state.inprogress and not args.force:
+        print('A download is in progress, reset it or use --force',
+              file=sys.stderr)
+        return 1
+
+    # lists of categories are fetched now, so a missing list or an
+    # unreachable server is reported before anything is downloaded
+    try:
+        categories = _category_selection(args)
+        categories.resolve()
+    except CategoriesUnavailableError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    conf = DownloadConfiguration(
+        number_of_images=args.images,
+        images_per_category=args.per_category,
+        download_destination=args.destination,
+        batch_size=_or_default(args.batch_size, config.default_batch_size),
+        interleaved_categories=_or_default(
+            args.interleaved_categories, config.default_interleaved_categories
+        ),
+        shards=_or_default(args.processes, config.default_shards),
+        categories=categories,
+        sampling=Sampling(mode=args.sampling, seed=args.seed)
+    )
+    if not conf.is_valid:
+        for error in conf.errors:
+            print(error, file=sys.stderr)
+        return 1
+
+    conf.download_destination = os.path.abspath(args.destination)
+    app_state.reset()
+    app_state.set_configuration(conf)
+    app_state.save()
+    _reset_log()
+    print('Configured a download of {} images into {}'.format(
+        conf.number_of_images, conf.download_destination
+    ))
+    return 0
+
+
+def start(args):
+    app_state = AppState()
+    if app_state.inprogress:
+        print('The download has already started, use resume',
+              file=sys.stderr)
+        return 1
+
+    with Interruption() as interruption:
+        return download(app_state, interruption)
+
+
+def resume(args):
+    app_state = AppState()
+    if not app_state.inprogress:
+        print('There is no download to resume, use start', file=sys.stderr)
+        return 1
+
+    with Interruption() as interruption:
+        return download(app_state, interruption)
+
+
+def download(app_state, interruption):
+    if not app_state.configured:
+        print('The download is not configured, use configure',
+              file=sys.stderr)
+        return 1
+
+    if app_state.progress_info.finished:
+        print('The download has already finished')
+        return 0
+
+    downloader = create_downloader(app_state,
+                                   cancellation=interruption.cancellation)
+    results = iter(downloader)
+    try:
+        for result in results:
+            _log_failures(result.failed_urls)
+            _print_progress(app_state)
+
+        _print_stages(downloader.stage_metrics)
+        _print_phases(tracing.default_tracer)
+        if interruption.requested and not app_state.progress_info.finished:
+            app_state.save()
+            print('Paused, use resume to continue')
+            return 0
+    except WordNetIdsUnavailableError:
+        print('Failed to fetch a list of WordNet ids. '
+              'Check if ImageNet server can be reached', file=sys.stderr)
+        return 1
+    except (CategoriesUnavailableError, ShardFailedError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        results.close()
+
+    app_state.mark_finished()
+    app_state.save()
+    print('Finished')
+    return 0
+
+
+def status(args):
+    app_state = AppState()
+    conf = app_state.download_configuration
+    progress_info = app_state.progress_info
+
+    if progress_info.finished:
+        state = 'finished'
+    elif app_state.inprogress:
+        state = 'paused'
+    elif app_state.configured:
+        state = 'ready'
+    else:
+        state = 'initial'
+
+    info = {
+        'state': state,
+        'destination': conf.download_destination,
+        'number_of_images': conf.number_of_images,
+        'images_per_category': conf.images_per_category,
+        'downloaded': progress_info.total_downloaded,
+        'failed': progress_info.total_failed,
+        'errors': app_state.errors
+    }
+
+    if args.json:
+        print(json.dumps(info))
+    else:
+        for key, value in info.items():
+            print('{}: {}'.format(key, value))
+    return 0
+
+
+def reset(args):
+    app_state = AppState()
+    app_state.reset()
+    app_state.save()
+    _reset_log()
+    print('The download has been reset')
+    return 0
+
+
+def coordinate(args):
+    from image_net.distributed import Coordinator
+
+    app_state = AppState()
+    if not app_state.configured:
+        print('The download is not configured, use configure',
+              file=sys.stderr)
+        return 1
+
+    coordinator = Coordinator(app_state, units=args.units, host=args.host,
+                              port=args.port)
+    coordinator.start()
+    print('Coordinating the download at {}'.format(coordinator.address))
+    try:
+        with Interruption() as interruption:
+            while not coordinator.done and not interruption.requested:
+                time.sleep(1)
+    finally:
+        coordinator.stop()
+        app_state.save()
+    return 0
+
+
+def work(args):
+    from image_net.distributed import run_worker
+
+    run_worker(args.coordinator, args.name,
+               os.path.abspath(args.destination))
+    return 0
+
+
+def _category_selection(args):
+    if args.categories:
+        return CategorySelection.from_list(args.categories)
+
+    if args.ilsvrc2012 is not None:
+        if args.ilsvrc2012:
+            import_ilsvrc2012_ids(args.ilsvrc2012)
+        return CategorySelection.ilsvrc2012()
+
+    if args.subtree:
+        return CategorySelection.subtree(args.subtree)
+
+    return CategorySelection()
+
+
+def _or_default(value, default):
+    if value is None:
+        return default
+    return value
+
+
+def _print_progress(app_state):
+    progress_info = app_state.progress_info
+    print('{} of {} images downloaded, {} failed, {} left'.format(
+        progress_info.total_downloaded,
+        app_state.download_configuration.number_of_images,
+        progress_info.total_failed,
+        app_state.time_remaining
+    ))
+
+
+def _print_stages(metrics):
+    for m in metrics:
+        print('{}: {} items, {:.0%} busy, queue depth {:.1f} (max {})'.format(
+            m.name, m.items, m.utilization, m.mean_queue_depth,
+            m.max_queue_depth
+        ))
+
+    slowest = bottleneck(metrics)
+    if slowest is not None:
+        print('Bottleneck: {}'.format(slowest.name))
+
+
+def _print_phases(tracer):
+    # only requests made by this process are traced
+    for phase in tracing.phases:
+        count = tracer.phase_seconds.count(phase)
+        if count:
+            print('{}: {:.1f} ms on average over {} requests'.format(
+                phase, tracer.phase_seconds.total(phase) / count * 1000,
+                count
+            ))
+
+    for host, seconds in tracer.slowest_hosts(5):
+        print('{}: {:.1f} s in total'.format(host, seconds))
+
+
+def _reset_log():
+    os.makedirs(config.app_data_folder, exist_ok=True)
+    with open(config.log_path, 'w') as f:
+        f.write('')
+
+
+def _log_failures(urls):
+    if not urls:
+        return
+
+    with open(config.log_path, 'a') as f:
+        f.write('\n'.join(urls) + '\n')
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description='Download ImageNet images without the graphical interface'
+    )
+    parser.add_argument('--settings',
+                        help='settings file to use instead of settings.json')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve metrics for Prometheus on this port')
+    parser.add_argument('--metrics-file',
+                        help='file to write metrics to periodically')
+    parser.add_argument('--trace-file',
+                        help='file to write sampled request traces to in '
+                             'the Chrome trace format')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('configure', help='configure a new download')
+    p.add_argument('destination')
+    p.add_argument('--images', type=int, required=True,
+                   help='total number of images')
+    p.add_argument('--per-category', type=int, required=True,
+                   help='number of images per category')
+    p.add_argument('--batch-size', type=int)
+    p.add_argument('--interleaved-categories', type=int)
+    p.add_argument('--processes', type=int)
+    p.add_argument('--sampling', choices=Sampling.modes,
+                   default='sequential',
+                   help='order in which URLs are taken')
+    p.add_argument('--seed', type=int, default=0,
+                   help='seed of the uniform and stratified samples')
+    p.add_argument('--force', action='store_true',
+                   help='drop a download in progress')
+    selection = p.add_mutually_exclusive_group()
+    selection.add_argument('--categories', nargs='+', metavar='WNID',
+                           help='download only these categories')
+    selection.add_argument('--ilsvrc2012', nargs='?', const='',
+                           metavar='LIST',
+                           help='download only the ILSVRC-2012 categories, '
+                                'optionally listed in a local file')
+    selection.add_argument('--subtree', metavar='WNID',
+                           help='download only this category and the ones '
+                                'below it')
+    p.set_defaults(handler=configure)
+
+    p = subparsers.add_parser('start', help='start a configured download')
+    p.set_defaults(handler=start, exports_metrics=True)
+
+    p = subparsers.add_parser('resume', help='resume a paused download')
+    p.set_defaults(handler=resume, exports_metrics=True)
+
+    p = subparsers.add_parser('status', help='show the download progress')
+    p.add_argument('--json', action='store_true')
+    p.set_defaults(handler=status)
+
+    p = subparsers.add_parser('reset', help='drop the download state')
+    p.set_defaults(handler=reset)
+
+    p = subparsers.add_parser('coordinate',
+                              help='lend the download to remote workers')
+    p.add_argument('--units', type=int)
+    p.add_argument('--host', default='127.0.0.1',
+                   help='address to listen on, 0.0.0.0 serves workers on '
+                        'other machines')
+    p.add_argument('--port', type=int)
+    p.set_defaults(handler=coordinate, exports_metrics=True)
+
+    p = subparsers.add_parser('work', help='download for a coordinator')
+    p.add_argument('coordinator', help='address of the coordinator')
+    p.add_argument('name', help='name of this worker')
+    p.add_argument('destination')
+    p.set_defaults(handler=work, exports_metrics=True)
+
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    if args.settings:
+        # download processes read the settings on their own
+        os.environ[Config.settings_variable] = args.settings
+        config.load(args.settings)
+
+    # only commands which download have anything to report
+    downloads = getattr(args, 'exports_metrics', False)
+    exporters = []
+    if downloads:
+        exporters = metrics.start_exporters(port=args.metrics_port,
+                                            path=args.metrics_file)
+    try:
+        return args.handler(args)
+    finally:
+        metrics.stop_exporters(exporters)
+        if downloads and args.trace_file:
+            tracing.default_tracer.write_chrome_trace(args.trace_file)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,15 +17,26 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import os
 import json
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
 
 class Config:
-    def __init__(self):
-        with open('settings.json', 'r') as f:
-            s = f.read()
-
-        settings = json.loads(s)
+    settings_variable = 'IMAGENET_DOWNLOADER_SETTINGS'
+    defaults_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'settings.json')
+
+    def __init__(self, settings_path=None):
+        # settings are only read when one of them is used, so importing
+        # the configuration costs nothing
+        if settings_path is None:
+            settings_path = os.environ.get(self.settings_variable)
+        if not settings_path:
+            settings_path = self.defaults_path
+        self.settings_path = settings_path
+        self._loaded = False
+        self._pool_executor = None
+        self._pool_lock = threading.Lock()
 
         self.app_data_folder = 'imagenet_data'
 
@@ -34,12 +45,40 @@ class Config:
         self.app_state_path = os.path.join(self.app_data_folder,
                                            'app_state.json')
 
+        self.app_state_backup_path = os.path.join(self.app_data_folder,
+                                                  'app_state.json.prev')
+
+        self.shards_folder = os.path.join(self.app_data_folder, 'shards')
+
+        self.units_folder = os.path.join(self.app_data_folder, 'units')
+
+        self.coordinator_state_path = os.path.join(self.app_data_folder,
+                                                   'coordinator.json')
+
+        self.manifest_path = os.path.join(self.app_data_folder,
+                                          'manifest.tsv')
+
+        self.app_state_journal_path = os.path.join(self.app_data_folder,
+                                                   'app_state.journal')
+
+        self.url_status_db_path = os.path.join(self.app_data_folder,
+                                               'url_status.sqlite')
+
         self.wn_ids_path = os.path.join(self.app_data_folder,
                                         'word_net_ids.txt')
 
         self.registry_path = os.path.join(self.app_data_folder,
                                           'file-name-registry.json')
 
+        self.synset_urls_store_path = os.path.join(self.app_data_folder,
+                                                   'synset_urls.store')
+
+        self.url_dump_marker_path = os.path.join(self.app_data_folder,
+                                                 'url_dump.json')
+
+        self.ilsvrc2012_wn_ids_path = os.path.join(self.app_data_folder,
+                                                   'ilsvrc2012_wnids.txt')
+
         self.download_state_path = os.path.join(self.app_data_folder,
                                                 'download_state.json')
 
@@ -47,22 +86,107 @@ class Config:
             'http://www.image-net.org/api/text/imagenet.synset.obtain_synset_list'
         )
 
+        # class index of the Keras ImageNet models, it maps the 1000
+        # ILSVRC-2012 classes to their WordNet ids
+        self.ilsvrc2012_wn_ids_url = (
+            'https://storage.googleapis.com/download.tensorflow.org/data/'
+            'imagenet_class_index.json'
+        )
+
+    def __getattr__(self, name):
+        if name.startswith('_') or self._loaded:
+            raise AttributeError(name)
+
+        self.load()
+        return getattr(self, name)
+
+    def load(self, settings_path=None, **overrides):
+        if settings_path is not None:
+            self.settings_path = settings_path
+
+        # a settings file only needs the settings it changes, the others
+        # are taken from the settings next to the package
+        settings = self._read_settings(self.defaults_path)
+        if os.path.abspath(self.settings_path) != self.defaults_path:
+            settings.update(self._read_settings(self.settings_path))
+        settings.update(overrides)
+
         self.word_net_ids_timeout = settings['word_net_ids_timeout']
         self.synsets_timeout = settings['synsets_timeout']
+        self.synsets_prefetch = settings['synsets_prefetch']
         self.file_download_timeout = settings['file_download_timeout']
 
+        self.urls_dump_path = settings['urls_dump_path']
+
         self.default_batch_size = settings['batch_size']
-        self.pool_executor = ThreadPoolExecutor(
-            max_workers=settings['max_workers']
-        )
+        self.state_compaction_interval = settings['state_compaction_interval']
+        self.default_shards = settings['download_processes']
+        self.work_units = settings['work_units']
+        self.lease_timeout = settings['lease_timeout']
+        self.coordinator_port = settings['coordinator_port']
+        self.track_url_status = settings['track_url_status']
+        self.default_interleaved_categories = \
+            settings['interleaved_categories']
+        self.max_workers = settings['max_workers']
+        self.auto_tune_workers = settings['auto_tune_workers']
+        self.min_workers = settings['min_workers']
+        self.initial_workers = settings['initial_workers']
+        self.validate_workers = settings['validate_workers']
+        self.sink_workers = settings['sink_workers']
+        self.stage_queue_size = settings['stage_queue_size']
+        self.journal_queue_size = settings['journal_queue_size']
+        self.metrics_port = settings['metrics_port']
+        self.metrics_host = settings['metrics_host']
+        self.metrics_path = settings['metrics_path']
+        self.metrics_interval = settings['metrics_interval']
+        self.trace_sample_rate = settings['trace_sample_rate']
+        self.trace_buffer_size = settings['trace_buffer_size']
+        self.progress_refresh_interval = settings['progress_refresh_interval']
+        self._loaded = True
+
+    def _read_settings(self, path):
+        with open(path, 'r') as f:
+            s = f.read()
+
+        return json.loads(s)
+
+    @property
+    def pool_executor(self):
+        # threads are started by the first download, not by the import
+        with self._pool_lock:
+            if self._pool_executor is None:
+                self._pool_executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers
+                )
+            return self._pool_executor
 
     def synset_urls_path(self, word_net_id):
         file_name = 'synset_urls_{}.txt'.format(word_net_id)
         return os.path.join(self.app_data_folder, file_name)
 
+    def shard_state_path(self, index):
+        file_name = 'shard_{}.json'.format(index)
+        return os.path.join(self.shards_folder, file_name)
+
+    def unit_state_path(self, index):
+        file_name = 'unit_{}.json'.format(index)
+        return os.path.join(self.units_folder, file_name)
+
+    def shard_urls_store_path(self, index):
+        file_name = 'synset_urls.shard{}.store'.format(index)
+        return os.path.join(self.app_data_folder, file_name)
+
     def synset_download_url(self, word_net_id):
         return 'http://www.image-net.org/api/text/imagenet.synset.geturls?' \
                'wnid={}'.format(word_net_id)
 
+    def hyponyms_path(self, word_net_id):
+        file_name = 'hyponyms_{}.txt'.format(word_net_id)
+        return os.path.join(self.app_data_folder, file_name)
+
+    def hyponyms_url(self, word_net_id):
+        return 'http://www.image-net.org/api/text/wordnet.structure.hyponym?' \
+               'wnid={}&full=1'.format(word_net_id)
+
 
 config = Config()
@@ -16,12 +16,19 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import os
+import math
+import threading
+from urllib.parse import urlparse
 from image_net.downloader import get_factory
+from image_net.counts import CountTable, Interner
 from image_net.util import Url2FileName
+from image_net.url_status import UrlStatusStore
 
 
 class BatchDownload:
-    def __init__(self, download_configuration, starting_index=1):
+    def __init__(self, download_configuration, starting_index=1,
+                 url_statuses=None, index_step=1, budget=None,
+                 concurrency=None, cancellation=None):
         dataset_root = download_configuration.download_destination
         number_of_images = download_configuration.number_of_images
         images_per_category = download_configuration.images_per_category
@@ -32,23 +39,81 @@ class BatchDownload:
 
         self._location = DownloadLocation(dataset_root)
         self._pending = []
+        self._deferred = []
         self._batch_size = batch_size
         self._max_images = number_of_images
         self._images_per_category = images_per_category
         self._total_downloaded = 0
 
-        self._url2file_name = Url2FileName(starting_index=starting_index)
+        # several processes may download into the same folders, each of
+        # them takes every index_step-th file index
+        self._url2file_name = Url2FileName(starting_index=starting_index,
+                                           step=index_step)
+        self._budget = budget
 
-        self._category_counts = {}
+        self._category_counts = CountTable()
+        self._changed_counts = set()
+        self._pending_counts = {}
+        self._scheduler = UrlScheduler()
+        self._batch_quota = None
+
+        self._url_statuses = url_statuses
+        self._failure_reasons = {}
+        self._finished_statuses = []
+        self._last_downloads = []
+
+        self._cancellation = cancellation
+        self._interrupted_urls = []
+        self._interrupted = []
 
         self._threading_downloader = get_factory().new_threading_downloader()
 
+        self._concurrency = concurrency
+        if concurrency is not None:
+            self._threading_downloader.set_concurrency(concurrency.level)
+
     def set_counts(self, counts):
-        self._category_counts = dict(counts)
+        self._category_counts = CountTable(counts)
 
     @property
     def category_counts(self):
-        return dict(self._category_counts)
+        return self._category_counts.as_dict()
+
+    @property
+    def last_downloads(self):
+        return list(self._last_downloads)
+
+    @property
+    def concurrency_level(self):
+        if self._concurrency is None:
+            return None
+        return self._concurrency.level
+
+    @property
+    def stage_metrics(self):
+        return self._threading_downloader.stage_metrics
+
+    @property
+    def interrupted(self):
+        return list(self._interrupted)
+
+    def restore(self, pairs):
+        # URLs interrupted by a cancellation were admitted to a batch before
+        for wn_id, url in pairs:
+            if wn_id not in self._category_counts:
+                self._category_counts[wn_id] = 0
+                self._changed_counts.add(wn_id)
+
+            if not self.is_satisfied(wn_id):
+                self._pending.append((wn_id, url))
+                self._pending_counts[wn_id] = \
+                    self._pending_counts.get(wn_id, 0) + 1
+
+    def take_changed_counts(self):
+        changed = {wn_id: self._category_counts[wn_id]
+                   for wn_id in self._changed_counts}
+        self._changed_counts = set()
+        return changed
 
     @property
     def file_index(self):
@@ -58,43 +123,134 @@ class BatchDownload:
     def batch_ready(self):
         return len(self._pending) >= self._batch_size
 
+    @property
+    def has_deferred(self):
+        return len(self._deferred) > 0
+
+    @property
+    def waiting(self):
+        # URLs taken from the source which are not downloaded yet
+        return list(self._pending) + list(self._deferred)
+
+    def has_enough_pending(self, wn_id):
+        # further URLs of the category would only be deferred
+        images_left = self._images_per_category - \
+            self._category_counts.get(wn_id, 0)
+        if images_left <= 0:
+            return False
+
+        pending = self._pending_counts.get(wn_id, 0)
+        return pending >= self._admission_limit(wn_id, images_left)
+
+    def is_satisfied(self, wn_id):
+        return self._category_counts.get(wn_id, 0) >= self._images_per_category
+
+    def priority(self, wn_id, url):
+        return self._scheduler.priority(wn_id, url)
+
     @property
     def complete(self):
+        if self._budget is not None and self._budget.exhausted:
+            return True
         return self._total_downloaded >= self._max_images
 
     @property
     def is_empty(self):
-        return len(self._pending) == 0
+        return len(self._pending) == 0 and not self.has_deferred
 
     def flush(self):
         paths = self._file_paths()
+        self._prioritize(paths)
         urls = self._url_batch()
 
+        if self._url_statuses is not None:
+            self._url_statuses.mark(self._pending,
+                                    self._url_statuses.in_flight)
+
+        self._batch_quota = BatchQuota(
+            categories=[wn_id for wn_id, _ in self._pending],
+            needed={wn_id: self._images_left(wn_id)
+                    for wn_id in self._pending_counts},
+            budget=self._budget
+        )
+
+        self._interrupted_urls = []
         failed_urls, succeeded_urls = self.do_download(urls, paths)
 
+        succeeded_urls = self._update_category_counts(failed_urls,
+                                                      succeeded_urls, paths)
+
         self._total_downloaded += len(succeeded_urls)
         if self._total_downloaded >= self._max_images:
             self.on_complete()
 
-        self._update_category_counts(succeeded_urls)
-
         self.on_fetched(failed_urls, succeeded_urls)
         self._clear_buffer()
+        self._add_deferred()
 
         return failed_urls, succeeded_urls
 
-    def _update_category_counts(self, succeeded_urls):
-        url_to_wn_id = {}
-        for wn_id, url in self._pending:
-            if wn_id not in url_to_wn_id:
-                if url not in url_to_wn_id:
-                    url_to_wn_id[url] = []
-                url_to_wn_id[url].append(wn_id)
-
+    def _update_category_counts(self, failed_urls, succeeded_urls, paths):
+        url_to_items = {}
+        for (wn_id, url), path in zip(self._pending, paths):
+            if url not in url_to_items:
+                url_to_items[url] = []
+            url_to_items[url].append((wn_id, path))
+
+        statuses = []
+        for url in failed_urls:
+            wn_id, _ = url_to_items[url].pop(0)
+            self._scheduler.update(wn_id, url, success=False)
+            statuses.append((wn_id, url, UrlStatusStore.failed,
+                             self._failure_reasons.get(url), None))
+
+        counted_urls = []
+        self._last_downloads = []
         for url in succeeded_urls:
-            wn_ids = url_to_wn_id[url]
-            for wn_id in wn_ids:
-                self._category_counts[wn_id] += 1
+            wn_id, path = url_to_items[url].pop(0)
+            self._scheduler.update(wn_id, url, success=True)
+
+            if self._category_counts[wn_id] < self._images_per_category:
+                self._category_counts.increment(wn_id)
+                self._changed_counts.add(wn_id)
+                counted_urls.append(url)
+                self._last_downloads.append((wn_id, url, path))
+                statuses.append((wn_id, url, UrlStatusStore.ok, None, path))
+            else:
+                if os.path.isfile(path):
+                    # surplus image finished after the quota had been met
+                    os.remove(path)
+                statuses.append((wn_id, url, UrlStatusStore.pending,
+                                 None, None))
+
+        # downloads cancelled by the batch quota were never made, the
+        # interrupted ones are kept to be downloaded later
+        interrupted_urls = set(self._interrupted_urls)
+        self._interrupted = []
+        for url, items in url_to_items.items():
+            for wn_id, _ in items:
+                if url in interrupted_urls:
+                    self._interrupted.append((wn_id, url))
+                statuses.append((wn_id, url, UrlStatusStore.pending,
+                                 None, None))
+
+        if self._url_statuses is not None:
+            self._finished_statuses.extend(statuses)
+
+        return counted_urls
+
+    def commit_statuses(self, statuses=None):
+        # called once the progress is saved, so a URL is never recorded as
+        # fetched while the saved state does not count it yet
+        if statuses is None:
+            statuses = self.take_statuses()
+        if self._url_statuses is not None and statuses:
+            self._url_statuses.record(statuses)
+
+    def take_statuses(self):
+        statuses = self._finished_statuses
+        self._finished_statuses = []
+        return statuses
 
     def _file_paths(self):
         paths = []
@@ -107,24 +263,188 @@ class BatchDownload:
             paths.append(path)
         return paths
 
+    def _prioritize(self, paths):
+        # file names are already assigned, only the order in which the
+        # downloads are started changes; likely good URLs go first so that
+        # the rest can be cancelled once their categories are complete
+        order = sorted(range(len(self._pending)),
+                       key=lambda i: -self.priority(*self._pending[i]))
+        self._pending[:] = [self._pending[i] for i in order]
+        paths[:] = [paths[i] for i in order]
+
     def _url_batch(self):
         return [url for _, url in self._pending]
 
     def _clear_buffer(self):
         self._pending[:] = []
+        self._pending_counts = {}
+
+    def _add_deferred(self):
+        deferred = self._deferred
+        self._deferred = []
+        for wn_id, url in deferred:
+            self.add(wn_id, url)
 
     def do_download(self, urls, destinations):
-        self._threading_downloader.download(urls, destinations)
+        self._threading_downloader.download(urls, destinations,
+                                            quota=self._batch_quota,
+                                            cancellation=self._cancellation)
         failed_urls = self._threading_downloader.failed_urls
         succeeded_urls = self._threading_downloader.downloaded_urls
+        self._failure_reasons = self._threading_downloader.failure_reasons
+        self._interrupted_urls = self._threading_downloader.interrupted_urls
+
+        # an interrupted batch says nothing about the network
+        if self._concurrency is not None and not self._interrupted_urls:
+            level = self._concurrency.update(self._threading_downloader.stats)
+            self._threading_downloader.set_concurrency(level)
         return failed_urls, succeeded_urls
 
     def add(self, wn_id, url):
         if wn_id not in self._category_counts:
             self._category_counts[wn_id] = 0
+            self._changed_counts.add(wn_id)
+
+        images_left = self._images_left(wn_id)
+        if images_left <= 0:
+            return
+
+        # e.g. the same URL listed twice in a category
+        if self._url_statuses is not None and \
+                self._url_statuses.is_fetched(wn_id, url):
+            return
 
-        if self._category_counts[wn_id] < self._images_per_category:
+        pending = self._pending_counts.get(wn_id, 0)
+        if pending < self._admission_limit(wn_id, images_left):
             self._pending.append((wn_id, url))
+            self._pending_counts[wn_id] = pending + 1
+        else:
+            # enough URLs of this category are pending already, keep the
+            # URL until the batch is flushed in case some of them fail
+            self._deferred.append((wn_id, url))
+
+    def _images_left(self, wn_id):
+        return self._images_per_category - self._category_counts[wn_id]
+
+    def _admission_limit(self, wn_id, images_left):
+        rate = self._scheduler.category_rate(wn_id)
+        return math.ceil(images_left / rate)
+
+
+class SuccessRate:
+    prior_weight = 10
+    min_rate = 0.1
+
+    def __init__(self, interner=None):
+        self._attempts = CountTable(interner=interner)
+        self._successes = CountTable(interner=interner)
+        self._total_attempts = 0
+        self._total_successes = 0
+
+    def update(self, key, success):
+        self._attempts.increment(key)
+        self._total_attempts += 1
+
+        if success:
+            self._successes.increment(key)
+            self._total_successes += 1
+
+    @property
+    def overall(self):
+        return (self._total_successes + 1) / (self._total_attempts + 2)
+
+    def attempts(self, key):
+        return self._attempts.get(key, 0)
+
+    def successes(self, key):
+        return self._successes.get(key, 0)
+
+    def estimate(self, key):
+        rate = (self.successes(key) + self.prior_weight * self.overall) / \
+               (self.attempts(key) + self.prior_weight)
+        return max(self.min_rate, rate)
+
+
+class UrlScheduler:
+    # Keeps success rates per category and per host. The priority of a URL
+    # combines both, assuming they are independent of each other. URLs of
+    # hosts which never answered come last, but are still tried.
+    dead_host_attempts = 10
+    dead_host_priority = 0.0
+
+    def __init__(self):
+        self._categories = SuccessRate()
+        # there are many more hosts than categories, their names are kept
+        # apart from the WordNet ids
+        self._hosts = SuccessRate(Interner())
+
+    def update(self, wn_id, url, success):
+        self._categories.update(wn_id, success)
+        self._hosts.update(self._host(url), success)
+
+    def category_rate(self, wn_id):
+        return self._categories.estimate(wn_id)
+
+    def priority(self, wn_id, url):
+        if self.is_dead(url):
+            return self.dead_host_priority
+
+        category_rate = self._categories.estimate(wn_id)
+        host_rate = self._hosts.estimate(self._host(url))
+        return min(1.0, category_rate * host_rate / self._hosts.overall)
+
+    def is_dead(self, url):
+        host = self._host(url)
+        return self._hosts.attempts(host) >= self.dead_host_attempts and \
+            self._hosts.successes(host) == 0
+
+    def _host(self, url):
+        try:
+            return urlparse(url).netloc.lower()
+        except ValueError:
+            return ''
+
+
+class BatchQuota:
+    def __init__(self, categories, needed, budget=None):
+        self._categories = categories
+        self._needed = needed
+        self._budget = budget
+        self._reserved = dict.fromkeys(needed, 0)
+        self._lock = threading.Lock()
+
+    def should_start(self, index):
+        if self._budget is not None and self._budget.exhausted:
+            return False
+
+        with self._lock:
+            return self._needed[self._categories[index]] > 0
+
+    def accept(self, index):
+        wn_id = self._categories[index]
+        with self._lock:
+            if self._needed[wn_id] - self._reserved[wn_id] <= 0:
+                return False
+            self._reserved[wn_id] += 1
+
+        # a leased budget may wait on the coordinator, the other workers
+        # keep checking the quota meanwhile
+        taken = self._budget is None or self._budget.take()
+
+        with self._lock:
+            self._reserved[wn_id] -= 1
+            if taken:
+                self._needed[wn_id] -= 1
+            return taken
+
+    def interrupts(self, index):
+        # an image refused while other workers hold the rest of the budget
+        # is still needed, it may be granted to this one later
+        if self._budget is None or not self._budget.withheld:
+            return False
+
+        with self._lock:
+            return self._needed[self._categories[index]] > 0
 
 
 class DownloadLocation:
@@ -0,0 +1,156 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import shutil
+import requests
+from config import config
+
+
+class CategorySelection:
+    kinds = ['all', 'list', 'ilsvrc2012', 'subtree']
+
+    def __init__(self, kind='all', word_net_ids=None, root=None):
+        if kind not in self.kinds:
+            raise ValueError('Unknown kind of selection "{}"'.format(kind))
+
+        self.kind = kind
+        self.word_net_ids = list(word_net_ids or [])
+        self.root = root
+
+    @staticmethod
+    def from_list(word_net_ids):
+        return CategorySelection(kind='list', word_net_ids=word_net_ids)
+
+    @staticmethod
+    def ilsvrc2012():
+        return CategorySelection(kind='ilsvrc2012')
+
+    @staticmethod
+    def subtree(root):
+        return CategorySelection(kind='subtree', root=root)
+
+    @property
+    def selects_all(self):
+        return self.kind == 'all'
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'word_net_ids': self.word_net_ids,
+            'root': self.root
+        }
+
+    @staticmethod
+    def from_dict(selection_dict):
+        return CategorySelection(kind=selection_dict['kind'],
+                                 word_net_ids=selection_dict['word_net_ids'],
+                                 root=selection_dict['root'])
+
+    def resolve(self):
+        if self.kind == 'all':
+            return None
+        elif self.kind == 'list':
+            return set(self.word_net_ids)
+        elif self.kind == 'ilsvrc2012':
+            return set(self._read_ilsvrc2012_ids())
+        else:
+            return set(self._fetch_hyponyms(self.root))
+
+    def _read_ilsvrc2012_ids(self):
+        path = config.ilsvrc2012_wn_ids_path
+        if not os.path.isfile(path):
+            os.makedirs(config.app_data_folder, exist_ok=True)
+            self._download_ilsvrc2012_ids(path)
+
+        return read_word_net_ids(path)
+
+    def _download_ilsvrc2012_ids(self, destination):
+        url = config.ilsvrc2012_wn_ids_url
+        try:
+            r = requests.get(url, timeout=config.synsets_timeout)
+            if r.status_code != requests.codes.ok:
+                raise Exception(r.status_code)
+
+            # {"0": ["n01440764", "tench"], ...}
+            index = r.json()
+            wn_ids = [index[str(i)][0] for i in range(len(index))]
+        except Exception as e:
+            raise CategoriesUnavailableError(
+                'Failed to fetch the list of ILSVRC-2012 WordNet ids: '
+                '{}'.format(e)
+            )
+
+        temp_path = destination + '.part'
+        with open(temp_path, 'w') as f:
+            f.write('\n'.join(wn_ids) + '\n')
+        os.replace(temp_path, destination)
+
+    def _fetch_hyponyms(self, root):
+        path = config.hyponyms_path(root)
+        if not os.path.isfile(path):
+            os.makedirs(config.app_data_folder, exist_ok=True)
+            self._download_hyponyms(root, path)
+
+        with open(path) as f:
+            for line in f:
+                wn_id = line.strip().lstrip('-')
+                if wn_id:
+                    yield wn_id
+
+    def _download_hyponyms(self, root, destination):
+        url = config.hyponyms_url(root)
+        try:
+            r = requests.get(url, timeout=config.synsets_timeout)
+            if r.status_code != requests.codes.ok:
+                raise Exception(r.status_code)
+        except Exception as e:
+            raise CategoriesUnavailableError(
+                'Failed to fetch the subtree of {}: {}'.format(root, e)
+            )
+
+        temp_path = destination + '.part'
+        with open(temp_path, 'w') as f:
+            f.write(r.text)
+        os.replace(temp_path, destination)
+
+
+def read_word_net_ids(path):
+    # both plain lists and LOC_synset_mapping.txt lines like
+    # "n01440764 tench, Tinca tinca" are accepted
+    with open(path) as f:
+        for line in f:
+            tokens = line.split()
+            if tokens:
+                yield tokens[0]
+
+
+def import_ilsvrc2012_ids(path):
+    # a local copy of the list is used instead of fetching it
+    if not os.path.isfile(path):
+        raise CategoriesUnavailableError(
+            'List of ILSVRC-2012 WordNet ids was not found at "{}"'.format(
+                path
+            )
+        )
+
+    os.makedirs(config.app_data_folder, exist_ok=True)
+    shutil.copyfile(path, config.ilsvrc2012_wn_ids_path)
+
+
+class CategoriesUnavailableError(Exception):
+    pass
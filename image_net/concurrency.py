@@ -0,0 +1,152 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+
+
+class ConcurrencyLimit:
+    # A semaphore whose size can be changed while downloads are running
+    def __init__(self, limit):
+        self._limit = limit
+        self._active = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def set_limit(self, limit):
+        with self._condition:
+            self._limit = limit
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= self._limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+
+class DownloadStats:
+    def __init__(self, images, failures, bytes_downloaded, seconds, latency):
+        self.images = images
+        self.failures = failures
+        self.bytes_downloaded = bytes_downloaded
+        self.seconds = seconds
+        self.latency = latency
+
+    @property
+    def images_per_second(self):
+        if self.seconds <= 0:
+            return 0
+        return self.images / self.seconds
+
+    @property
+    def bytes_per_second(self):
+        if self.seconds <= 0:
+            return 0
+        return self.bytes_downloaded / self.seconds
+
+    @property
+    def error_rate(self):
+        attempts = self.images + self.failures
+        if attempts == 0:
+            return 0
+        return self.failures / attempts
+
+
+class ConcurrencyController:
+    # Looks for the knee of the throughput curve: the smallest number of
+    # simultaneous downloads beyond which throughput stops growing.
+    #
+    # After every batch the level moves one step. It keeps its direction
+    # while throughput improves and turns back when throughput drops.
+    # On a plateau it goes down if latency has grown well above the lowest
+    # one seen: as in TCP Vegas, growing latency means that requests queue
+    # up somewhere and more of them only add to the queue. A jump in the
+    # error rate (usually timeouts) also makes it go down.
+    step = 1.25
+    tolerance = 0.05
+    queueing_threshold = 1.5
+    error_rate_jump = 0.1
+
+    def __init__(self, level, min_level, max_level):
+        self.min_level = max(1, min_level)
+        self.max_level = max(self.min_level, max_level)
+        self._level = self._clamp(level)
+        self._direction = 1
+        self._base_latency = None
+        self._previous = None
+
+    @property
+    def level(self):
+        return self._level
+
+    def update(self, stats):
+        if stats.images + stats.failures == 0 or stats.seconds <= 0:
+            return self._level
+
+        if stats.latency > 0:
+            if self._base_latency is None:
+                self._base_latency = stats.latency
+            self._base_latency = min(self._base_latency, stats.latency)
+
+        self._direction = self._next_direction(stats)
+        self._previous = stats
+
+        if self._direction > 0:
+            level = max(self._level + 1, round(self._level * self.step))
+        else:
+            level = min(self._level - 1, round(self._level / self.step))
+        self._level = self._clamp(level)
+        return self._level
+
+    def _next_direction(self, stats):
+        previous = self._previous
+        if previous is None:
+            return 1
+
+        if stats.error_rate > previous.error_rate + self.error_rate_jump:
+            return -1
+
+        old = previous.images_per_second
+        new = stats.images_per_second
+        if old == 0:
+            return 1
+
+        gain = new / old - 1
+        if gain > self.tolerance:
+            return self._direction
+        if gain < -self.tolerance:
+            return -self._direction
+
+        if self._queueing(stats):
+            return -1
+        return self._direction
+
+    def _queueing(self, stats):
+        if not self._base_latency or not stats.latency:
+            return False
+        return stats.latency > self._base_latency * self.queueing_threshold
+
+    def _clamp(self, level):
+        return max(self.min_level, min(self.max_level, level))
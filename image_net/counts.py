@@ -0,0 +1,128 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from array import array
+from collections.abc import MutableMapping
+
+
+class Interner:
+    # Gives every distinct name a small integer id, tables keyed by
+    # the ids are kept in arrays and share a single copy of every name
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+
+    def id(self, name):
+        i = self._ids.get(name)
+        if i is None:
+            i = len(self._names)
+            self._ids[name] = i
+            self._names.append(name)
+        return i
+
+    def find(self, name):
+        return self._ids.get(name)
+
+    def name(self, i):
+        return self._names[i]
+
+    def __len__(self):
+        return len(self._names)
+
+
+word_net_ids = Interner()
+
+
+class CountTable(MutableMapping):
+    # A dict of non-negative counts stored in an array indexed by the
+    # interned ids of the keys; a key which is not in the table has -1
+    missing = -1
+
+    def __init__(self, counts=None, interner=None):
+        if interner is None:
+            interner = word_net_ids
+        self._interner = interner
+        self._counts = array('i')
+        self._size = 0
+
+        if counts is not None:
+            self.update(counts)
+
+    def __getitem__(self, key):
+        value = self.get(key, self.missing)
+        if value == self.missing:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        i = self._interner.find(key)
+        if i is None or i >= len(self._counts):
+            return default
+
+        value = self._counts[i]
+        if value == self.missing:
+            return default
+        return value
+
+    def __setitem__(self, key, value):
+        i = self._interner.id(key)
+        self._reserve(i)
+        if self._counts[i] == self.missing:
+            self._size += 1
+        self._counts[i] = value
+
+    def __delitem__(self, key):
+        i = self._interner.find(key)
+        if i is None or i >= len(self._counts) or \
+                self._counts[i] == self.missing:
+            raise KeyError(key)
+
+        self._counts[i] = self.missing
+        self._size -= 1
+
+    def increment(self, key, amount=1):
+        i = self._interner.id(key)
+        self._reserve(i)
+        if self._counts[i] == self.missing:
+            self._size += 1
+            self._counts[i] = 0
+        self._counts[i] += amount
+
+    def _reserve(self, i):
+        # grows by doubling, so that adding keys one by one stays linear
+        size = len(self._counts)
+        if i >= size:
+            grow = max(i + 1, 2 * size) - size
+            self._counts.extend(array('i', [self.missing]) * grow)
+
+    def __iter__(self):
+        name = self._interner.name
+        for i, value in enumerate(self._counts):
+            if value != self.missing:
+                yield name(i)
+
+    def __len__(self):
+        return self._size
+
+    def copy(self):
+        table = CountTable(interner=self._interner)
+        table._counts = array('i', self._counts)
+        table._size = self._size
+        return table
+
+    def as_dict(self):
+        return dict(self.items())
@@ -0,0 +1,490 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from config import config
+from image_net import iterators
+from image_net.stateful_downloader import StatefulDownloader, \
+    NotConfiguredError
+from util.app_state import AppState, DownloadConfiguration, InternalState, \
+    Result
+
+
+class Coordinator:
+    # Hands out work units to workers on other machines over HTTP. A unit
+    # is a share of categories, the same as in a sharded download. Workers
+    # hold a unit under a lease which they renew with every report; units
+    # of workers that stopped reporting go back to the pool once their
+    # lease expires. Reports carry the unit's internal state, so another
+    # worker continues where the previous one stopped. Requests are not
+    # authenticated, so only local workers are served unless another
+    # host is given.
+    def __init__(self, app_state, units=None, lease_timeout=None,
+                 host='127.0.0.1', port=None):
+        if not app_state.configured:
+            raise NotConfiguredError()
+
+        self._app_state = app_state
+        self._lease_timeout = lease_timeout or config.lease_timeout
+        self._lock = threading.Lock()
+        self._leases = {}
+
+        # a new download drops units and the manifest of an earlier one
+        self._app_state.save()
+
+        self._units = self._load_units()
+        if self._units is None:
+            self._units = [WorkUnit(index)
+                           for index in range(units or config.work_units)]
+
+        if port is None:
+            port = config.coordinator_port
+        self._server = ThreadingHTTPServer((host, port), CoordinatorHandler)
+        self._server.coordinator = self
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        # workers of a new download must find the URL lists ready
+        iterators.create_image_net_urls().prepare()
+        self._app_state.download_configuration.categories.resolve()
+
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    @property
+    def done(self):
+        with self._lock:
+            return self._is_done()
+
+    def _is_done(self):
+        if self._leases:
+            return False
+
+        return self._budget_left() <= 0 or \
+            all(unit.finished for unit in self._units)
+
+    def lease(self, request):
+        with self._lock:
+            self._expire_leases()
+
+            if self._is_done():
+                return {'done': True}
+
+            leased = set(lease.unit for lease in self._leases.values())
+            free_units = [unit for unit in self._units
+                          if not unit.finished and unit.index not in leased]
+            if not free_units or self._budget_left() <= 0:
+                return {'done': False}
+
+            unit = free_units[0]
+            lease = Lease(unit=unit.index, worker=request['worker'],
+                          deadline=time.time() + self._lease_timeout)
+            self._leases[lease.lease_id] = lease
+
+            conf = self._app_state.download_configuration
+            return {
+                'done': False,
+                'lease_id': lease.lease_id,
+                'lease_timeout': self._lease_timeout,
+                'unit': unit.as_dict(),
+                'units': len(self._units),
+                'configuration': conf.as_dict()
+            }
+
+    def heartbeat(self, request):
+        with self._lock:
+            lease = self._valid_lease(request['lease_id'])
+            return {'ok': lease is not None}
+
+    def grant(self, request):
+        with self._lock:
+            lease = self._valid_lease(request['lease_id'])
+            if lease is None:
+                return {'ok': False, 'granted': 0}
+
+            granted = max(0, min(request['wanted'], self._budget_left()))
+            lease.granted += granted
+
+            # images granted to other workers come back if they are not
+            # downloaded, so the budget is not exhausted for good yet
+            held = sum(other.granted for other in self._leases.values()
+                       if other is not lease)
+            return {'ok': True, 'granted': granted,
+                    'withheld': granted == 0 and held > 0}
+
+    def report(self, request):
+        with self._lock:
+            lease = self._valid_lease(request['lease_id'])
+            if lease is None:
+                return {'ok': False}
+
+            downloads = request['downloads']
+            failed_urls = request['failed_urls']
+
+            unit = self._units[lease.unit]
+            unit.internal_state = request['internal_state']
+            unit.downloaded += len(downloads)
+            unit.failed += len(failed_urls)
+            lease.granted = max(0, lease.granted - len(downloads))
+
+            result = Result(failed_urls=failed_urls,
+                            succeeded_urls=[url for _, url, _ in downloads])
+            self._app_state.update_progress(result)
+            self._append_manifest(lease.worker, downloads)
+            self._save()
+            return {'ok': True}
+
+    def complete(self, request):
+        with self._lock:
+            lease = self._valid_lease(request['lease_id'])
+            if lease is None:
+                return {'ok': False}
+
+            self._units[lease.unit].finished = request['finished']
+            del self._leases[lease.lease_id]
+
+            if self._is_done():
+                self._app_state.mark_finished()
+            self._save()
+            return {'ok': True}
+
+    def status(self, request=None):
+        with self._lock:
+            progress_info = self._app_state.progress_info
+            return {
+                'downloaded': progress_info.total_downloaded,
+                'failed': progress_info.total_failed,
+                'units': len(self._units),
+                'finished_units': sum(unit.finished for unit in self._units),
+                'leases': [lease.as_dict() for lease in self._leases.values()],
+                'done': self._is_done()
+            }
+
+    def _valid_lease(self, lease_id):
+        self._expire_leases()
+        lease = self._leases.get(lease_id)
+        if lease is not None:
+            lease.deadline = time.time() + self._lease_timeout
+        return lease
+
+    def _expire_leases(self):
+        now = time.time()
+        for lease_id, lease in list(self._leases.items()):
+            if lease.deadline < now:
+                # images granted to the lease but not reported are
+                # returned to the budget together with the unit
+                del self._leases[lease_id]
+
+    def _budget_left(self):
+        conf = self._app_state.download_configuration
+        granted = sum(lease.granted for lease in self._leases.values())
+        return conf.number_of_images - \
+            self._app_state.progress_info.total_downloaded - granted
+
+    def _append_manifest(self, worker, downloads):
+        with open(config.manifest_path, 'a') as f:
+            for wn_id, url, path in downloads:
+                f.write('\t'.join([worker, wn_id, url, path]) + '\n')
+
+    def _save(self):
+        self._app_state.checkpoint()
+
+        path = config.coordinator_state_path
+        temp_path = path + '.part'
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps([unit.as_dict() for unit in self._units]))
+        os.replace(temp_path, path)
+
+    def _load_units(self):
+        path = config.coordinator_state_path
+        if not os.path.isfile(path):
+            return None
+
+        with open(path) as f:
+            return [WorkUnit.from_dict(d) for d in json.loads(f.read())]
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    routes = {
+        '/lease': 'lease',
+        '/heartbeat': 'heartbeat',
+        '/grant': 'grant',
+        '/report': 'report',
+        '/complete': 'complete',
+        '/status': 'status'
+    }
+
+    def do_GET(self):
+        if self.path != '/status':
+            self.send_error(404)
+            return
+        self._respond(self.server.coordinator.status())
+
+    def do_POST(self):
+        name = self.routes.get(self.path)
+        if name is None:
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            response = getattr(self.server.coordinator, name)(request)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, str(e))
+            return
+        self._respond(response)
+
+    def _respond(self, response):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WorkUnit:
+    def __init__(self, index, internal_state=None, downloaded=0, failed=0,
+                 finished=False):
+        self.index = index
+        self.internal_state = internal_state
+        self.downloaded = downloaded
+        self.failed = failed
+        self.finished = finished
+
+    def as_dict(self):
+        return {
+            'index': self.index,
+            'internal_state': self.internal_state,
+            'downloaded': self.downloaded,
+            'failed': self.failed,
+            'finished': self.finished
+        }
+
+    @staticmethod
+    def from_dict(unit_dict):
+        return WorkUnit(**unit_dict)
+
+
+class Lease:
+    def __init__(self, unit, worker, deadline):
+        self.lease_id = uuid.uuid4().hex
+        self.unit = unit
+        self.worker = worker
+        self.deadline = deadline
+        self.granted = 0
+
+    def as_dict(self):
+        return {
+            'lease_id': self.lease_id,
+            'unit': self.unit,
+            'worker': self.worker,
+            'expires_in': max(0.0, self.deadline - time.time())
+        }
+
+
+class CoordinatorClient:
+    timeout = 30
+
+    def __init__(self, address):
+        self._address = address.rstrip('/')
+
+    def call(self, name, **request):
+        r = requests.post('{}/{}'.format(self._address, name),
+                          data=json.dumps(request), timeout=self.timeout)
+        if r.status_code != requests.codes.ok:
+            raise CoordinatorUnavailableError(
+                'Coordinator answered {} to {}'.format(r.status_code, name)
+            )
+        return r.json()
+
+
+class LeasedBudget:
+    # Images are granted by the coordinator a chunk at a time, so that
+    # asking for them does not take a request per image.
+    def __init__(self, client, lease_id, chunk):
+        self._client = client
+        self._lease_id = lease_id
+        self._chunk = chunk
+        self._allowance = 0
+        self._exhausted = False
+        self._withheld = False
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            if self._allowance == 0 and not self._exhausted:
+                response = self._client.call('grant', lease_id=self._lease_id,
+                                             wanted=self._chunk)
+                self._allowance = response['granted']
+                self._exhausted = self._allowance == 0
+                self._withheld = response.get('withheld', False)
+
+            if self._allowance > 0:
+                self._allowance -= 1
+                return True
+            return False
+
+    @property
+    def exhausted(self):
+        return self._exhausted
+
+    @property
+    def withheld(self):
+        return self._exhausted and self._withheld
+
+
+class DistributedWorker:
+    retry_interval = 2
+
+    def __init__(self, coordinator_address, name, download_destination):
+        self._client = CoordinatorClient(coordinator_address)
+        self._name = name
+        self._destination = download_destination
+
+    def run(self):
+        while True:
+            response = self._client.call('lease', worker=self._name)
+            if response['done']:
+                return
+
+            if 'lease_id' not in response:
+                # every unit is held by other workers, one of them might die
+                time.sleep(self.retry_interval)
+                continue
+
+            self._work_on(response)
+
+    def _work_on(self, lease):
+        lease_id = lease['lease_id']
+        unit = WorkUnit.from_dict(lease['unit'])
+        app_state = self._unit_state(unit, lease['configuration'])
+
+        budget = LeasedBudget(self._client, lease_id,
+                              chunk=app_state.download_configuration.batch_size)
+        downloader = StatefulDownloader(app_state,
+                                        shard=(unit.index, lease['units']),
+                                        budget=budget)
+
+        heartbeat = Heartbeat(self._client, lease_id,
+                              interval=lease['lease_timeout'] / 3.0)
+        heartbeat.start()
+        try:
+            for result in downloader:
+                downloads = [
+                    (wn_id, url, os.path.relpath(path, self._destination))
+                    for wn_id, url, path in downloader.last_downloads
+                ]
+                response = self._client.call(
+                    'report', lease_id=lease_id,
+                    internal_state=app_state.internal_state.as_dict(),
+                    downloads=downloads,
+                    failed_urls=result.failed_urls
+                )
+                if not response['ok']:
+                    # the lease has expired, the unit belongs to another
+                    # worker now. It downloads this batch again from the
+                    # last reported state, its images granted to this lease
+                    # went back to the budget and they are not listed in
+                    # the manifest, so they are dropped
+                    self._remove(downloader.last_downloads)
+                    return
+        finally:
+            heartbeat.stop()
+
+        self._client.call('complete', lease_id=lease_id,
+                          finished=not budget.exhausted)
+
+    def _remove(self, downloads):
+        for wn_id, url, path in downloads:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _unit_state(self, unit, conf_dict):
+        # the coordinator's copy of the unit state is the one to follow,
+        # the local one may be older or belong to another download
+        conf = DownloadConfiguration.from_dict(conf_dict)
+        conf.download_destination = self._destination
+
+        app_state = AppState(config.unit_state_path(unit.index))
+        app_state.set_configuration(conf)
+        if unit.internal_state is None:
+            app_state.internal_state.file_index = unit.index + 1
+        else:
+            app_state.set_internal_state(
+                InternalState.from_dict(unit.internal_state)
+            )
+        app_state.progress_info.total_downloaded = unit.downloaded
+        app_state.progress_info.total_failed = unit.failed
+        app_state.save()
+        return app_state
+
+
+class Heartbeat:
+    def __init__(self, client, lease_id, interval):
+        self._client = client
+        self._lease_id = lease_id
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._client.call('heartbeat', lease_id=self._lease_id)
+            except Exception:
+                # a missed heartbeat is made up by the next one
+                pass
+
+
+def run_worker(coordinator_address, name, download_destination):
+    DistributedWorker(coordinator_address, name, download_destination).run()
+
+
+class CoordinatorUnavailableError(Exception): pass
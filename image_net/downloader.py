@@ -16,42 +16,72 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import requests
-import shutil
 import os
+import threading
+import time
 from PIL import Image
 from config import config
+from image_net import metrics, tracing
+from image_net.concurrency import ConcurrencyLimit, DownloadStats
+from image_net.pipeline import Pipeline, Stage, StageMetrics
 
 
 class FileDownloader:
-    timeout = config.file_download_timeout
+    chunk_size = 64 * 1024
+
+    @property
+    def timeout(self):
+        return config.file_download_timeout
 
     def __init__(self, destination):
         self.destination = destination
+        self.failure_reason = None
 
-    def download(self, url):
+    def download(self, url, cancellation=None):
+        # returns None when the download is cancelled; the cancellation
+        # is checked between reads, so it takes effect within one read
         file_path = self.destination
         try:
-            r = requests.get(url, stream=True, timeout=self.timeout)
-            code = r.status_code
-            if code == requests.codes.ok:
-                with open(file_path, 'wb') as f:
-                    r.raw.decode_content = True
-                    shutil.copyfileobj(r.raw, f)
+            with tracing.traced_session() as session, \
+                    session.get(url, stream=True, timeout=self.timeout) as r:
+                tracing.mark('first_byte')
+                code = r.status_code
+                if code != requests.codes.ok:
+                    print('Bad code {}. Url {}'.format(code, url))
+                    self.failure_reason = 'HTTP {}'.format(code)
+                    return False
 
-                return True
-            else:
-                print('Bad code {}. Url {}'.format(code, url))
-                return False
+                with open(file_path, 'wb') as f:
+                    for chunk in r.iter_content(self.chunk_size):
+                        if cancellation is not None and cancellation.is_set():
+                            break
+                        f.write(chunk)
+                    else:
+                        tracing.mark('body')
+                        return True
+
+            self._remove_partial_file()
+            return None
         except Exception as e:
             print('Failed downloaing {}'.format(url))
+            self.failure_reason = '{}: {}'.format(type(e).__name__, e)
+            self._remove_partial_file()
             return False
 
+    def _remove_partial_file(self):
+        if os.path.isfile(self.destination):
+            os.remove(self.destination)
+
 
 class DummyDownloader:
     def __init__(self, destination):
         self.destination = destination
+        self.failure_reason = None
+
+    def download(self, url, cancellation=None):
+        if cancellation is not None and cancellation.is_set():
+            return None
 
-    def download(self, url):
         file_path = self.destination
         with open(file_path, 'w') as f:
             f.write('Dummy downloader written file')
@@ -76,41 +106,242 @@ class DummyValidator:
         return self._count % 2
 
 
+class DownloadTask:
+    __slots__ = ('index', 'url', 'path', 'temp_path', 'result', 'trace')
+
+    def __init__(self, index, url, path):
+        self.index = index
+        self.url = url
+        self.path = path
+        # the file is only given its name once it has passed validation
+        self.temp_path = path + '.part'
+        self.result = None
+        self.trace = None
+
+
 class ThreadingDownloader:
-    pool = config.pool_executor
+    # Each URL goes through three stages: fetch writes the response to
+    # a temporary file, validate checks the image and sink gives the
+    # file its name. The stages are connected by bounded queues, so
+    # fetching stops when validation or writing falls behind.
+    interrupted = 'interrupted'
+
+    @property
+    def pool(self):
+        return config.pool_executor
+
+    @property
+    def tracer(self):
+        return tracing.default_tracer
 
     def __init__(self):
         self.downloaded_urls = []
         self.failed_urls = []
+        self.cancelled_urls = []
+        self.interrupted_urls = []
+        self.failure_reasons = {}
+        self.stats = None
+        self._limit = None
+        self._latencies = []
+        self._bytes_downloaded = 0
+        self._bytes_lock = threading.Lock()
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+        self.fetch_metrics = StageMetrics('fetch')
+        self.validate_metrics = StageMetrics('validate')
+        self.sink_metrics = StageMetrics('sink')
+
+    @property
+    def stage_metrics(self):
+        return [self.fetch_metrics, self.validate_metrics, self.sink_metrics]
+
+    @property
+    def latencies(self):
+        # seconds taken by every finished request of the last download
+        return list(self._latencies)
+
+    def set_concurrency(self, level):
+        if self._limit is None:
+            self._limit = ConcurrencyLimit(level)
+        else:
+            self._limit.set_limit(level)
 
-    def download(self, urls, destinations):
+    def download(self, urls, destinations, quota=None, cancellation=None):
+        # URLs cancelled by the quota are not needed any more, while the
+        # interrupted ones were stopped by the cancellation and are still
+        # to be downloaded
         self.downloaded_urls = []
         self.failed_urls = []
+        self.cancelled_urls = []
+        self.interrupted_urls = []
+        self.failure_reasons = {}
+        self._latencies = []
+        self._bytes_downloaded = 0
+
+        started = time.perf_counter()
+        tasks = [DownloadTask(index, url, path) for index, (url, path)
+                 in enumerate(zip(urls, destinations))]
+
+        pipeline = self._create_pipeline(quota)
+        pipeline.start()
+        try:
+            self._fetch_all(tasks, pipeline, quota, cancellation)
+        finally:
+            pipeline.close()
+
+        for task in tasks:
+            if task.result is self.interrupted:
+                self.interrupted_urls.append(task.url)
+            elif task.result is None:
+                self.cancelled_urls.append(task.url)
+            elif task.result:
+                self.downloaded_urls.append(task.url)
+            else:
+                self.failed_urls.append(task.url)
 
-        args = zip(urls, destinations)
+        seconds = time.perf_counter() - started
+        if self._limit is None:
+            self.fetch_metrics.workers = max(1, min(config.max_workers,
+                                                    len(tasks)))
+        else:
+            self.fetch_metrics.workers = self._limit.limit
+        self.fetch_metrics.add_active_time(seconds)
+
+        self.stats = DownloadStats(
+            images=len(self.downloaded_urls),
+            failures=len(self.failed_urls),
+            bytes_downloaded=self._bytes_downloaded,
+            seconds=seconds,
+            latency=self._median_latency()
+        )
+        # the phases of this download are added to the histograms once
+        # it has ended
+        self.tracer.collect()
+
+    def _create_pipeline(self, quota):
+        return Pipeline([
+            Stage('validate', self._validate,
+                  workers=config.validate_workers,
+                  queue_size=config.stage_queue_size,
+                  metrics=self.validate_metrics),
+            Stage('sink', lambda task: self._sink(task, quota),
+                  workers=config.sink_workers,
+                  queue_size=config.stage_queue_size,
+                  metrics=self.sink_metrics)
+        ])
+
+    def _fetch_all(self, tasks, pipeline, quota, cancellation):
+        self._waiting = len(tasks)
         pool = self.pool
-        results = list(pool.map(self._download, args))
 
-        for url, success in zip(urls, results):
-            if success:
-                self.downloaded_urls.append(url)
+        def fetch(task):
+            self._fetch(task, pipeline, quota, cancellation)
+
+        if self._limit is None:
+            list(pool.map(fetch, tasks))
+            return
+
+        # tasks are only submitted when there is a free slot, so the pool
+        # does not start more threads than the current level
+        futures = []
+        for task in tasks:
+            self._limit.acquire()
+            future = pool.submit(fetch, task)
+            future.add_done_callback(lambda f: self._limit.release())
+            futures.append(future)
+
+        for future in futures:
+            future.result()
+
+    def _median_latency(self):
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return 0
+        return latencies[len(latencies) // 2]
+
+    def _fetch(self, task, pipeline, quota=None, cancellation=None):
+        with self._waiting_lock:
+            self.fetch_metrics.observe_queue(self._waiting)
+            self._waiting -= 1
+
+        if cancellation is not None and cancellation.is_set():
+            task.result = self.interrupted
+            metrics.image_requests.inc(1, 'interrupted')
+            return
+
+        # the category might have got enough images while this one waited
+        if quota is not None and not quota.should_start(task.index):
+            if quota.interrupts(task.index):
+                task.result = self.interrupted
+                metrics.image_requests.inc(1, 'interrupted')
             else:
-                self.failed_urls.append(url)
+                metrics.image_requests.inc(1, 'skipped')
+            return
 
-    def _download(self, args):
-        image_url, file_path = args
-        downloader = self.get_file_downloader(destination=file_path)
-        success = downloader.download(image_url)
+        downloader = self.get_file_downloader(destination=task.temp_path)
+        metrics.in_flight.inc()
+        started = time.perf_counter()
+        task.trace = self.tracer.start(task.url)
+        try:
+            success = downloader.download(task.url, cancellation)
+        finally:
+            tracing.activate(None)
+            metrics.in_flight.dec()
+        seconds = time.perf_counter() - started
+        self.fetch_metrics.record(seconds)
+        if success is None:
+            task.result = self.interrupted
+            metrics.image_requests.inc(1, 'interrupted')
+            return
+        self._latencies.append(seconds)
 
-        validator = self.get_validator()
         if success:
-            if validator.valid_image(file_path):
-                return True
-            else:
-                os.remove(file_path)
-                return False
+            # waits while the next stages are full
+            pipeline.put(task)
         else:
-            return False
+            self.failure_reasons[task.url] = downloader.failure_reason
+            task.result = False
+            metrics.image_requests.inc(1, 'failed')
+            self.tracer.finish(task.trace)
+
+    def _validate(self, task):
+        validator = self.get_validator()
+        started = time.perf_counter()
+        valid = validator.valid_image(task.temp_path)
+        task.trace.add('validate', started)
+        if valid:
+            return True
+
+        os.remove(task.temp_path)
+        self.failure_reasons[task.url] = 'Invalid image'
+        task.result = False
+        metrics.image_requests.inc(1, 'invalid')
+        self.tracer.finish(task.trace)
+        return False
+
+    def _sink(self, task, quota=None):
+        if quota is not None and not quota.accept(task.index):
+            os.remove(task.temp_path)
+            if quota.interrupts(task.index):
+                task.result = self.interrupted
+                metrics.image_requests.inc(1, 'interrupted')
+            else:
+                metrics.image_requests.inc(1, 'surplus')
+            self.tracer.finish(task.trace)
+            return
+
+        started = time.perf_counter()
+        os.replace(task.temp_path, task.path)
+        task.trace.add('write', started)
+        self._count_bytes(os.path.getsize(task.path))
+        task.result = True
+        metrics.image_requests.inc(1, 'ok')
+        self.tracer.finish(task.trace)
+
+    def _count_bytes(self, size):
+        with self._bytes_lock:
+            self._bytes_downloaded += size
+        metrics.bytes_downloaded.inc(size)
 
     def get_file_downloader(self, destination):
         return FileDownloader(destination=destination)
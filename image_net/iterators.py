@@ -19,7 +19,14 @@ import requests
 import shutil
 import os
 import json
+import bisect
+from array import array
+from collections import deque
 from config import config
+from image_net.url_store import SynsetUrlStore
+from image_net.prefetch import SynsetPrefetcher
+from image_net.url_dump import UrlDumpImporter
+from image_net.sampling import Sampling, IndexPermutation
 
 
 def read_by_lines(file_path):
@@ -29,6 +36,8 @@ def read_by_lines(file_path):
 
 
 class Position:
+    __slots__ = ('word_id_offset', 'url_offset')
+
     @staticmethod
     def null_position():
         return Position(-1, -1)
@@ -74,12 +83,72 @@ class Position:
 
 
 class ImageNetUrls:
-    def __init__(self, start_after_position=None):
+    def __init__(self, start_after_position=None, word_net_ids=None,
+                 skip_category=None, interleave=1, cursors=None,
+                 sampling=None, sample_offset=-1, priority=None,
+                 shard=None, on_wait=None, defer_category=None,
+                 cancellation=None, sample_sizes=None):
         if start_after_position is None:
             self._start_after_position = Position.null_position()
         else:
             self._start_after_position = start_after_position
 
+        self._interleave = max(1, interleave)
+
+        # the frontier is the most recently opened category, cursors are
+        # other categories which were opened before it but not finished
+        self._frontier = self._copy(self._start_after_position)
+        self._cursors = {}
+        for position in cursors or []:
+            self._cursors[position.word_id_offset] = self._copy(position)
+
+        self._selected_ids = word_net_ids
+
+        if sampling is None:
+            sampling = Sampling()
+        self._sampling = sampling
+
+        # index of the last acknowledged draw of a uniform sample
+        self._sample_offset = sample_offset
+        self._draws = deque()
+        # number of URLs of every selected category the sample was drawn
+        # from, a list which failed to be fetched counts as empty
+        if sample_sizes is not None:
+            sample_sizes = array('q', sample_sizes)
+        self._sample_sizes = sample_sizes
+
+        if skip_category is None:
+            self._skip_category = lambda wn_id: False
+        else:
+            self._skip_category = skip_category
+
+        self._priority = priority
+
+        # a category is set aside while the batch holds enough of its URLs
+        if defer_category is None:
+            self._defer_category = lambda wn_id: False
+        else:
+            self._defer_category = defer_category
+
+        # called before waiting for a list of URLs which is not fetched yet
+        if on_wait is None:
+            self._on_wait = lambda: None
+        else:
+            self._on_wait = on_wait
+
+        # a pause stops fetching lists of URLs, the iteration ends early
+        self._cancellation = cancellation
+
+        # (index, count) of the worker process, categories are dealt to
+        # the workers by their offset in the list of WordNet ids
+        if shard is None:
+            shard = (0, 1)
+        self._shard_index, self._shard_count = shard
+
+        self._active = set()
+        self._failed_word_net_ids = {}
+        self._url_store = None
+
     def fetch_wordnet_ids(self):
         destination = config.wn_ids_path
 
@@ -92,13 +161,55 @@ class ImageNetUrls:
                 raise WordNetIdsUnavailableError()
 
     def fetch_url_list(self, word_net_id):
-        destination = config.synset_urls_path(word_net_id)
-        if self._file_is_missing(destination):
-            url = config.synset_download_url(word_net_id=word_net_id)
-            try:
-                self._download_list(url, destination, config.synsets_timeout)
-            except:
-                raise SynsetUrlsUnavailableError()
+        if word_net_id in self.url_store:
+            return
+
+        if self._import_legacy_list(word_net_id):
+            return
+
+        url = config.synset_download_url(word_net_id=word_net_id)
+        try:
+            urls = self._download_url_list(url, config.synsets_timeout)
+        except Exception as e:
+            raise SynsetUrlsUnavailableError(str(e))
+
+        self.url_store.add(word_net_id, urls)
+
+    @property
+    def url_store(self):
+        if self._url_store is None:
+            self._url_store = SynsetUrlStore.shared(self._url_store_path())
+        return self._url_store
+
+    def _url_store_path(self):
+        # the store is not safe for writing from several processes,
+        # so every worker fetches the lists of its categories on its own
+        if self._shard_count > 1:
+            return config.shard_urls_store_path(self._shard_index)
+        return config.synset_urls_store_path
+
+    def prepare(self):
+        self._create_storage_directory()
+        self.fetch_wordnet_ids()
+
+    def _import_legacy_list(self, word_net_id):
+        # lists fetched by earlier versions were kept in separate files
+        path = config.synset_urls_path(word_net_id)
+        if self._file_is_missing(path):
+            return False
+
+        self.url_store.add(word_net_id, read_by_lines(path))
+        os.remove(path)
+        return True
+
+    def _download_url_list(self, url, timeout):
+        r = requests.get(url, stream=True, timeout=timeout)
+        code = r.status_code
+        if code != requests.codes.ok:
+            raise Exception(code)
+
+        return [line.decode('utf-8', errors='replace')
+                for line in r.iter_lines()]
 
     def _file_is_missing(self, path):
         return not os.path.isfile(path)
@@ -110,70 +221,368 @@ class ImageNetUrls:
         if code != requests.codes.ok:
             raise Exception(code)
 
-        with open(destination, 'wb') as f:
+        temp_path = destination + '.part'
+        with open(temp_path, 'wb') as f:
             r.raw.decode_content = True
             shutil.copyfileobj(r.raw, f)
 
+        os.replace(temp_path, destination)
+
     def _create_storage_directory(self):
         os.makedirs(config.app_data_folder, exist_ok=True)
 
     def __iter__(self):
-        self._create_storage_directory()
-        self.fetch_wordnet_ids()
+        self.prepare()
+
+        if self._sampling.is_uniform:
+            yield from self._sample_uniformly()
+        else:
+            yield from self._interleave_categories()
 
+    def _interleave_categories(self):
+        url_store = self.url_store
         word_net_ids = read_by_lines(config.wn_ids_path)
 
-        position = Position(0, 0)
-        for wn_id in word_net_ids:
-            if position.word_id_offset < self._start_after_position.word_id_offset:
-                position.next_id()
+        start_after = self._start_after_position
+        resumed = dict(self._cursors)
+
+        categories = ((word_id_offset, wn_id)
+                      for word_id_offset, wn_id in enumerate(word_net_ids)
+                      if (word_id_offset >= start_after.word_id_offset or
+                          word_id_offset in resumed) and
+                      self._in_shard(word_id_offset) and
+                      self._is_selected(wn_id) and
+                      not self._skip_category(wn_id))
+
+        # if we failed to fetch file with urls for synset,
+        # the prefetcher records it and continues with next WordNet id
+        prefetcher = SynsetPrefetcher(self.fetch_url_list, categories,
+                                      depth=config.synsets_prefetch,
+                                      on_wait=self._on_wait,
+                                      cancellation=self._cancellation)
+        self._failed_word_net_ids = prefetcher.failures
+
+        opened = iter(prefetcher)
+        active = deque()
+        # set aside categories stay open and are continued once the batch
+        # has been downloaded, meanwhile other categories fill it
+        deferred = []
+        waited = False
+
+        try:
+            while True:
+                if deferred and len(active) < self._interleave:
+                    deferred = self._resume_deferred(active, deferred)
+
+                while len(active) < self._interleave:
+                    category = next(opened, None)
+                    if category is None:
+                        break
+                    active.append(self._open(category, resumed, url_store))
+
+                if not active:
+                    if not deferred:
+                        break
+
+                    # only set aside categories are left
+                    self._on_wait()
+                    active.extend(deferred[:self._interleave])
+                    deferred = deferred[self._interleave:]
+                    waited = True
+
+                cursor = self._next_cursor(active)
+
+                # the rest of the category is not needed anymore,
+                # the position of the last yielded URL stays valid
+                if self._skip_category(cursor.wn_id):
+                    self._close(cursor)
+                    continue
+
+                # right after a wait one URL is taken in any case, so the
+                # iteration goes on even if the batch was not downloaded
+                if not waited and self._defer_category(cursor.wn_id):
+                    deferred.append(cursor)
+                    continue
+                waited = False
+
+                item = cursor.advance()
+                if item is None:
+                    self._close(cursor)
+                    continue
+
+                url_offset, url = item
+                active.append(cursor)
+
+                yield (cursor.wn_id, url,
+                       Position(cursor.word_id_offset, url_offset))
+        finally:
+            prefetcher.close()
+
+    def _resume_deferred(self, active, deferred):
+        still_deferred = []
+        for cursor in deferred:
+            if len(active) < self._interleave and \
+                    not self._defer_category(cursor.wn_id):
+                active.append(cursor)
+            else:
+                still_deferred.append(cursor)
+        return still_deferred
+
+    def _next_cursor(self, active):
+        if self._priority is None:
+            return active.popleft()
+
+        # the first of equally good categories is taken, so without any
+        # statistics categories are still visited round-robin
+        best = max(range(len(active)),
+                   key=lambda i: self._cursor_priority(active[i]))
+        cursor = active[best]
+        del active[best]
+        return cursor
+
+    def _cursor_priority(self, cursor):
+        if cursor.head is None:
+            # finished categories are closed right away
+            return float('inf')
+
+        url_offset, url = cursor.head
+        return self._priority(cursor.wn_id, url)
+
+    def _open(self, category, resumed, url_store):
+        word_id_offset, wn_id = category
+
+        if word_id_offset in resumed:
+            first_url = resumed[word_id_offset].url_offset + 1
+        elif word_id_offset == self._start_after_position.word_id_offset:
+            first_url = self._start_after_position.url_offset + 1
+        else:
+            first_url = 0
+
+            frontier = self._frontier.word_id_offset
+            if frontier in self._active:
+                self._cursors[frontier] = self._frontier
+            self._frontier = Position(word_id_offset, -1)
+
+        # resumed categories which were passed over are finished
+        for offset in list(self._cursors):
+            if offset < word_id_offset and offset not in self._active:
+                del self._cursors[offset]
+
+        self._active.add(word_id_offset)
+        if self._sampling.is_stratified:
+            urls = self._shuffled_urls(wn_id, url_store, first_url)
+        else:
+            urls = url_store.urls(wn_id, start=first_url)
+        return CategoryCursor(word_id_offset, wn_id,
+                              enumerate(urls, first_url))
+
+    def _shuffled_urls(self, wn_id, url_store, start):
+        # a single category is small enough to be kept in memory, its
+        # order only depends on the seed and the WordNet id, so url
+        # offsets stay valid across restarts
+        urls = list(url_store.urls(wn_id))
+        permutation = IndexPermutation(len(urls), self._sampling.seed,
+                                       salt=wn_id)
+        for index in range(start, len(urls)):
+            yield urls[permutation[index]]
+
+    def _sample_uniformly(self):
+        url_store = self.url_store
+        word_net_ids = read_by_lines(config.wn_ids_path)
+
+        # satisfied categories stay in the sampled space, otherwise
+        # the same draw would map to another URL after a restart
+        selected = [(word_id_offset, wn_id)
+                    for word_id_offset, wn_id in enumerate(word_net_ids)
+                    if self._is_selected(wn_id)]
+
+        # a resumed sample is drawn from the sizes it started with, lists
+        # fetched since or failing now must not change the space
+        sizes = self._sample_sizes
+        if sizes is not None and len(sizes) != len(selected):
+            sizes = None
+
+        if sizes is None:
+            categories = selected
+        else:
+            categories = [category
+                          for category, size in zip(selected, sizes) if size]
+
+        prefetcher = SynsetPrefetcher(self.fetch_url_list, categories,
+                                      depth=config.synsets_prefetch,
+                                      on_wait=self._on_wait,
+                                      cancellation=self._cancellation)
+        self._failed_word_net_ids = prefetcher.failures
+
+        fetched = {}
+        try:
+            for word_id_offset, wn_id in prefetcher:
+                fetched[word_id_offset] = url_store.count(wn_id)
+        finally:
+            prefetcher.close()
+
+        # the sampled space is incomplete, no draw may be made from it
+        if prefetcher.cancelled:
+            return
+
+        if sizes is None:
+            sizes = array('q', (fetched.get(word_id_offset, 0)
+                                for word_id_offset, _ in selected))
+            self._sample_sizes = sizes
+
+        offsets = array('l')
+        wn_ids = []
+        bounds = array('q', [0])
+        for (word_id_offset, wn_id), size in zip(selected, sizes):
+            if size:
+                offsets.append(word_id_offset)
+                wn_ids.append(wn_id)
+                bounds.append(bounds[-1] + size)
+
+        permutation = IndexPermutation(bounds[-1], self._sampling.seed)
+        for draw in range(self._sample_offset + 1, len(permutation)):
+            index = permutation[draw]
+            category = bisect.bisect_right(bounds, index) - 1
+            wn_id = wn_ids[category]
+            if not self._in_shard(offsets[category]) or \
+                    self._skip_category(wn_id):
                 continue
 
-            try:
-                self.fetch_url_list(wn_id)
-            except SynsetUrlsUnavailableError:
-                # if we failed to fetch file with urls for synset,
-                # continue with next WordNet id
-                position.next_id()
+            # the list may be missing now, its URLs are passed over
+            if offsets[category] not in fetched:
+                continue
+
+            url_offset = index - bounds[category]
+            url = next(url_store.urls(wn_id, start=url_offset), None)
+            if url is None:
                 continue
 
-            path = config.synset_urls_path(wn_id)
+            position = Position(offsets[category], url_offset)
+            self._draws.append((draw, position))
+            yield wn_id, url, position
+
+    def _close(self, cursor):
+        self._active.discard(cursor.word_id_offset)
+        self._cursors.pop(cursor.word_id_offset, None)
+
+    def acknowledge(self, position):
+        if self._sampling.is_uniform:
+            self._acknowledge_draw(position)
+            return
+
+        offset = position.word_id_offset
+        if offset == self._frontier.word_id_offset:
+            self._frontier = self._copy(position)
+        elif offset in self._cursors:
+            self._cursors[offset] = self._copy(position)
+
+    def _acknowledge_draw(self, position):
+        while self._draws:
+            draw, drawn_position = self._draws.popleft()
+            if drawn_position == position:
+                self._sample_offset = draw
+                self._frontier = self._copy(position)
+                return
 
-            synset = read_by_lines(path)
+    @property
+    def sample_offset(self):
+        return self._sample_offset
 
-            for url in synset:
-                if self._valid_url(url):
-                    if position <= self._start_after_position:
-                        position.next_url()
-                        continue
+    @property
+    def sample_sizes(self):
+        if self._sample_sizes is None:
+            return None
+        return list(self._sample_sizes)
 
-                    yield (wn_id, url, position)
-                    position.next_url()
+    def checkpoint(self):
+        cursors = [self._copy(self._cursors[offset])
+                   for offset in sorted(self._cursors)]
+        return self._copy(self._frontier), cursors
 
-            position.next_id()
+    def _copy(self, position):
+        return Position(position.word_id_offset, position.url_offset)
 
-    def _valid_url(self, url):
-        return url.rstrip() != '' and url.lstrip() != ''
+    def _in_shard(self, word_id_offset):
+        return word_id_offset % self._shard_count == self._shard_index
+
+    def _is_selected(self, wn_id):
+        return self._selected_ids is None or wn_id in self._selected_ids
+
+    @property
+    def failed_word_net_ids(self):
+        return dict(self._failed_word_net_ids)
+
+
+class CategoryCursor:
+    __slots__ = ('word_id_offset', 'wn_id', '_urls', 'head')
+
+    def __init__(self, word_id_offset, wn_id, urls):
+        self.word_id_offset = word_id_offset
+        self.wn_id = wn_id
+        self._urls = urls
+        self.head = next(urls, None)
+
+    def advance(self):
+        item = self.head
+        if item is not None:
+            self.head = next(self._urls, None)
+        return item
 
 
 class ImageNetUrlsMocked(ImageNetUrls):
     def fetch_wordnet_ids(self):
         destination = config.wn_ids_path
-        fixture_path = os.path.join('fixtures', 'word_net_ids.txt')
-        shutil.copyfile(fixture_path, destination)
+        if self._file_is_missing(destination):
+            fixture_path = os.path.join('fixtures', 'word_net_ids.txt')
+            shutil.copyfile(fixture_path, destination)
 
     def fetch_url_list(self, word_net_id):
-        destination = config.synset_urls_path(word_net_id)
-        file_name = 'synset_urls_{}.txt'.format(word_net_id)
-        fixture_path = os.path.join('fixtures', file_name)
-        shutil.copyfile(fixture_path, destination)
+        if word_net_id in self.url_store:
+            return
+
+        if not self._import_legacy_list(word_net_id):
+            file_name = 'synset_urls_{}.txt'.format(word_net_id)
+            fixture_path = os.path.join('fixtures', file_name)
+            self.url_store.add(word_net_id, read_by_lines(fixture_path))
+
+
+class ImageNetUrlsFromDump(ImageNetUrls):
+    def __init__(self, dump_path, start_after_position=None, **kwargs):
+        super().__init__(start_after_position=start_after_position, **kwargs)
+        self._importer = UrlDumpImporter(dump_path)
+
+    def fetch_wordnet_ids(self):
+        try:
+            if not self._importer.imported:
+                self._importer.run(self.url_store)
+        except IOError as e:
+            raise WordNetIdsUnavailableError(str(e))
+
+    def _url_store_path(self):
+        # the dump is imported once, before any worker is started,
+        # and is only read afterwards
+        return config.synset_urls_store_path
+
+    def fetch_url_list(self, word_net_id):
+        if word_net_id in self.url_store:
+            return
+
+        if not self._import_legacy_list(word_net_id):
+            raise SynsetUrlsUnavailableError(
+                'No urls for {} in the dump'.format(word_net_id)
+            )
 
 
-def create_image_net_urls(start_after_position=None):
+def create_image_net_urls(start_after_position=None, **kwargs):
     if os.getenv('TEST_ENV'):
-        return ImageNetUrlsMocked(start_after_position)
+        return ImageNetUrlsMocked(start_after_position, **kwargs)
+    elif config.urls_dump_path:
+        return ImageNetUrlsFromDump(config.urls_dump_path,
+                                    start_after_position=start_after_position,
+                                    **kwargs)
     else:
-        return ImageNetUrls(start_after_position=None)
+        return ImageNetUrls(start_after_position=start_after_position,
+                            **kwargs)
 
 
 class InvalidBatchError(Exception):
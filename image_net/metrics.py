@@ -0,0 +1,309 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import config
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(zip(self.labels, key)), value)
+                    for key, value in sorted(self._values.items())]
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def keys(self):
+        # label values of every series
+        with self._lock:
+            return sorted(self._values)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = \
+                self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = \
+                self._values.get(label_values, 0) + amount
+
+    def dec(self, amount=1, *label_values):
+        self.inc(-amount, *label_values)
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                       10)
+
+    def __init__(self, name, help, labels=(), buckets=None):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets or self.default_buckets)
+
+    def observe(self, value, *label_values):
+        # one count per bucket, they are only added up when collected
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0, 0]
+                self._values[label_values] = series
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        series = self._values.get(label_values)
+        return 0 if series is None else series[2]
+
+    def total(self, *label_values):
+        series = self._values.get(label_values)
+        return 0 if series is None else series[1]
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts), total, count)
+                            for key, (counts, total, count)
+                            in self._values.items())
+
+        samples = []
+        bounds = [format_value(b) for b in self.buckets] + ['+Inf']
+        for key, counts, total, count in values:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                samples.append((self.name + '_bucket',
+                                dict(labels, le=bound), cumulative))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=None):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+    def to_prometheus(self):
+        # text exposition format 0.0.4
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('{}{} {}'.format(name, format_labels(labels),
+                                              format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    pairs = ['{}="{}"'.format(name, escape(str(value)))
+             for name, value in labels.items()]
+    return '{' + ','.join(pairs) + '}'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+default_registry = Registry()
+
+image_requests = default_registry.counter(
+    'imagenet_requests_total', 'Image requests by outcome', ['outcome']
+)
+bytes_downloaded = default_registry.counter(
+    'imagenet_downloaded_bytes_total', 'Bytes of the images kept'
+)
+in_flight = default_registry.gauge(
+    'imagenet_requests_in_flight', 'Image requests being made'
+)
+stage_seconds = default_registry.histogram(
+    'imagenet_stage_seconds', 'Time an item spends in a download stage',
+    ['stage']
+)
+queue_depth = default_registry.gauge(
+    'imagenet_stage_queue_depth',
+    'Items waiting for a download stage when the last one was queued',
+    ['stage']
+)
+checkpoint_seconds = default_registry.histogram(
+    'imagenet_checkpoint_seconds', 'Time taken to write the download state',
+    ['kind']
+)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.server.registry.to_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    # serves the registry at /metrics for Prometheus to scrape
+    def __init__(self, port, host='127.0.0.1', registry=None):
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.registry = registry or default_registry
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}/metrics'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+
+class MetricsFile:
+    # rewrites the file every interval seconds, in the format read by the
+    # textfile collector of the Prometheus node exporter
+    def __init__(self, path, interval=None, registry=None):
+        self._path = path
+        self._interval = interval or config.metrics_interval
+        self._registry = registry or default_registry
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self.write()
+
+    def write(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temp_path = self._path + '.part'
+        with open(temp_path, 'w') as f:
+            f.write(self._registry.to_prometheus())
+        os.replace(temp_path, self._path)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # the last values are kept
+        self.write()
+
+
+def start_exporters(port=None, path=None):
+    # the settings are used for what is not given
+    if port is None:
+        port = config.metrics_port
+    if path is None:
+        path = config.metrics_path
+
+    exporters = []
+    if port:
+        exporters.append(MetricsServer(port, host=config.metrics_host))
+    if path:
+        exporters.append(MetricsFile(path))
+
+    for exporter in exporters:
+        exporter.start()
+    return exporters
+
+
+def stop_exporters(exporters):
+    for exporter in exporters:
+        exporter.stop()
@@ -0,0 +1,197 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import queue
+import threading
+import time
+
+from image_net import metrics
+
+
+class StageMetrics:
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0
+        self.capacity_seconds = 0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += seconds
+        metrics.stage_seconds.observe(seconds, self.name)
+
+    def observe_queue(self, depth):
+        with self._lock:
+            self._depth_total += depth
+            self._depth_samples += 1
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        metrics.queue_depth.set(depth, self.name)
+
+    def add_active_time(self, seconds):
+        with self._lock:
+            self.capacity_seconds += seconds * self.workers
+
+    @property
+    def mean_queue_depth(self):
+        if self._depth_samples == 0:
+            return 0
+        return self._depth_total / self._depth_samples
+
+    @property
+    def utilization(self):
+        # share of the time its workers were busy; the stage close to 1
+        # is the one holding the others back
+        if self.capacity_seconds <= 0:
+            return 0
+        return min(1.0, self.busy_seconds / self.capacity_seconds)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'workers': self.workers,
+            'items': self.items,
+            'busy_seconds': self.busy_seconds,
+            'utilization': self.utilization,
+            'mean_queue_depth': self.mean_queue_depth,
+            'max_queue_depth': self.max_queue_depth
+        }
+
+
+class Stage:
+    def __init__(self, name, function, workers=1, queue_size=0, metrics=None):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        if metrics is None:
+            metrics = StageMetrics(name)
+        self.metrics = metrics
+        self.metrics.workers = self.workers
+
+
+class Pipeline:
+    # Every stage has its own worker threads and a bounded input queue,
+    # so a slow stage only holds back the stages feeding it. A stage
+    # function returns False when an item needs no further stages.
+    _end = object()
+
+    def __init__(self, stages):
+        self._stages = stages
+        self._queues = [queue.Queue(maxsize=stage.queue_size)
+                        for stage in stages]
+        self._threads = [[] for _ in stages]
+        self._errors = []
+        self._mark = None
+
+    @property
+    def metrics(self):
+        return [stage.metrics for stage in self._stages]
+
+    def start(self):
+        self._mark = time.perf_counter()
+        for i, stage in enumerate(self._stages):
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(i,),
+                                          daemon=True)
+                thread.start()
+                self._threads[i].append(thread)
+
+    def put(self, item):
+        # blocks while the first stage is full
+        self._enqueue(0, item)
+
+    def run(self, items):
+        self.start()
+        try:
+            for item in items:
+                self.put(item)
+        finally:
+            self.close()
+
+    def join(self):
+        # waits for the items put so far; an item is passed on before it
+        # is marked done, so the queues can be waited for in order
+        for q in self._queues:
+            q.join()
+        self._update_active_time()
+        self.raise_errors()
+
+    def close(self):
+        for i, q in enumerate(self._queues):
+            for _ in self._threads[i]:
+                q.put(self._end)
+            for thread in self._threads[i]:
+                thread.join()
+            self._threads[i] = []
+        self._update_active_time()
+        self.raise_errors()
+
+    def _enqueue(self, i, item):
+        q = self._queues[i]
+        self._stages[i].metrics.observe_queue(q.qsize())
+        q.put(item)
+
+    def _work(self, i):
+        stage = self._stages[i]
+        q = self._queues[i]
+        last = i + 1 == len(self._stages)
+        while True:
+            item = q.get()
+            if item is self._end:
+                q.task_done()
+                return
+
+            started = time.perf_counter()
+            try:
+                passed = stage.function(item)
+            except Exception as e:
+                self._errors.append(e)
+                passed = False
+            stage.metrics.record(time.perf_counter() - started)
+
+            if passed is not False and not last:
+                self._enqueue(i + 1, item)
+            q.task_done()
+
+    def _update_active_time(self):
+        if self._mark is None:
+            return
+
+        now = time.perf_counter()
+        for stage in self._stages:
+            stage.metrics.add_active_time(now - self._mark)
+        self._mark = now
+
+    def raise_errors(self):
+        # the first error of the stages so far, without waiting for them
+        if self._errors:
+            error = self._errors[0]
+            self._errors = []
+            raise error
+
+
+def bottleneck(metrics):
+    busy = [m for m in metrics if m.items > 0]
+    if not busy:
+        return None
+    return max(busy, key=lambda m: m.utilization)
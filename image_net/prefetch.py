@@ -0,0 +1,91 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class SynsetPrefetcher:
+    # seconds a list may take before the caller is told about the wait,
+    # the cancellation is checked as often while waiting
+    patience = 0.5
+
+    def __init__(self, fetch, categories, depth, on_wait=None,
+                 cancellation=None):
+        self._fetch = fetch
+        self._on_wait = on_wait or (lambda: None)
+        self._cancellation = cancellation
+        self._categories = iter(categories)
+        self._depth = max(1, depth)
+        self._pool = None
+        self._window = deque()
+        self.failures = {}
+
+    def __iter__(self):
+        self._pool = ThreadPoolExecutor(max_workers=self._depth)
+        try:
+            self._fill()
+            while self._window and not self.cancelled:
+                word_id_offset, wn_id, future = self._window.popleft()
+                self._fill()
+
+                # the caller gets a chance to do other work, e.g. download
+                # what it has, before waiting for a slow list
+                waited = False
+                while not wait([future], timeout=self.patience).done:
+                    if self.cancelled:
+                        return
+                    if not waited:
+                        self._on_wait()
+                        waited = True
+
+                try:
+                    future.result()
+                except Exception as e:
+                    self.failures[wn_id] = str(e) or e.__class__.__name__
+                    continue
+
+                yield word_id_offset, wn_id
+        finally:
+            self.close()
+
+    @property
+    def cancelled(self):
+        return self._cancellation is not None and self._cancellation.is_set()
+
+    @property
+    def pending(self):
+        return len(self._window)
+
+    def _fill(self):
+        while len(self._window) < self._depth:
+            try:
+                word_id_offset, wn_id = next(self._categories)
+            except StopIteration:
+                return
+
+            future = self._pool.submit(self._fetch, wn_id)
+            self._window.append((word_id_offset, wn_id, future))
+
+    def close(self):
+        for _, _, future in self._window:
+            future.cancel()
+        self._window.clear()
+
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,106 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+
+
+class Sampling:
+    modes = ['sequential', 'uniform', 'stratified']
+
+    def __init__(self, mode='sequential', seed=0):
+        if mode not in self.modes:
+            raise ValueError('Unknown sampling mode "{}"'.format(mode))
+
+        self.mode = mode
+        self.seed = seed
+
+    @staticmethod
+    def uniform(seed):
+        return Sampling(mode='uniform', seed=seed)
+
+    @staticmethod
+    def stratified(seed):
+        return Sampling(mode='stratified', seed=seed)
+
+    @property
+    def is_uniform(self):
+        return self.mode == 'uniform'
+
+    @property
+    def is_stratified(self):
+        return self.mode == 'stratified'
+
+    def as_dict(self):
+        return {
+            'mode': self.mode,
+            'seed': self.seed
+        }
+
+    @staticmethod
+    def from_dict(sampling_dict):
+        return Sampling(mode=sampling_dict['mode'],
+                        seed=sampling_dict['seed'])
+
+
+class IndexPermutation:
+    # A pseudo random permutation of range(size) which is computed one
+    # element at a time, so nothing proportional to size is kept in memory.
+    # Indices are encrypted by a small Feistel network over the smallest
+    # even number of bits covering size; values falling outside the range
+    # are encrypted again until they land inside it (cycle walking).
+    rounds = 4
+
+    def __init__(self, size, seed, salt=''):
+        self._size = size
+
+        bits = max(1, (size - 1).bit_length())
+        self._half_bits = (bits + 1) // 2
+        self._half_mask = (1 << self._half_bits) - 1
+
+        digest = hashlib.sha256(
+            '{}:{}'.format(seed, salt).encode('utf-8')
+        ).digest()
+        self._keys = [int.from_bytes(digest[i * 8:(i + 1) * 8], 'little')
+                      for i in range(self.rounds)]
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+
+        value = self._encrypt(index)
+        while value >= self._size:
+            value = self._encrypt(value)
+        return value
+
+    def __iter__(self):
+        for index in range(self._size):
+            yield self[index]
+
+    def _encrypt(self, value):
+        left = value >> self._half_bits
+        right = value & self._half_mask
+        for key in self._keys:
+            left, right = right, left ^ self._mix(right, key)
+        return (left << self._half_bits) | right
+
+    def _mix(self, value, key):
+        value = ((value ^ key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        value ^= value >> 29
+        return value & self._half_mask
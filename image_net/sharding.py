@@ -0,0 +1,217 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import multiprocessing
+import queue
+
+from config import config
+from image_net import iterators
+from image_net.stateful_downloader import StatefulDownloader, \
+    NotConfiguredError
+from util.app_state import AppState, DownloadConfiguration, Result
+
+
+def create_downloader(app_state, cancellation=None):
+    conf = app_state.download_configuration
+    if app_state.configured and conf.shards > 1:
+        return ShardedDownloader(app_state, cancellation=cancellation)
+    return StatefulDownloader(app_state, cancellation=cancellation)
+
+
+class ShardedDownloader:
+    # Runs a StatefulDownloader in each of several worker processes.
+    # Workers own every shards-th category and every shards-th file index,
+    # keep their own states and share a budget of images left to download.
+    # The main state only aggregates their progress.
+    poll_interval = 0.5
+
+    def __init__(self, app_state, cancellation=None):
+        self._app_state = app_state
+        self._cancellation = cancellation
+        self._last_result = Result(failed_urls=[], succeeded_urls=[])
+
+    def __iter__(self):
+        if not self._app_state.configured:
+            raise NotConfiguredError()
+
+        conf = self._app_state.download_configuration
+        shards = conf.shards
+
+        # a new download drops states of earlier workers on its first save
+        self._app_state.save()
+
+        # the URL list and the categories are fetched once, before
+        # workers start reading them
+        iterators.create_image_net_urls().prepare()
+        conf.categories.resolve()
+
+        downloaded, failed = self._shards_progress(shards)
+        progress_info = self._app_state.progress_info
+        progress_info.total_downloaded = downloaded
+        progress_info.total_failed = failed
+
+        # workers are started from scratch, threads of this process
+        # must not be inherited by them
+        context = multiprocessing.get_context('spawn')
+        budget = GlobalBudget(context, conf.number_of_images - downloaded)
+        results = context.Queue(maxsize=shards)
+        stop = context.Event()
+
+        workers = [
+            context.Process(target=run_shard,
+                            args=(index, shards, conf.as_dict(), budget,
+                                  results, stop),
+                            daemon=True)
+            for index in range(shards)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            running = shards
+            while running > 0:
+                # workers are cancelled by the stop event in finally
+                if self._cancellation is not None and \
+                        self._cancellation.is_set():
+                    return
+
+                try:
+                    message = results.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        raise ShardFailedError('Download processes exited')
+                    continue
+
+                kind, index, payload = message
+                if kind == 'finished':
+                    running -= 1
+                elif kind == 'error':
+                    raise ShardFailedError(payload)
+                else:
+                    failed_urls, succeeded_urls = payload
+                    result = Result(failed_urls=failed_urls,
+                                    succeeded_urls=succeeded_urls)
+                    self._app_state.update_progress(result)
+                    self._app_state.checkpoint()
+                    self._last_result = result
+                    yield result
+
+            self._app_state.mark_finished()
+            self._app_state.save()
+        finally:
+            stop.set()
+            self._drain(results)
+            for worker in workers:
+                # a worker takes up to one network read to notice the stop
+                worker.join(timeout=config.file_download_timeout +
+                            self.poll_interval * 4)
+                if worker.is_alive():
+                    worker.terminate()
+
+    def _shards_progress(self, shards):
+        downloaded = 0
+        failed = 0
+        for index in range(shards):
+            progress_info = AppState(config.shard_state_path(index)).progress_info
+            downloaded += progress_info.total_downloaded
+            failed += progress_info.total_failed
+        return downloaded, failed
+
+    def _drain(self, results):
+        # workers blocked on a full queue would never see the stop event
+        try:
+            while True:
+                results.get_nowait()
+        except queue.Empty:
+            pass
+
+    def save(self):
+        self._app_state.save()
+
+    @property
+    def progress_info(self):
+        return self._app_state.progress_info
+
+    @property
+    def last_result(self):
+        return self._last_result
+
+    @property
+    def stage_metrics(self):
+        # every shard process measures its own stages
+        return []
+
+
+class GlobalBudget:
+    def __init__(self, context, images):
+        self._left = context.Value('q', max(0, images))
+
+    def take(self):
+        with self._left.get_lock():
+            if self._left.value <= 0:
+                return False
+            self._left.value -= 1
+            return True
+
+    @property
+    def left(self):
+        return self._left.value
+
+    @property
+    def exhausted(self):
+        return self._left.value <= 0
+
+    @property
+    def withheld(self):
+        # images are never given back to a shared budget
+        return False
+
+
+def run_shard(index, shards, conf_dict, budget, results, stop):
+    app_state = AppState(config.shard_state_path(index))
+    if not app_state.configured:
+        app_state.set_configuration(DownloadConfiguration.from_dict(conf_dict))
+        app_state.internal_state.file_index = index + 1
+
+    downloader = StatefulDownloader(app_state, shard=(index, shards),
+                                    budget=budget, cancellation=stop)
+    try:
+        for result in downloader:
+            payload = (result.failed_urls, result.succeeded_urls)
+            if not _send(results, ('result', index, payload), stop):
+                return
+    except Exception as e:
+        _send(results, ('error', index, '{}: {}'.format(type(e).__name__, e)),
+              stop)
+        return
+
+    _send(results, ('finished', index, None), stop)
+
+
+def _send(results, message, stop):
+    # the queue is bounded, so workers wait here while the download is
+    # paused and the main process does not take their results
+    while not stop.is_set():
+        try:
+            results.put(message, timeout=ShardedDownloader.poll_interval)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class ShardFailedError(Exception): pass
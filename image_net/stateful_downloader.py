@@ -16,14 +16,25 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import time
+from config import config
 from image_net import iterators
 from image_net.batch_download import BatchDownload
+from image_net.concurrency import ConcurrencyController
+from image_net.pipeline import StageMetrics
 from util.app_state import DownloadConfiguration, Result
 
 
 class StatefulDownloader:
-    def __init__(self, app_state):
+    def __init__(self, app_state, shard=None, budget=None, cancellation=None):
         self._app_state = app_state
+        self._shard = shard
+        self._budget = budget
+        self._cancellation = cancellation
+        self._last_downloads = []
+        self._source_metrics = StageMetrics('source')
+        self._batch_download = None
+        self._flushed_while_waiting = False
 
     def __iter__(self):
         if not self._app_state.configured:
@@ -34,23 +45,84 @@ class StatefulDownloader:
         internal = self._app_state.internal_state
 
         images_left = conf.number_of_images - progress_info.total_downloaded
+        word_net_ids = conf.categories.resolve()
 
         conf = DownloadConfiguration(download_destination=conf.download_destination,
                                      number_of_images=images_left,
                                      images_per_category=conf.images_per_category,
-                                     batch_size=conf.batch_size)
+                                     batch_size=conf.batch_size,
+                                     categories=conf.categories,
+                                     interleaved_categories=conf.interleaved_categories,
+                                     sampling=conf.sampling)
+        if self._shard is None:
+            index_step = 1
+        else:
+            index_step = self._shard[1]
+
         batch_download = BatchDownload(
-            conf, starting_index=internal.file_index
+            conf, starting_index=internal.file_index,
+            url_statuses=self._app_state.url_statuses,
+            index_step=index_step, budget=self._budget,
+            concurrency=self._create_concurrency_controller(internal, conf),
+            cancellation=self._cancellation
         )
 
+        self._batch_download = batch_download
         batch_download.set_counts(internal.category_counts)
 
+        # URLs interrupted by the last pause are already behind the
+        # saved position
+        batch_download.restore(internal.pending_urls)
+
         image_net_urls = iterators.create_image_net_urls(
-            start_after_position=internal.iterator_position
+            start_after_position=internal.iterator_position,
+            cursors=internal.cursors,
+            word_net_ids=word_net_ids,
+            skip_category=batch_download.is_satisfied,
+            priority=batch_download.priority,
+            defer_category=batch_download.has_enough_pending,
+            interleave=conf.interleaved_categories,
+            sampling=conf.sampling,
+            sample_offset=internal.sample_offset,
+            sample_sizes=internal.sample_sizes,
+            shard=self._shard,
+            on_wait=self._download_while_waiting,
+            cancellation=self._cancellation
         )
-
+        self._image_net_urls = image_net_urls
+
+        # checkpoints are written in the background while the next batch
+        # is downloaded, all of them are on disk once the loop is left
+        started = time.perf_counter()
+        try:
+            yield from self._download(batch_download, image_net_urls)
+        finally:
+            self._source_metrics.add_active_time(time.perf_counter() - started)
+            self._app_state.wait_for_checkpoints()
+
+    def _download(self, batch_download, image_net_urls):
+        # the source stage runs on this thread, its busy time is the time
+        # spent getting the next URL and adding it to the batch
+        started = time.perf_counter()
         for wn_id, url, position in image_net_urls:
+            if self._flushed_while_waiting:
+                self._flushed_while_waiting = False
+                yield self._last_result
+                if batch_download.complete:
+                    self._app_state.mark_finished()
+                    break
+
+            # URLs buffered since the last checkpoint are not covered by
+            # it, so stopping here loses nothing
+            if self._cancelled:
+                return
+
             batch_download.add(wn_id, url)
+            self._source_metrics.record(time.perf_counter() - started)
+
+            # URLs which are not downloaded by the next checkpoint are
+            # saved with it, so the position may cover them
+            image_net_urls.acknowledge(position)
 
             if batch_download.batch_ready:
                 failed_urls, succeeded_urls = batch_download.flush()
@@ -64,14 +136,50 @@ class StatefulDownloader:
                     self._app_state.mark_finished()
                     break
 
-            internal.iterator_position = position
-            internal.category_counts = batch_download.category_counts
+                if self._cancelled:
+                    return
+
+            started = time.perf_counter()
+
+        if self._flushed_while_waiting:
+            self._flushed_while_waiting = False
+            yield self._last_result
+
+        if self._cancelled:
+            return
 
         self._app_state.mark_finished()
         if not batch_download.is_empty:
             self._finish_download(batch_download)
             yield self._last_result
 
+    def _create_concurrency_controller(self, internal, conf):
+        if not config.auto_tune_workers:
+            return None
+
+        # a resumed download starts from the level found last time;
+        # more downloads than the batch holds can never run at once
+        level = internal.concurrency or config.initial_workers
+        max_level = min(config.max_workers, conf.batch_size)
+        return ConcurrencyController(
+            level=level, min_level=min(config.min_workers, max_level),
+            max_level=max_level
+        )
+
+    def _download_while_waiting(self):
+        # the iterator is about to wait for a list of URLs, the batch
+        # gathered so far is downloaded meanwhile; its result is reported
+        # with the next URL
+        batch_download = self._batch_download
+        if self._cancelled or batch_download.is_empty or \
+                batch_download.complete:
+            return
+
+        self._finish_download(batch_download)
+        if batch_download.complete:
+            self._app_state.mark_finished()
+        self._flushed_while_waiting = True
+
     def _finish_download(self, batch_download):
         failed_urls, succeeded_urls = batch_download.flush()
         self._update_and_save_progress(failed_urls, succeeded_urls,
@@ -83,11 +191,36 @@ class StatefulDownloader:
             Result(failed_urls=failed_urls, succeeded_urls=succeeded_urls)
         )
 
+        internal = self._app_state.internal_state
+        internal.iterator_position, internal.cursors = \
+            self._image_net_urls.checkpoint()
+        internal.sample_offset = self._image_net_urls.sample_offset
+        if internal.sample_sizes is None:
+            sample_sizes = self._image_net_urls.sample_sizes
+            if sample_sizes is not None:
+                internal.set_sample_sizes(sample_sizes)
+
         self._app_state.internal_state.file_index = batch_download.file_index
-        self._app_state.internal_state.category_counts = batch_download.category_counts
+        if batch_download.concurrency_level is not None:
+            internal.concurrency = batch_download.concurrency_level
+        # interrupted URLs and the deferred ones put back into the batch
+        internal.pending_urls = batch_download.interrupted + \
+            batch_download.waiting
+        self._app_state.internal_state.update_counts(
+            batch_download.take_changed_counts()
+        )
 
         self._last_result = self._app_state.progress_info.last_result
-        self.save()
+        self._last_downloads = batch_download.last_downloads
+        statuses = batch_download.take_statuses()
+        self._app_state.checkpoint(
+            background=True,
+            on_written=lambda: batch_download.commit_statuses(statuses)
+        )
+
+    @property
+    def _cancelled(self):
+        return self._cancellation is not None and self._cancellation.is_set()
 
     def save(self):
         self._app_state.save()
@@ -100,6 +233,18 @@ class StatefulDownloader:
     def last_result(self):
         return self._last_result
 
+    @property
+    def stage_metrics(self):
+        metrics = [self._source_metrics]
+        if self._batch_download is not None:
+            metrics.extend(self._batch_download.stage_metrics)
+        metrics.append(self._app_state.journal_metrics)
+        return metrics
+
+    @property
+    def last_downloads(self):
+        return list(self._last_downloads)
+
 
 class NotConfiguredError(Exception):
     pass
@@ -0,0 +1,288 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import heapq
+import json
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from operator import itemgetter
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.connection import allowed_gai_family
+
+try:
+    from urllib3.exceptions import NameResolutionError
+except ImportError:
+    # urllib3 before 2.0, its connections are not traced
+    NameResolutionError = None
+
+from config import config
+from image_net import metrics
+
+# in the order they happen; body includes writing the temporary file and
+# write is giving the file its name
+phases = ('dns', 'connect', 'tls', 'first_byte', 'body', 'validate', 'write')
+
+_current = threading.local()
+
+
+class RequestTrace:
+    __slots__ = ('url', 'host', 'sampled', 'phases', '_last')
+
+    def __init__(self, url, sampled=False):
+        self.url = url
+        self.host = urlsplit(url).hostname or ''
+        self.sampled = sampled
+        # (phase, start, end, thread id) with perf_counter times
+        self.phases = []
+        self._last = time.perf_counter()
+
+    def add(self, phase, start, end=None):
+        if end is None:
+            end = time.perf_counter()
+        self.phases.append((phase, start, end, threading.get_ident()))
+        self._last = end
+
+    def mark(self, phase):
+        # the phase started when the previous one ended
+        self.add(phase, self._last)
+
+    def seconds(self, phase):
+        return sum(end - start for name, start, end, thread in self.phases
+                   if name == phase)
+
+
+class Tracer:
+    # Requests record their phases into their own trace. Finished traces
+    # are appended to a deque, which needs no lock, and are only added to
+    # the histograms by collect, so the threads making requests never wait
+    # for each other.
+    def __init__(self, registry=None, sample_rate=None, capacity=None,
+                 max_hosts=1000):
+        registry = registry or metrics.Registry()
+        self.phase_seconds = registry.histogram(
+            'imagenet_request_phase_seconds',
+            'Time taken by a phase of an image request', ['phase']
+        )
+        # not exported, there would be a series for every host
+        self.host_seconds = HostTotals(max_hosts)
+        self._sample_rate = sample_rate
+        self._capacity = capacity
+        self._finished = deque()
+        self._samples = None
+        self._origin = time.perf_counter()
+
+    @property
+    def sample_rate(self):
+        if self._sample_rate is None:
+            return config.trace_sample_rate
+        return self._sample_rate
+
+    @property
+    def samples(self):
+        # the most recent sampled traces
+        if self._samples is None:
+            capacity = self._capacity or config.trace_buffer_size
+            self._samples = deque(maxlen=capacity)
+        return self._samples
+
+    def start(self, url):
+        trace = RequestTrace(url, random.random() < self.sample_rate)
+        activate(trace)
+        return trace
+
+    def finish(self, trace):
+        self._finished.append(trace)
+
+    def collect(self):
+        while True:
+            try:
+                trace = self._finished.popleft()
+            except IndexError:
+                break
+
+            for phase, start, end, thread in trace.phases:
+                self.phase_seconds.observe(end - start, phase)
+                self.host_seconds.add(trace.host, end - start)
+            if trace.sampled:
+                self.samples.append(trace)
+
+    def clear(self):
+        self._finished.clear()
+        self.samples.clear()
+        self.phase_seconds.clear()
+        self.host_seconds.clear()
+
+    def slowest_hosts(self, number):
+        # hosts with the most time spent on their requests
+        return self.host_seconds.slowest(number)
+
+    def chrome_trace(self):
+        # the trace event format read by chrome://tracing and Perfetto
+        self.collect()
+        pid = os.getpid()
+        events = []
+        for trace in self.samples:
+            for phase, start, end, thread in trace.phases:
+                events.append({
+                    'name': phase,
+                    'cat': trace.host,
+                    'ph': 'X',
+                    'ts': (start - self._origin) * 1e6,
+                    'dur': (end - start) * 1e6,
+                    'pid': pid,
+                    'tid': thread,
+                    'args': {'url': trace.url}
+                })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class HostTotals:
+    # Seconds spent on the requests to every host. Only the slowest hosts
+    # are of interest and a download may reach tens of thousands, so once
+    # twice the capacity is reached the faster half is dropped. A dropped
+    # host starts again from zero when it is seen next.
+    def __init__(self, capacity):
+        self._capacity = max(1, capacity)
+        self._seconds = {}
+
+    def add(self, host, seconds):
+        self._seconds[host] = self._seconds.get(host, 0) + seconds
+        if len(self._seconds) > 2 * self._capacity:
+            self._seconds = dict(self.slowest(self._capacity))
+
+    def seconds(self, host):
+        return self._seconds.get(host, 0)
+
+    def slowest(self, number):
+        return heapq.nlargest(number, self._seconds.items(),
+                              key=itemgetter(1))
+
+    def clear(self):
+        self._seconds = {}
+
+    def __len__(self):
+        return len(self._seconds)
+
+
+def activate(trace):
+    # the trace of the request made by this thread, None when it is done
+    _current.trace = trace
+
+
+def current():
+    return getattr(_current, 'trace', None)
+
+
+def mark(phase):
+    trace = current()
+    if trace is not None:
+        trace.mark(phase)
+
+
+class _TracedConnection:
+    # urllib3 resolves the name and connects in one call, here they are
+    # done separately to time them
+    def _new_conn(self):
+        trace = current()
+        if trace is None:
+            return super()._new_conn()
+
+        started = time.perf_counter()
+        host = self._dns_host
+        try:
+            addresses = socket.getaddrinfo(host.strip('[]'), self.port,
+                                           allowed_gai_family(),
+                                           socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        resolved = time.perf_counter()
+        trace.add('dns', started, resolved)
+
+        # every address is tried in turn like urllib3 does
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address[4][0]
+                try:
+                    sock = super()._new_conn()
+                except ConnectTimeoutError as e:
+                    error = e
+                    continue
+
+                trace.add('connect', resolved)
+                return sock
+        finally:
+            self._dns_host = host
+        raise error
+
+
+class TracedHTTPConnection(_TracedConnection, HTTPConnection):
+    pass
+
+
+class TracedHTTPSConnection(_TracedConnection, HTTPSConnection):
+    def connect(self):
+        super().connect()
+        mark('tls')
+
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+
+class TracingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TracedHTTPConnectionPool,
+            'https': TracedHTTPSConnectionPool
+        }
+
+
+def traced_session():
+    session = requests.Session()
+    if NameResolutionError is None:
+        return session
+
+    session.mount('http://', TracingAdapter())
+    session.mount('https://', TracingAdapter())
+    return session
+
+
+default_tracer = Tracer(metrics.default_registry)
@@ -0,0 +1,93 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import json
+from itertools import groupby
+from operator import itemgetter
+from config import config
+
+
+class UrlDumpImporter:
+    def __init__(self, dump_path):
+        self._dump_path = dump_path
+        self.urls_count = 0
+
+    @property
+    def imported(self):
+        if not os.path.isfile(config.url_dump_marker_path):
+            return False
+
+        with open(config.url_dump_marker_path) as f:
+            try:
+                marker = json.loads(f.read())
+            except ValueError:
+                return False
+
+        return marker == self._marker()
+
+    def _marker(self):
+        return {
+            'dump_path': os.path.abspath(self._dump_path),
+            'dump_size': os.path.getsize(self._dump_path)
+        }
+
+    def run(self, url_store):
+        os.makedirs(config.app_data_folder, exist_ok=True)
+
+        word_net_ids = []
+        seen_ids = set()
+        self.urls_count = 0
+
+        with open(self._dump_path, 'rb') as dump:
+            records = (self._parse(line) for line in dump)
+            records = (record for record in records if record is not None)
+
+            for wn_id, group in groupby(records, key=itemgetter(0)):
+                # the dump is grouped by WordNet id, but a group
+                # showing up twice is appended to the first one
+                append = wn_id in seen_ids
+                if not append:
+                    seen_ids.add(wn_id)
+                    word_net_ids.append(wn_id)
+
+                url_store.add(wn_id, self._counted(group), append=append)
+
+        self._write_atomically(config.wn_ids_path, '\n'.join(word_net_ids))
+        self._write_atomically(config.url_dump_marker_path,
+                               json.dumps(self._marker()))
+
+    def _parse(self, line):
+        image_id, separator, url = line.partition(b'\t')
+        url = url.strip()
+        if not separator or not url:
+            return None
+
+        wn_id = image_id.split(b'_', 1)[0].strip()
+        return (wn_id.decode('utf-8', errors='replace'),
+                url.decode('utf-8', errors='replace'))
+
+    def _counted(self, group):
+        for _, url in group:
+            self.urls_count += 1
+            yield url
+
+    def _write_atomically(self, path, text):
+        temp_path = path + '.part'
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, path)
@@ -0,0 +1,107 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sqlite3
+import threading
+import time
+
+
+class UrlStatusStore:
+    # Status of every URL handed to the downloader, kept in SQLite in WAL
+    # mode. Statuses of a whole batch are written in one transaction.
+    pending = 'pending'
+    in_flight = 'in_flight'
+    ok = 'ok'
+    failed = 'failed'
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS url_status ('
+            'wn_id TEXT NOT NULL, '
+            'url TEXT NOT NULL, '
+            'status TEXT NOT NULL, '
+            'reason TEXT, '
+            'path TEXT, '
+            'updated REAL NOT NULL, '
+            'PRIMARY KEY (wn_id, url)) WITHOUT ROWID'
+        )
+        self._connection.commit()
+
+    def mark(self, items, status):
+        now = time.time()
+        rows = [(wn_id, url, status, None, None, now) for wn_id, url in items]
+        self._write(rows)
+
+    def record(self, results):
+        # results are tuples (wn_id, url, status, reason, path)
+        now = time.time()
+        rows = [result + (now,) for result in results]
+        self._write(rows)
+
+    def _write(self, rows):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO url_status '
+                '(wn_id, url, status, reason, path, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows
+            )
+
+    def status(self, wn_id, url):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT status FROM url_status WHERE wn_id = ? AND url = ?',
+                (wn_id, url)
+            ).fetchone()
+        return row[0] if row else None
+
+    def reason(self, wn_id, url):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT reason FROM url_status WHERE wn_id = ? AND url = ?',
+                (wn_id, url)
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_fetched(self, wn_id, url):
+        return self.status(wn_id, url) == self.ok
+
+    def counts(self):
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT status, COUNT(*) FROM url_status GROUP BY status'
+            ).fetchall()
+        return dict(rows)
+
+    def recover(self):
+        # downloads interrupted by a crash are not known to have finished
+        with self._lock, self._connection:
+            self._connection.execute(
+                'UPDATE url_status SET status = ? WHERE status = ?',
+                (self.pending, self.in_flight)
+            )
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM url_status')
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
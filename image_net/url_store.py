@@ -0,0 +1,213 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import struct
+import threading
+import zlib
+from itertools import islice
+
+_stores = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _path_lock(path):
+    # writes to a file are serialized even between different store objects
+    with _registry_lock:
+        return _locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class SynsetUrlStore:
+    # The store is a single file made of zlib compressed blocks of URLs.
+    # Every block starts with a header (flags, length of WordNet id,
+    # number of URLs, size of compressed payload) followed by the WordNet
+    # id and the payload. A category is only visible once its block
+    # flagged as last has been written, so a partially written category
+    # is discarded on the next start up. Only headers are read on start up.
+    _header = struct.Struct('<BHII')
+
+    first_block = 1
+    last_block = 2
+
+    def __init__(self, path, urls_per_block=2048):
+        self._path = path
+        self._urls_per_block = urls_per_block
+        self._directory = {}
+        self._identity = None
+        self._lock = _path_lock(path)
+        with self._lock:
+            self._load()
+
+    @classmethod
+    def shared(cls, path):
+        # Lists fetched in the background may still be added after their
+        # iterator was closed, so every iterator of this process uses the
+        # same store. A new one is only loaded when the file was removed
+        # or replaced in the meantime.
+        key = os.path.abspath(path)
+        with _registry_lock:
+            store = _stores.get(key)
+        if store is not None and store._is_current():
+            return store
+
+        store = cls(path)
+        with _registry_lock:
+            _stores[key] = store
+        return store
+
+    def _is_current(self):
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return not self._directory
+        return (stat.st_dev, stat.st_ino) == self._identity
+
+    def __contains__(self, wn_id):
+        return wn_id in self._directory
+
+    def __len__(self):
+        return len(self._directory)
+
+    def count(self, wn_id):
+        return sum(block.count for block in self._directory[wn_id])
+
+    def add(self, wn_id, urls, append=False):
+        encoded_id = wn_id.encode('utf-8')
+        urls = (url.strip() for url in urls)
+        urls = (url for url in urls if url)
+
+        with self._lock:
+            if append:
+                blocks = list(self._directory.get(wn_id, []))
+            else:
+                blocks = []
+
+            with open(self._path, 'ab') as f:
+                self._identity = self._file_identity(f)
+                start_size = f.tell()
+                try:
+                    flags = 0 if append else self.first_block
+                    chunk = list(islice(urls, self._urls_per_block))
+                    while True:
+                        next_chunk = list(islice(urls, self._urls_per_block))
+                        if not next_chunk:
+                            flags |= self.last_block
+
+                        blocks.append(
+                            self._write_block(f, flags, encoded_id, chunk)
+                        )
+
+                        if not next_chunk:
+                            break
+                        chunk = next_chunk
+                        flags = 0
+                    f.flush()
+                except BaseException:
+                    f.truncate(start_size)
+                    raise
+
+            self._directory[wn_id] = blocks
+
+    def _file_identity(self, f):
+        stat = os.fstat(f.fileno())
+        return stat.st_dev, stat.st_ino
+
+    def _write_block(self, f, flags, encoded_id, urls):
+        payload = zlib.compress('\n'.join(urls).encode('utf-8'))
+        f.write(self._header.pack(flags, len(encoded_id), len(urls),
+                                  len(payload)))
+        f.write(encoded_id)
+        block = Block(offset=f.tell(), size=len(payload), count=len(urls))
+        f.write(payload)
+        return block
+
+    def urls(self, wn_id, start=0):
+        blocks = self._directory[wn_id]
+
+        skipped = 0
+        first_block = 0
+        while first_block < len(blocks) and \
+                skipped + blocks[first_block].count <= start:
+            skipped += blocks[first_block].count
+            first_block += 1
+
+        if first_block == len(blocks):
+            return
+
+        with open(self._path, 'rb') as f:
+            offset_in_block = start - skipped
+            for block in blocks[first_block:]:
+                if block.count == 0:
+                    continue
+
+                f.seek(block.offset)
+                payload = zlib.decompress(f.read(block.size))
+                lines = payload.decode('utf-8', errors='replace').split('\n')
+                for url in lines[offset_in_block:]:
+                    yield url
+                offset_in_block = 0
+
+    def _load(self):
+        if not os.path.isfile(self._path):
+            return
+
+        store_size = os.path.getsize(self._path)
+        pending = {}
+        valid_size = 0
+
+        with open(self._path, 'rb') as f:
+            self._identity = self._file_identity(f)
+            while True:
+                header = f.read(self._header.size)
+                if len(header) < self._header.size:
+                    break
+
+                flags, id_length, count, size = self._header.unpack(header)
+                encoded_id = f.read(id_length)
+                offset = f.tell()
+                if len(encoded_id) < id_length or offset + size > store_size:
+                    break
+
+                wn_id = encoded_id.decode('utf-8')
+                if flags & self.first_block:
+                    pending[wn_id] = []
+                elif wn_id not in pending:
+                    pending[wn_id] = list(self._directory.get(wn_id, []))
+
+                pending[wn_id].append(Block(offset=offset, size=size,
+                                            count=count))
+                f.seek(offset + size)
+
+                if flags & self.last_block:
+                    self._directory[wn_id] = pending.pop(wn_id)
+                    valid_size = f.tell()
+
+        if valid_size < store_size:
+            # the tail of the file holds a category that was only
+            # partially written, new blocks will be appended in its place
+            with open(self._path, 'r+b') as f:
+                f.truncate(valid_size)
+
+
+class Block:
+    __slots__ = ('offset', 'size', 'count')
+
+    def __init__(self, offset, size, count):
+        self.offset = offset
+        self.size = size
+        self.count = count
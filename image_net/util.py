@@ -20,8 +20,9 @@ from urllib.parse import urlparse
 
 
 class Url2FileName:
-    def __init__(self, starting_index=1):
+    def __init__(self, starting_index=1, step=1):
         self._index = starting_index
+        self._step = step
 
     def convert(self, url):
         if url.rstrip() != url:
@@ -32,7 +33,7 @@ class Url2FileName:
 
         converted_name = str(self._index) + extension
 
-        self._index += 1
+        self._index += self._step
         return converted_name
 
     def _url_to_file_name(self, url):
@@ -25,12 +25,29 @@ function updateControlsValues(stateData) {
     time_left_id.value = stateData.timeLeft;
     progress_info_box.imagesLoaded = stateData.imagesLoaded;
     progress_info_box.failures = stateData.failures;
-    failed_urls_model.model = stateData.failedUrls;
     bar.value = parseFloat(stateData.progress);
 
     errors_id.text = String(stateData.errors);
 }
 
+var maxFailedUrlsShown = 1000;
+
+function applyProgress(delta) {
+    time_left_id.value = delta.timeLeft;
+    progress_info_box.imagesLoaded = delta.imagesLoaded;
+    progress_info_box.failures = delta.failures;
+    bar.value = parseFloat(delta.progress);
+
+    for (var i = 0; i < delta.failedUrls.length; i++) {
+        failed_urls_list.append({"url": delta.failedUrls[i]});
+    }
+
+    var extra = failed_urls_list.count - maxFailedUrlsShown;
+    if (extra > 0) {
+        failed_urls_list.remove(0, extra);
+    }
+}
+
 function showInputElements() {
     location.visible = true;
     total_amount_id.visible = true;
@@ -72,6 +89,7 @@ function InitialState() {
         showInputElements();
 
         hideProgress();
+        failed_urls_list.clear();
         complete_label.toastVisible = false;
     };
 
@@ -93,6 +111,7 @@ function ReadyState() {
         showInputElements();
 
         hideProgress();
+        failed_urls_list.clear();
         complete_label.toastVisible = false;
     };
 
@@ -20,6 +20,7 @@ import sys
 from PyQt5.QtCore import QUrl
 from PyQt5.QtQml import QQmlApplicationEngine
 from PyQt5.QtGui import QGuiApplication
+from image_net import metrics
 from util.py_qml_glue import Worker
 
 logging.basicConfig(filename='MLpedia.log', level=logging.INFO)
@@ -39,4 +40,7 @@ if __name__ == '__main__':
     if not engine.rootObjects():
         sys.exit(-1)
 
-    sys.exit(app.exec_())
+    exporters = metrics.start_exporters()
+    code = app.exec_()
+    metrics.stop_exporters(exporters)
+    sys.exit(code)
@@ -49,6 +49,26 @@ Window {
             labelText: "# of images per category"
         }
 
+        Row {
+            spacing: 10
+
+            Text {
+                text: "Categories"
+                width: 200
+                anchors.verticalCenter: parent.verticalCenter
+            }
+
+            ComboBox {
+                id: categories_id
+                width: 300
+                textRole: "text"
+                model: ListModel {
+                    ListElement { text: "All categories"; kind: "all" }
+                    ListElement { text: "ILSVRC-2012 (1000 categories)"; kind: "ilsvrc2012" }
+                }
+            }
+        }
+
         Text {
             id: errors_id
             width: parent.width
@@ -116,9 +136,11 @@ Window {
 
             ListView {
                 id: failed_urls_model
-                model: []
+                model: ListModel {
+                    id: failed_urls_list
+                }
                 delegate: ItemDelegate {
-                    text: modelData
+                    text: url
                 }
             }
         }
@@ -128,6 +150,7 @@ Window {
     Connections {
         target: downloader
         onStateChanged: updateUI()
+        onProgressChanged: AppManagement.applyProgress(JSON.parse(delta))
         onExceptionRaised: showErrorDialog(message)
     }
 
@@ -144,7 +167,8 @@ Window {
     function startDownload() {
         downloader.configure(location.download_path,
                 total_amount_id.value,
-                images_per_category_spnibox.value
+                images_per_category_spnibox.value,
+                categories_id.model.get(categories_id.currentIndex).kind
         );
         downloader.start_download()
     }
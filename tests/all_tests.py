@@ -21,6 +21,11 @@ import sys
 import registered_test_cases, batch_download_tests
 import download_manager_tests
 import iterator_tests, stateful_downloader_tests, threading_downloader_tests
+import url_store_tests, prefetch_tests, categories_tests, sampling_tests
+import state_journal_tests, url_status_tests, sharding_tests
+import distributed_tests, cli_tests, config_tests, concurrency_tests
+import progress_channel_tests, pipeline_tests, counts_tests, metrics_tests
+import tracing_tests
 import util_tests
 import app_state_tests
 import state_manager_tests
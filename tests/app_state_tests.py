@@ -29,6 +29,8 @@ from registered_test_cases import Meta
 from config import config
 from util.app_state import AppState, DownloadConfiguration, ProgressInfo, Result, InternalState
 from image_net.iterators import Position
+from image_net.categories import CategorySelection
+from image_net.sampling import Sampling
 
 
 class AppStateTests(unittest.TestCase, metaclass=Meta):
@@ -105,6 +107,140 @@ class AppStateTests(unittest.TestCase, metaclass=Meta):
         self.assertEqual(internal.category_counts, counts)
         self.assertEqual(internal.file_index, 322)
 
+    def test_cursors_persist(self):
+        app_state = AppState()
+
+        internal = InternalState(iterator_position=Position(5, 0),
+                                 category_counts={},
+                                 file_index=1,
+                                 cursors=[Position(2, 7), Position(4, 1)])
+        app_state.set_internal_state(internal)
+        app_state.save()
+
+        internal = AppState().internal_state
+        self.assertEqual(internal.iterator_position, Position(5, 0))
+        self.assertEqual(internal.cursors, [Position(2, 7), Position(4, 1)])
+
+    def test_checkpoint_is_replayed_from_journal(self):
+        app_state = AppState()
+        app_state.save()
+        snapshot_size = os.path.getsize(config.app_state_path)
+
+        app_state.update_progress(Result(failed_urls=['f'],
+                                         succeeded_urls=['s1', 's2']))
+        app_state.internal_state.iterator_position = Position(4, 2)
+        app_state.internal_state.update_counts({'n1': 2})
+        app_state.add_error('Some error')
+        app_state.checkpoint()
+
+        self.assertEqual(os.path.getsize(config.app_state_path),
+                         snapshot_size)
+
+        app_state = AppState()
+        self.assertEqual(app_state.progress_info.total_downloaded, 2)
+        self.assertEqual(app_state.progress_info.total_failed, 1)
+        self.assertEqual(app_state.internal_state.iterator_position,
+                         Position(4, 2))
+        self.assertEqual(app_state.internal_state.category_counts,
+                         {'n1': 2})
+        self.assertEqual(app_state.errors, ['Some error'])
+
+    def test_journal_holds_only_changed_counts(self):
+        app_state = AppState()
+        app_state.internal_state.category_counts = {'n1': 1, 'n2': 5}
+        app_state.save()
+
+        app_state.internal_state.update_counts({'n2': 6})
+        app_state.checkpoint()
+
+        with open(config.app_state_journal_path) as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record['internal_state']['category_counts'],
+                         {'n2': 6})
+
+        counts = AppState().internal_state.category_counts
+        self.assertEqual(counts, {'n1': 1, 'n2': 6})
+
+    def test_sample_sizes_are_journaled_once(self):
+        app_state = AppState()
+        app_state.save()
+
+        app_state.internal_state.set_sample_sizes([3, 0, 2])
+        app_state.checkpoint()
+        app_state.internal_state.file_index = 4
+        app_state.checkpoint()
+
+        with open(config.app_state_journal_path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records[0]['internal_state']['sample_sizes'],
+                         [3, 0, 2])
+        self.assertNotIn('sample_sizes', records[1]['internal_state'])
+
+        app_state = AppState()
+        self.assertEqual(app_state.internal_state.sample_sizes, [3, 0, 2])
+        self.assertEqual(app_state.internal_state.file_index, 4)
+
+    def test_journal_is_compacted(self):
+        app_state = AppState()
+        app_state.save()
+
+        for i in range(config.state_compaction_interval):
+            app_state.internal_state.file_index = i
+            app_state.checkpoint()
+
+        self.assertFalse(os.path.exists(config.app_state_journal_path))
+        self.assertEqual(AppState().internal_state.file_index,
+                         config.state_compaction_interval - 1)
+
+    def test_background_checkpoint_keeps_the_state_it_was_made_with(self):
+        app_state = AppState()
+        app_state.save()
+
+        written = []
+        app_state.internal_state.file_index = 3
+        app_state.checkpoint(background=True,
+                             on_written=lambda: written.append(True))
+        app_state.internal_state.file_index = 4
+        app_state.wait_for_checkpoints()
+
+        self.assertEqual(written, [True])
+        self.assertEqual(AppState().internal_state.file_index, 3)
+        self.assertEqual(app_state.journal_metrics.items, 1)
+
+    def test_failed_background_checkpoint_is_raised_by_the_next_one(self):
+        app_state = AppState()
+        app_state.save()
+
+        def fail():
+            raise OSError('No space left on device')
+
+        app_state.checkpoint(background=True, on_written=fail)
+        while app_state.journal_metrics.items < 1:
+            time.sleep(0.01)
+
+        self.assertRaises(OSError, app_state.checkpoint, background=True)
+        app_state.checkpoint(background=True)
+        app_state.wait_for_checkpoints()
+
+    def test_journal_of_older_state_is_ignored(self):
+        app_state = AppState()
+        app_state.save()
+        app_state.internal_state.file_index = 7
+        app_state.checkpoint()
+
+        with open(config.app_state_journal_path) as f:
+            stale_record = f.read()
+
+        app_state.set_configuration(
+            DownloadConfiguration(number_of_images=5, images_per_category=1,
+                                  download_destination='temp')
+        )
+        app_state.save()
+        with open(config.app_state_journal_path, 'w') as f:
+            f.write(stale_record)
+
+        self.assertEqual(AppState().internal_state.file_index, 1)
+
     def test_with_corrupted_json_file(self):
         os.makedirs(config.app_data_folder)
         path = config.app_state_path
@@ -129,6 +265,121 @@ class AppStateTests(unittest.TestCase, metaclass=Meta):
         self.assertEqual(conf.number_of_images, 100)
         self.assertEqual(conf.images_per_category, 90)
 
+    def test_state_without_checksum_is_loaded(self):
+        app_state = AppState()
+        app_state.internal_state.file_index = 12
+        app_state.save()
+
+        with open(config.app_state_path) as f:
+            header, _, body = f.read().partition('\n')
+        with open(config.app_state_path, 'w') as f:
+            f.write(body)
+
+        app_state = AppState()
+        self.assertEqual(app_state.internal_state.file_index, 12)
+        self.assertEqual(app_state.errors, [])
+
+    def test_falls_back_to_previous_checkpoint(self):
+        app_state = AppState()
+        app_state.internal_state.file_index = 5
+        app_state.save()
+        app_state.internal_state.file_index = 6
+        app_state.save()
+
+        with open(config.app_state_path, 'r+') as f:
+            f.truncate(os.path.getsize(config.app_state_path) // 2)
+
+        app_state = AppState()
+        self.assertEqual(app_state.internal_state.file_index, 5)
+        self.assertEqual(len(app_state.errors), 1)
+
+    def test_previous_checkpoint_is_kept_beside_the_current_one(self):
+        app_state = AppState()
+        app_state.internal_state.file_index = 5
+        app_state.save()
+        app_state.internal_state.file_index = 6
+        app_state.save()
+
+        self.assertTrue(os.path.isfile(config.app_state_path))
+        self.assertTrue(os.path.isfile(config.app_state_backup_path))
+        self.assertFalse(
+            os.path.exists(config.app_state_backup_path + '.part')
+        )
+        self.assertEqual(AppState().internal_state.file_index, 6)
+
+    def test_fallback_replays_journal_of_previous_checkpoint(self):
+        app_state = AppState()
+        app_state.internal_state.file_index = 5
+        app_state.save()
+        app_state.internal_state.file_index = 6
+        app_state.checkpoint()
+
+        # the process died while writing the next full state, before the
+        # journal was cleared
+        shutil.copyfile(config.app_state_path, config.app_state_backup_path)
+        with open(config.app_state_path, 'w') as f:
+            f.write('sha256 0\n{}')
+
+        app_state = AppState()
+        self.assertEqual(app_state.internal_state.file_index, 6)
+        self.assertEqual(len(app_state.errors), 1)
+        self.assertTrue(os.path.isfile(config.app_state_path + '.corrupt'))
+
+        self.assertEqual(AppState().errors, app_state.errors)
+
+    def test_checksum_mismatch_falls_back(self):
+        app_state = AppState()
+        app_state.internal_state.file_index = 5
+        app_state.save()
+        app_state.internal_state.file_index = 6
+        app_state.save()
+
+        with open(config.app_state_path) as f:
+            s = f.read()
+        with open(config.app_state_path, 'w') as f:
+            f.write(s.replace('"file_index": 6', '"file_index": 9'))
+
+        self.assertEqual(AppState().internal_state.file_index, 5)
+
+    def test_damaged_state_without_previous_checkpoint(self):
+        app_state = AppState()
+        app_state.internal_state.file_index = 5
+        app_state.save()
+
+        with open(config.app_state_path, 'w') as f:
+            f.write('sha256 0\n{}')
+
+        app_state = AppState()
+        self.assertEqual(app_state.internal_state.file_index, 1)
+        self.assertEqual(
+            app_state.errors,
+            ['Saved download state is damaged and could not be restored']
+        )
+        self.assertTrue(os.path.isfile(config.app_state_path + '.corrupt'))
+
+    def test_worker_state_is_kept_apart(self):
+        path = config.shard_state_path(1)
+        app_state = AppState(path)
+        app_state.internal_state.file_index = 8
+        app_state.save()
+
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(AppState(path).internal_state.file_index, 8)
+        self.assertEqual(AppState().internal_state.file_index, 1)
+
+    def test_new_download_drops_worker_states(self):
+        AppState(config.shard_state_path(0)).save()
+
+        app_state = AppState()
+        app_state.set_configuration(
+            DownloadConfiguration(number_of_images=5, images_per_category=1,
+                                  download_destination='temp', shards=2)
+        )
+        app_state.save()
+
+        self.assertFalse(os.path.exists(config.shards_folder))
+        self.assertEqual(AppState().download_configuration.shards, 2)
+
     def test_progress(self):
         app_state = AppState()
 
@@ -302,3 +553,58 @@ class DownloadConfigurationTests(unittest.TestCase, metaclass=Meta):
                                      download_destination='temp')
         self.assertTrue(conf.is_valid)
         self.assertEqual(conf.errors, [])
+
+    def test_categories_persist(self):
+        app_state = AppState()
+
+        selection = CategorySelection.from_list(['n1', 'n2'])
+        conf = DownloadConfiguration(number_of_images=10,
+                                     images_per_category=5,
+                                     download_destination='temp',
+                                     categories=selection)
+        app_state.set_configuration(conf)
+        app_state.save()
+
+        categories = AppState().download_configuration.categories
+        self.assertEqual(categories.kind, 'list')
+        self.assertEqual(categories.word_net_ids, ['n1', 'n2'])
+
+    def test_interleaved_categories_persist(self):
+        app_state = AppState()
+
+        conf = DownloadConfiguration(number_of_images=10,
+                                     images_per_category=5,
+                                     download_destination='temp',
+                                     interleaved_categories=4)
+        app_state.set_configuration(conf)
+        app_state.save()
+
+        conf = AppState().download_configuration
+        self.assertEqual(conf.interleaved_categories, 4)
+
+    def test_sampling_persists(self):
+        app_state = AppState()
+
+        conf = DownloadConfiguration(number_of_images=10,
+                                     images_per_category=5,
+                                     download_destination='temp',
+                                     sampling=Sampling.stratified(seed=9))
+        app_state.set_configuration(conf)
+        app_state.internal_state.sample_offset = 41
+        app_state.save()
+
+        app_state = AppState()
+        sampling = app_state.download_configuration.sampling
+        self.assertTrue(sampling.is_stratified)
+        self.assertEqual(sampling.seed, 9)
+        self.assertEqual(app_state.internal_state.sample_offset, 41)
+
+    def test_empty_list_of_categories_is_not_valid(self):
+        conf = DownloadConfiguration(
+            number_of_images=1, images_per_category=1,
+            download_destination='temp',
+            categories=CategorySelection.from_list([])
+        )
+        self.assertFalse(conf.is_valid)
+        self.assertEqual(conf.errors,
+                         ['List of categories to download is empty'])
@@ -23,6 +23,7 @@ import shutil
 sys.path.insert(0, './')
 
 from image_net import batch_download
+from image_net.url_status import UrlStatusStore
 from util.app_state import DownloadConfiguration
 
 from registered_test_cases import Meta
@@ -286,3 +287,219 @@ class BatchDownloadTests(unittest.TestCase, metaclass=Meta):
         second = os.path.join(self.dataset_location, 'cats', '2.png')
         third = os.path.join(self.dataset_location, 'dogs', '3.gif')
         self.assertEqual(paths, [first, second, third])
+
+    def test_admission_counts_pending_urls(self):
+        class BatchDownloadMocked(batch_download.BatchDownload):
+            def do_download(self, urls, destinations):
+                return [], urls
+
+        conf = DownloadConfiguration(number_of_images=100,
+                                     images_per_category=2,
+                                     download_destination=self.dataset_location,
+                                     batch_size=100)
+        d = BatchDownloadMocked(conf)
+
+        for i in range(4):
+            self.assertFalse(d.has_enough_pending('n1'))
+            d.add('n1', 'url{}'.format(i))
+            self.assertFalse(d.batch_ready)
+
+        self.assertTrue(d.has_enough_pending('n1'))
+        d.add('n1', 'url4')
+        self.assertTrue(d.has_deferred)
+        self.assertFalse(d.batch_ready)
+        self.assertEqual(len(d.waiting), 5)
+
+        failed, downloaded = d.flush()
+        self.assertEqual(downloaded, ['url0', 'url1'])
+        self.assertEqual(d.category_counts, {'n1': 2})
+        self.assertTrue(d.is_empty)
+
+    def test_deferred_url_is_added_after_flush(self):
+        class BatchDownloadMocked(batch_download.BatchDownload):
+            def do_download(self, urls, destinations):
+                failed_urls = [url for url in urls if url != 'url3']
+                succeeded_urls = [url for url in urls if url == 'url3']
+                return failed_urls, succeeded_urls
+
+        conf = DownloadConfiguration(number_of_images=100,
+                                     images_per_category=1,
+                                     download_destination=self.dataset_location,
+                                     batch_size=100)
+        d = BatchDownloadMocked(conf)
+
+        d.add('n1', 'url1')
+        d.add('n1', 'url2')
+        d.add('n1', 'url3')
+        self.assertTrue(d.has_deferred)
+
+        failed, downloaded = d.flush()
+        self.assertEqual(failed, ['url1', 'url2'])
+        self.assertFalse(d.has_deferred)
+        self.assertFalse(d.is_empty)
+
+        failed, downloaded = d.flush()
+        self.assertEqual(downloaded, ['url3'])
+        self.assertEqual(d.category_counts, {'n1': 1})
+
+    def test_admission_follows_success_rate(self):
+        class BatchDownloadMocked(batch_download.BatchDownload):
+            def do_download(self, urls, destinations):
+                return urls, []
+
+        conf = DownloadConfiguration(number_of_images=100,
+                                     images_per_category=10,
+                                     download_destination=self.dataset_location,
+                                     batch_size=1000)
+        d = BatchDownloadMocked(conf)
+
+        for i in range(20):
+            d.add('n1', 'url{}'.format(i))
+        d.flush()
+
+        count = 0
+        while not d.has_deferred:
+            d.add('n2', 'x{}'.format(count))
+            count += 1
+
+        self.assertGreater(count, 20)
+
+    def test_surplus_downloads_are_cancelled(self):
+        conf = DownloadConfiguration(number_of_images=100,
+                                     images_per_category=1,
+                                     download_destination=self.dataset_location,
+                                     batch_size=100)
+        d = batch_download.BatchDownload(conf)
+
+        d.add('n1', 'url1.jpg')
+        d.add('n1', 'url2.jpg')
+        failed, downloaded = d.flush()
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(downloaded), 1)
+        path = os.path.join(self.dataset_location, 'n1')
+        self.assertEqual(len(os.listdir(path)), 1)
+
+    def test_likely_good_urls_are_started_first(self):
+        class BatchDownloadMocked(batch_download.BatchDownload):
+            def do_download(self, urls, destinations):
+                self.started = list(zip(urls, destinations))
+                succeeded = [url for url in urls if 'good' in url]
+                failed = [url for url in urls if 'good' not in url]
+                return failed, succeeded
+
+        conf = DownloadConfiguration(number_of_images=100,
+                                     images_per_category=100,
+                                     download_destination=self.dataset_location,
+                                     batch_size=100)
+        d = BatchDownloadMocked(conf)
+
+        for i in range(5):
+            d.add('n1', 'http://bad.com/{}.jpg'.format(i))
+            d.add('n1', 'http://good.com/{}.jpg'.format(i))
+        d.flush()
+
+        d.add('n1', 'http://bad.com/x.jpg')
+        d.add('n1', 'http://good.com/y.jpg')
+        d.flush()
+
+        url, path = d.started[0]
+        self.assertEqual(url, 'http://good.com/y.jpg')
+        self.assertTrue(path.endswith('12.jpg'))
+
+    def test_url_statuses(self):
+        class BatchDownloadMocked(batch_download.BatchDownload):
+            def do_download(self, urls, destinations):
+                self._failure_reasons = {'url2': 'HTTP 404'}
+                return ['url2'], ['url1']
+
+        path = os.path.join('temp', 'statuses.sqlite')
+        if os.path.exists(path):
+            os.remove(path)
+        statuses = UrlStatusStore(path)
+
+        conf = DownloadConfiguration(number_of_images=100,
+                                     images_per_category=100,
+                                     download_destination=self.dataset_location,
+                                     batch_size=100)
+        d = BatchDownloadMocked(conf, url_statuses=statuses)
+        d.add('n1', 'url1')
+        d.add('n1', 'url2')
+        d.flush()
+
+        self.assertEqual(statuses.status('n1', 'url1'),
+                         UrlStatusStore.in_flight)
+        d.commit_statuses()
+        self.assertTrue(statuses.is_fetched('n1', 'url1'))
+        self.assertEqual(statuses.reason('n1', 'url2'), 'HTTP 404')
+
+        d.add('n1', 'url1')
+        self.assertTrue(d.is_empty)
+
+        statuses.close()
+        os.remove(path)
+
+    def test_interrupted_urls_are_kept(self):
+        class BatchDownloadMocked(batch_download.BatchDownload):
+            def do_download(self, urls, destinations):
+                self._interrupted_urls = ['url2', 'url3']
+                return [], ['url1']
+
+        conf = DownloadConfiguration(number_of_images=100,
+                                     images_per_category=100,
+                                     download_destination=self.dataset_location,
+                                     batch_size=100)
+        d = BatchDownloadMocked(conf)
+        d.add('n1', 'url1')
+        d.add('n1', 'url2')
+        d.add('n2', 'url3')
+        failed_urls, succeeded_urls = d.flush()
+
+        self.assertEqual(succeeded_urls, ['url1'])
+        self.assertEqual(sorted(d.interrupted),
+                         [('n1', 'url2'), ('n2', 'url3')])
+        self.assertEqual(d.category_counts, {'n1': 1, 'n2': 0})
+        self.assertTrue(d.is_empty)
+
+        d.restore(d.interrupted)
+        self.assertFalse(d.is_empty)
+        self.assertEqual(sorted(d._url_batch()), ['url2', 'url3'])
+
+
+class UrlSchedulerTests(unittest.TestCase, metaclass=Meta):
+    def test_priority_follows_host(self):
+        scheduler = batch_download.UrlScheduler()
+        for i in range(10):
+            scheduler.update('n1', 'http://good.com/a', success=True)
+            scheduler.update('n1', 'http://bad.com/a', success=False)
+
+        good = scheduler.priority('n1', 'http://good.com/b')
+        bad = scheduler.priority('n1', 'http://bad.com/b')
+        unknown = scheduler.priority('n1', 'http://other.com/b')
+        self.assertGreater(good, unknown)
+        self.assertGreater(unknown, bad)
+
+    def test_priority_follows_category(self):
+        scheduler = batch_download.UrlScheduler()
+        for i in range(10):
+            scheduler.update('n1', 'http://a.com/{}'.format(i), success=True)
+            scheduler.update('n2', 'http://b.com/{}'.format(i), success=False)
+
+        self.assertGreater(scheduler.priority('n1', 'http://c.com/x'),
+                           scheduler.priority('n2', 'http://c.com/x'))
+
+    def test_dead_host(self):
+        scheduler = batch_download.UrlScheduler()
+        for i in range(scheduler.dead_host_attempts):
+            self.assertFalse(scheduler.is_dead('http://dead.com/x'))
+            scheduler.update('n1', 'http://dead.com/{}'.format(i),
+                             success=False)
+
+        self.assertTrue(scheduler.is_dead('http://DEAD.com/y'))
+        self.assertEqual(scheduler.priority('n1', 'http://dead.com/y'),
+                         scheduler.dead_host_priority)
+        self.assertGreater(scheduler.priority('n1', 'http://c.com/y'),
+                           scheduler.dead_host_priority)
+
+        scheduler.update('n1', 'http://dead.com/z', success=True)
+        self.assertFalse(scheduler.is_dead('http://dead.com/y'))
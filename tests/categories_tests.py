@@ -0,0 +1,118 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import shutil
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from config import config
+from image_net.categories import CategorySelection, \
+    CategoriesUnavailableError, import_ilsvrc2012_ids
+
+
+class IndexResponse:
+    status_code = 200
+
+    def json(self):
+        return {'0': ['n01440764', 'tench'], '1': ['n01443537', 'goldfish']}
+
+
+class CategorySelectionTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        if os.path.exists(config.app_data_folder):
+            shutil.rmtree(config.app_data_folder)
+        os.makedirs(config.app_data_folder)
+
+    def tearDown(self):
+        if os.path.exists(config.app_data_folder):
+            shutil.rmtree(config.app_data_folder)
+
+    def test_all_categories(self):
+        self.assertIsNone(CategorySelection().resolve())
+
+    def test_explicit_list(self):
+        selection = CategorySelection.from_list(['n1', 'n2', 'n1'])
+        self.assertEqual(selection.resolve(), {'n1', 'n2'})
+
+    def test_ilsvrc2012_list(self):
+        with open(config.ilsvrc2012_wn_ids_path, 'w') as f:
+            f.write('n01440764 tench, Tinca tinca\nn01443537\n\n')
+
+        selection = CategorySelection.ilsvrc2012()
+        self.assertEqual(selection.resolve(), {'n01440764', 'n01443537'})
+
+    def test_missing_ilsvrc2012_list_is_fetched(self):
+        with mock.patch('requests.get', lambda *args, **kwargs:
+                        IndexResponse()):
+            selection = CategorySelection.ilsvrc2012()
+            self.assertEqual(selection.resolve(), {'n01440764', 'n01443537'})
+
+        with open(config.ilsvrc2012_wn_ids_path) as f:
+            self.assertEqual(f.read(), 'n01440764\nn01443537\n')
+
+    def test_ilsvrc2012_list_is_unavailable(self):
+        def fail(*args, **kwargs):
+            raise IOError('Network is unreachable')
+
+        with mock.patch('requests.get', fail):
+            selection = CategorySelection.ilsvrc2012()
+            self.assertRaises(CategoriesUnavailableError, selection.resolve)
+        self.assertFalse(os.path.exists(config.ilsvrc2012_wn_ids_path))
+
+    def test_import_ilsvrc2012_list(self):
+        path = os.path.join(config.app_data_folder, 'LOC_synset_mapping.txt')
+        with open(path, 'w') as f:
+            f.write('n01440764 tench, Tinca tinca\n')
+
+        import_ilsvrc2012_ids(path)
+        selection = CategorySelection.ilsvrc2012()
+        self.assertEqual(selection.resolve(), {'n01440764'})
+
+    def test_subtree_uses_cached_hyponyms(self):
+        with open(config.hyponyms_path('n1'), 'w') as f:
+            f.write('n1\r\n-n2\r\n-n3\r\n')
+
+        def fail(*args, **kwargs):
+            raise AssertionError('Hyponyms were fetched')
+
+        with mock.patch('requests.get', fail):
+            selection = CategorySelection.subtree('n1')
+            self.assertEqual(selection.resolve(), {'n1', 'n2', 'n3'})
+
+    def test_subtree_is_unavailable(self):
+        def fail(*args, **kwargs):
+            raise IOError('Network is unreachable')
+
+        with mock.patch('requests.get', fail):
+            selection = CategorySelection.subtree('n1')
+            self.assertRaises(CategoriesUnavailableError, selection.resolve)
+            self.assertFalse(os.path.exists(config.hyponyms_path('n1')))
+
+    def test_dict_round_trip(self):
+        selection = CategorySelection.subtree('n1')
+        restored = CategorySelection.from_dict(selection.as_dict())
+
+        self.assertEqual(restored.kind, 'subtree')
+        self.assertEqual(restored.root, 'n1')
+
+    def test_unknown_kind(self):
+        self.assertRaises(ValueError, lambda: CategorySelection('some'))
@@ -0,0 +1,177 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+from contextlib import redirect_stdout, redirect_stderr
+from unittest import mock
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from config import config
+import cli
+from util.app_state import AppState
+
+
+class CliTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        if os.path.exists(config.app_data_folder):
+            shutil.rmtree(config.app_data_folder)
+        os.makedirs(config.app_data_folder)
+
+        image_net_home = os.path.join('temp', 'image_net_home')
+        if os.path.exists(image_net_home):
+            shutil.rmtree(image_net_home)
+        os.makedirs(image_net_home)
+        self.image_net_home = image_net_home
+
+    def _run(self, *argv):
+        out = io.StringIO()
+        with redirect_stdout(out), redirect_stderr(io.StringIO()):
+            code = cli.main(list(argv))
+        return code, out.getvalue()
+
+    def _configure(self, images=10):
+        return self._run('configure', self.image_net_home,
+                         '--images', str(images), '--per-category', '10',
+                         '--batch-size', '1', '--processes', '1')
+
+    def test_configure(self):
+        code, _ = self._configure()
+        self.assertEqual(code, 0)
+
+        app_state = AppState()
+        self.assertTrue(app_state.configured)
+        self.assertEqual(app_state.download_configuration.number_of_images,
+                         10)
+        self.assertEqual(app_state.download_configuration.download_destination,
+                         os.path.abspath(self.image_net_home))
+
+    def test_configure_with_categories(self):
+        code, _ = self._run('configure', self.image_net_home,
+                            '--images', '10', '--per-category', '10',
+                            '--categories', 'n392093', 'n38203')
+        self.assertEqual(code, 0)
+
+        categories = AppState().download_configuration.categories
+        self.assertEqual(categories.kind, 'list')
+        self.assertEqual(categories.word_net_ids, ['n392093', 'n38203'])
+
+    def test_configure_with_local_ilsvrc2012_list(self):
+        path = os.path.join('temp', 'ilsvrc2012_wnids.txt')
+        with open(path, 'w') as f:
+            f.write('n392093\n')
+
+        code, _ = self._run('configure', self.image_net_home,
+                            '--images', '10', '--per-category', '10',
+                            '--ilsvrc2012', path)
+        self.assertEqual(code, 0)
+
+        categories = AppState().download_configuration.categories
+        self.assertEqual(categories.resolve(), {'n392093'})
+
+    def test_configure_rejects_missing_ilsvrc2012_list(self):
+        code, _ = self._run('configure', self.image_net_home,
+                            '--images', '10', '--per-category', '10',
+                            '--ilsvrc2012', 'temp/missing_list.txt')
+        self.assertEqual(code, 1)
+        self.assertFalse(AppState().configured)
+
+    def test_configure_with_sampling(self):
+        code, _ = self._run('configure', self.image_net_home,
+                            '--images', '10', '--per-category', '10',
+                            '--sampling', 'uniform', '--seed', '7')
+        self.assertEqual(code, 0)
+
+        sampling = AppState().download_configuration.sampling
+        self.assertTrue(sampling.is_uniform)
+        self.assertEqual(sampling.seed, 7)
+
+    def test_configure_rejects_invalid_configuration(self):
+        code, _ = self._run('configure', 'temp/missing_folder',
+                            '--images', '10', '--per-category', '10')
+        self.assertEqual(code, 1)
+        self.assertFalse(AppState().configured)
+
+    def test_start_downloads_everything(self):
+        self._configure()
+        code, _ = self._run('start')
+        self.assertEqual(code, 0)
+
+        app_state = AppState()
+        self.assertTrue(app_state.progress_info.finished)
+        self.assertEqual(app_state.progress_info.total_downloaded, 5)
+
+        code, out = self._run('status', '--json')
+        status = json.loads(out)
+        self.assertEqual(status['state'], 'finished')
+        self.assertEqual(status['downloaded'], 5)
+
+    def test_interruption_pauses_and_resume_continues(self):
+        self._configure()
+
+        interruption = cli.Interruption()
+
+        # the pause comes while the first batch is reported
+        def print_progress(app_state):
+            interruption.request()
+
+        with redirect_stdout(io.StringIO()), \
+                mock.patch.object(cli, '_print_progress', print_progress):
+            code = cli.download(AppState(), interruption)
+        self.assertEqual(code, 0)
+
+        app_state = AppState()
+        self.assertFalse(app_state.progress_info.finished)
+        self.assertEqual(app_state.progress_info.total_downloaded, 1)
+
+        code, _ = self._run('start')
+        self.assertEqual(code, 1)
+
+        code, _ = self._run('resume')
+        self.assertEqual(code, 0)
+        self.assertEqual(AppState().progress_info.total_downloaded, 5)
+
+    def test_trace_file_is_written(self):
+        self._configure()
+        path = os.path.join(config.app_data_folder, 'trace.json')
+        code, _ = self._run('--trace-file', path, 'start')
+        self.assertEqual(code, 0)
+
+        with open(path) as f:
+            self.assertIn('traceEvents', json.load(f))
+
+    def test_reset(self):
+        self._configure()
+        self._run('start')
+
+        code, _ = self._run('reset')
+        self.assertEqual(code, 0)
+
+        app_state = AppState()
+        self.assertFalse(app_state.configured)
+        self.assertEqual(app_state.progress_info.total_downloaded, 0)
+
+    def test_does_not_import_qt(self):
+        code = 'import sys, cli; sys.exit("PyQt5" in sys.modules)'
+        self.assertEqual(subprocess.call([sys.executable, '-c', code]), 0)
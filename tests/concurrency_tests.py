@@ -0,0 +1,127 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from image_net.concurrency import ConcurrencyController, ConcurrencyLimit, \
+    DownloadStats
+
+
+def simulate(level, knee=100, base_latency=0.2):
+    # throughput grows with the level until the link is saturated,
+    # after that requests only wait longer
+    images = min(level, knee)
+    latency = base_latency * max(1.0, level / knee)
+    return DownloadStats(images=images, failures=0,
+                         bytes_downloaded=images * 1000, seconds=1.0,
+                         latency=latency)
+
+
+class ConcurrencyControllerTests(unittest.TestCase, metaclass=Meta):
+    def test_level_settles_around_the_knee(self):
+        controller = ConcurrencyController(level=16, min_level=1,
+                                           max_level=2000)
+        levels = []
+        for i in range(40):
+            levels.append(controller.update(simulate(controller.level)))
+
+        for level in levels[-10:]:
+            self.assertGreaterEqual(level, 60)
+            self.assertLessEqual(level, 200)
+
+    def test_grows_while_throughput_grows(self):
+        controller = ConcurrencyController(level=10, min_level=1,
+                                           max_level=2000)
+        controller.update(simulate(10, knee=1000))
+        controller.update(simulate(controller.level, knee=1000))
+        self.assertGreater(controller.level, 13)
+
+    def test_shrinks_when_errors_jump(self):
+        controller = ConcurrencyController(level=100, min_level=1,
+                                           max_level=2000)
+        controller.update(DownloadStats(images=100, failures=0,
+                                        bytes_downloaded=0, seconds=1.0,
+                                        latency=0.1))
+        level = controller.level
+        controller.update(DownloadStats(images=100, failures=100,
+                                        bytes_downloaded=0, seconds=1.0,
+                                        latency=0.1))
+        self.assertLess(controller.level, level)
+
+    def test_level_is_clamped(self):
+        controller = ConcurrencyController(level=500, min_level=2,
+                                           max_level=20)
+        self.assertEqual(controller.level, 20)
+        controller.update(simulate(20))
+        self.assertEqual(controller.level, 20)
+
+    def test_empty_batches_are_ignored(self):
+        controller = ConcurrencyController(level=10, min_level=1,
+                                           max_level=100)
+        stats = DownloadStats(images=0, failures=0, bytes_downloaded=0,
+                              seconds=0.0, latency=0)
+        self.assertEqual(controller.update(stats), 10)
+
+
+class ConcurrencyLimitTests(unittest.TestCase, metaclass=Meta):
+    def test_limit_is_respected(self):
+        limit = ConcurrencyLimit(2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            limit.acquire()
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.pop()
+            limit.release()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(max(peak), 2)
+
+    def test_raising_the_limit_wakes_waiters(self):
+        limit = ConcurrencyLimit(1)
+        limit.acquire()
+
+        acquired = threading.Event()
+
+        def wait():
+            limit.acquire()
+            acquired.set()
+
+        t = threading.Thread(target=wait)
+        t.start()
+        self.assertFalse(acquired.wait(0.05))
+
+        limit.set_limit(2)
+        self.assertTrue(acquired.wait(1))
+        t.join()
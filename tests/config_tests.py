@@ -0,0 +1,96 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import shutil
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from config import Config
+
+
+class ConfigTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.folder = os.path.join('temp', 'config')
+        if os.path.exists(self.folder):
+            shutil.rmtree(self.folder)
+        os.makedirs(self.folder)
+
+        with open('settings.json') as f:
+            self.settings = json.loads(f.read())
+
+    def _write_settings(self, name, **changes):
+        settings = dict(self.settings)
+        settings.update(changes)
+        path = os.path.join(self.folder, name)
+        with open(path, 'w') as f:
+            f.write(json.dumps(settings))
+        return path
+
+    def test_settings_are_read_on_first_use(self):
+        path = os.path.join(self.folder, 'missing.json')
+        conf = Config(path)
+        self.assertEqual(conf.app_data_folder, 'imagenet_data')
+
+        self._write_settings('missing.json', batch_size=7)
+        self.assertEqual(conf.default_batch_size, 7)
+
+    def test_settings_are_found_next_to_the_package(self):
+        conf = Config()
+        self.assertEqual(os.path.dirname(conf.settings_path),
+                         os.path.dirname(os.path.abspath('config.py')))
+
+    def test_settings_path_from_environment(self):
+        path = self._write_settings('env.json', batch_size=3)
+        with mock.patch.dict(os.environ, {Config.settings_variable: path}):
+            conf = Config()
+        self.assertEqual(conf.default_batch_size, 3)
+
+    def test_overrides(self):
+        path = self._write_settings('base.json', batch_size=3)
+        conf = Config(path)
+        conf.load(batch_size=5, track_url_status=True)
+        self.assertEqual(conf.default_batch_size, 5)
+        self.assertTrue(conf.track_url_status)
+
+    def test_missing_settings_are_taken_from_defaults(self):
+        path = os.path.join(self.folder, 'partial.json')
+        with open(path, 'w') as f:
+            f.write(json.dumps({'batch_size': 3}))
+
+        conf = Config(path)
+        self.assertEqual(conf.default_batch_size, 3)
+        self.assertEqual(conf.max_workers, self.settings['max_workers'])
+
+    def test_pool_is_created_on_first_use(self):
+        path = self._write_settings('pool.json', max_workers=2)
+        conf = Config(path)
+        self.assertIsNone(conf._pool_executor)
+
+        pool = conf.pool_executor
+        self.assertIs(conf.pool_executor, pool)
+        self.assertEqual(pool.submit(lambda: 42).result(), 42)
+        pool.shutdown()
+
+    def test_missing_attribute(self):
+        conf = Config(self._write_settings('attr.json'))
+        self.assertRaises(AttributeError, lambda: conf.no_such_setting)
@@ -0,0 +1,93 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sys
+import unittest
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from image_net.counts import CountTable, Interner
+
+
+class InternerTests(unittest.TestCase, metaclass=Meta):
+    def test_same_name_gets_same_id(self):
+        interner = Interner()
+        first = interner.id('n01440764')
+        second = interner.id(''.join(['n0144', '0764']))
+
+        self.assertEqual(first, second)
+        self.assertEqual(interner.id('n01443537'), first + 1)
+        self.assertEqual(interner.name(first), 'n01440764')
+        self.assertEqual(len(interner), 2)
+
+    def test_find_does_not_add_names(self):
+        interner = Interner()
+        self.assertIsNone(interner.find('n1'))
+        self.assertEqual(len(interner), 0)
+
+
+class CountTableTests(unittest.TestCase, metaclass=Meta):
+    def test_behaves_like_a_dict(self):
+        counts = CountTable({'n1': 2, 'n2': 0}, interner=Interner())
+        counts['n3'] = 5
+        counts.increment('n2')
+        counts.increment('n4', 3)
+
+        self.assertEqual(counts, {'n1': 2, 'n2': 1, 'n3': 5, 'n4': 3})
+        self.assertEqual(len(counts), 4)
+        self.assertIn('n3', counts)
+        self.assertNotIn('n5', counts)
+        self.assertEqual(counts.get('n5', 0), 0)
+        self.assertRaises(KeyError, lambda: counts['n5'])
+
+        del counts['n1']
+        self.assertEqual(counts.as_dict(), {'n2': 1, 'n3': 5, 'n4': 3})
+
+    def test_zero_count_is_kept(self):
+        counts = CountTable(interner=Interner())
+        counts['n1'] = 0
+        self.assertIn('n1', counts)
+        self.assertEqual(counts['n1'], 0)
+
+    def test_tables_share_the_interner(self):
+        interner = Interner()
+        first = CountTable({'n2': 1}, interner=interner)
+        second = CountTable({'n1': 1, 'n2': 2}, interner=interner)
+
+        self.assertEqual(len(interner), 2)
+        self.assertEqual(first, {'n2': 1})
+        self.assertNotIn('n1', first)
+        self.assertEqual(second, {'n1': 1, 'n2': 2})
+
+    def test_copy_is_independent(self):
+        counts = CountTable({'n1': 1}, interner=Interner())
+        copy = counts.copy()
+        copy.increment('n1')
+
+        self.assertEqual(counts['n1'], 1)
+        self.assertEqual(copy['n1'], 2)
+
+    def test_many_keys(self):
+        interner = Interner()
+        counts = CountTable(interner=interner)
+        for i in range(1000):
+            counts['n{}'.format(i)] = i
+
+        self.assertEqual(len(counts), 1000)
+        self.assertEqual(counts['n999'], 999)
+        self.assertEqual(sum(counts.values()), sum(range(1000)))
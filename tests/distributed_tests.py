@@ -0,0 +1,286 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from config import config
+from image_net.distributed import Coordinator, DistributedWorker, \
+    LeasedBudget, run_worker
+from image_net.batch_download import BatchQuota
+from util.app_state import AppState, DownloadConfiguration
+
+
+class CoordinatorTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        if os.path.exists(config.app_data_folder):
+            shutil.rmtree(config.app_data_folder)
+        os.makedirs(config.app_data_folder)
+
+        self.destinations = []
+        for name in ['worker_a', 'worker_b']:
+            destination = os.path.join('temp', name)
+            if os.path.exists(destination):
+                shutil.rmtree(destination)
+            os.makedirs(destination)
+            self.destinations.append(destination)
+
+    def _configure(self, number_of_images):
+        app_state = AppState()
+        dconf = DownloadConfiguration(number_of_images=number_of_images,
+                                      images_per_category=10,
+                                      batch_size=1,
+                                      download_destination=self.destinations[0])
+        app_state.set_configuration(dconf)
+        return app_state
+
+    def _manifest(self):
+        with open(config.manifest_path) as f:
+            return [line.rstrip('\n').split('\t') for line in f]
+
+    def test_workers_download_everything(self):
+        app_state = self._configure(10)
+        coordinator = Coordinator(app_state, units=2, host='127.0.0.1',
+                                  port=0)
+        coordinator.start()
+
+        context = multiprocessing.get_context('spawn')
+        workers = [
+            context.Process(target=run_worker,
+                            args=(coordinator.address, name, destination))
+            for name, destination in zip(['a', 'b'], self.destinations)
+        ]
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join(timeout=60)
+        finally:
+            coordinator.stop()
+
+        status = coordinator.status()
+        self.assertTrue(status['done'])
+        self.assertEqual(status['downloaded'], 5)
+        self.assertEqual(status['finished_units'], 2)
+
+        manifest = self._manifest()
+        self.assertEqual(sorted(url for _, _, url, _ in manifest),
+                         ['url1', 'url2', 'url3', 'url4', 'url5'])
+
+        for worker, wn_id, url, path in manifest:
+            destination = self.destinations[['a', 'b'].index(worker)]
+            self.assertTrue(
+                os.path.isfile(os.path.join(destination, path))
+            )
+
+        self.assertTrue(AppState().progress_info.finished)
+
+    def test_expired_lease_goes_to_another_worker(self):
+        app_state = self._configure(10)
+        coordinator = Coordinator(app_state, units=1, lease_timeout=0.1,
+                                  host='127.0.0.1', port=0)
+
+        first = coordinator.lease({'worker': 'a'})
+        self.assertEqual(coordinator.lease({'worker': 'b'}), {'done': False})
+
+        time.sleep(0.2)
+        second = coordinator.lease({'worker': 'b'})
+        self.assertEqual(second['unit']['index'], first['unit']['index'])
+
+        report = {
+            'lease_id': first['lease_id'],
+            'internal_state': None,
+            'downloads': [('n1', 'url1', 'n1/1.jpg')],
+            'failed_urls': []
+        }
+        self.assertFalse(coordinator.report(report)['ok'])
+
+        report['lease_id'] = second['lease_id']
+        self.assertTrue(coordinator.report(report)['ok'])
+        self.assertEqual(coordinator.status()['downloaded'], 1)
+        coordinator.stop()
+
+    def test_grants_do_not_exceed_number_of_images(self):
+        app_state = self._configure(3)
+        coordinator = Coordinator(app_state, units=2, host='127.0.0.1',
+                                  port=0)
+
+        first = coordinator.lease({'worker': 'a'})
+        second = coordinator.lease({'worker': 'b'})
+
+        grant = coordinator.grant({'lease_id': first['lease_id'], 'wanted': 2})
+        self.assertEqual(grant['granted'], 2)
+        grant = coordinator.grant({'lease_id': second['lease_id'],
+                                   'wanted': 2})
+        self.assertEqual(grant['granted'], 1)
+        grant = coordinator.grant({'lease_id': second['lease_id'],
+                                   'wanted': 2})
+        self.assertEqual(grant['granted'], 0)
+        coordinator.stop()
+
+    def test_images_held_by_other_workers_are_withheld(self):
+        app_state = self._configure(3)
+        coordinator = Coordinator(app_state, units=2, port=0)
+        client = DirectClient(coordinator)
+
+        first = coordinator.lease({'worker': 'a'})
+        second = coordinator.lease({'worker': 'b'})
+        self.assertTrue(LeasedBudget(client, first['lease_id'], 3).take())
+
+        budget = LeasedBudget(client, second['lease_id'], 3)
+        self.assertFalse(budget.take())
+        self.assertTrue(budget.withheld)
+
+        # the refused image is still needed, it is not cancelled
+        quota = BatchQuota(categories=['n1'], needed={'n1': 1}, budget=budget)
+        self.assertFalse(quota.should_start(0))
+        self.assertTrue(quota.interrupts(0))
+
+        coordinator.report({
+            'lease_id': first['lease_id'],
+            'internal_state': None,
+            'downloads': [('n1', 'url{}'.format(i), 'n1/{}.jpg'.format(i))
+                          for i in range(3)],
+            'failed_urls': []
+        })
+        budget = LeasedBudget(client, second['lease_id'], 3)
+        self.assertFalse(budget.take())
+        self.assertFalse(budget.withheld)
+        coordinator.stop()
+
+    def test_batch_of_an_expired_lease_is_dropped(self):
+        app_state = self._configure(10)
+        coordinator = Coordinator(app_state, units=1, port=0)
+        worker = DistributedWorker(coordinator.address, 'a',
+                                   os.path.abspath(self.destinations[0]))
+        worker._client = ExpiringClient(coordinator)
+
+        worker._work_on(coordinator.lease({'worker': 'a'}))
+
+        status = coordinator.status()
+        self.assertEqual(status['downloaded'], 0)
+        self.assertEqual(status['leases'], [])
+        self.assertFalse(os.path.exists(config.manifest_path))
+
+        files = [name for _, _, names in os.walk(self.destinations[0])
+                 for name in names]
+        self.assertEqual(files, [])
+
+        # the images granted to the expired lease are given out again
+        lease = coordinator.lease({'worker': 'b'})
+        grant = coordinator.grant({'lease_id': lease['lease_id'],
+                                   'wanted': 10})
+        self.assertEqual(grant['granted'], 10)
+        coordinator.stop()
+
+    def test_quota_is_checked_while_a_grant_is_awaited(self):
+        budget = BlockingBudget()
+        quota = BatchQuota(categories=['n1', 'n2'],
+                           needed={'n1': 1, 'n2': 1}, budget=budget)
+
+        accepted = []
+        thread = threading.Thread(target=lambda: accepted.append(
+            quota.accept(0)))
+        thread.start()
+        self.assertTrue(budget.asked.wait(5))
+
+        self.assertTrue(quota.should_start(1))
+        # the image of the awaited grant is reserved
+        self.assertFalse(quota.accept(0))
+
+        budget.granted.set()
+        thread.join(5)
+        self.assertEqual(accepted, [True])
+        self.assertFalse(quota.should_start(0))
+        self.assertTrue(quota.should_start(1))
+
+    def test_listens_on_loopback_by_default(self):
+        coordinator = Coordinator(self._configure(3), port=0)
+        self.assertTrue(coordinator.address.startswith('http://127.0.0.1:'))
+        coordinator.stop()
+
+    def test_units_survive_restart(self):
+        app_state = self._configure(10)
+        coordinator = Coordinator(app_state, units=2, host='127.0.0.1',
+                                  port=0)
+        lease = coordinator.lease({'worker': 'a'})
+        coordinator.report({
+            'lease_id': lease['lease_id'],
+            'internal_state': {'iterator_position': [0, 1]},
+            'downloads': [('n1', 'url1', 'n1/1.jpg')],
+            'failed_urls': []
+        })
+        coordinator.complete({'lease_id': lease['lease_id'],
+                              'finished': True})
+        coordinator.stop()
+
+        coordinator = Coordinator(AppState(), host='127.0.0.1', port=0)
+        status = coordinator.status()
+        self.assertEqual(status['units'], 2)
+        self.assertEqual(status['finished_units'], 1)
+        self.assertEqual(status['downloaded'], 1)
+
+        lease = coordinator.lease({'worker': 'b'})
+        self.assertEqual(lease['unit']['index'], 1)
+        coordinator.stop()
+
+
+class DirectClient:
+    def __init__(self, coordinator):
+        self._coordinator = coordinator
+
+    def call(self, name, **request):
+        return getattr(self._coordinator, name)(request)
+
+
+class ExpiringClient(DirectClient):
+    # the lease expires right before the first report reaches the
+    # coordinator
+    def call(self, name, **request):
+        if name == 'report':
+            expired = time.time() + 3600
+            with mock.patch('image_net.distributed.time.time',
+                            return_value=expired):
+                return super().call(name, **request)
+        return super().call(name, **request)
+
+
+class BlockingBudget:
+    def __init__(self):
+        self.asked = threading.Event()
+        self.granted = threading.Event()
+
+    def take(self):
+        self.asked.set()
+        return self.granted.wait(5)
+
+    @property
+    def exhausted(self):
+        return False
+
+    @property
+    def withheld(self):
+        return False
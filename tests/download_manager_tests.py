@@ -161,6 +161,22 @@ class DownloadManagerTests(unittest.TestCase, metaclass=Meta):
 
         self.stop_the_thread(manager)
 
+    def test_stop_download_ends_the_thread(self):
+        app_state = AppState()
+        manager = DownloadManager(app_state)
+
+        conf = DownloadConfiguration(number_of_images=5,
+                                     images_per_category=1,
+                                     download_destination=self.image_net_home)
+        app_state.set_configuration(conf)
+
+        manager.start()
+        manager.pause_download()
+        manager.stop_download()
+
+        self.assertTrue(manager.isFinished())
+        self.stop_the_thread(manager)
+
     def _assert_expected_directories_exist(self):
         word_net_directories = []
         for dirname, dirs, file_names in os.walk(self.image_net_home):
@@ -18,12 +18,14 @@
 import unittest
 import os
 import sys
+from unittest import mock
 
 sys.path.insert(0, './')
 
 from registered_test_cases import Meta
 
 from image_net import iterators
+from image_net.sampling import Sampling
 from config import config
 import shutil
 
@@ -95,3 +97,282 @@ class ImageNetUrlsTests(unittest.TestCase, metaclass=Meta):
         ]
 
         self.assertEqual(positions, expected_positions)
+
+    def test_iterate_from_last_url_of_category(self):
+        position = iterators.Position(0, 2)
+        it = iterators.create_image_net_urls(start_after_position=position)
+
+        results = [(wn_id, url, pos.to_json()) for wn_id, url, pos in it]
+
+        expected = [
+            ('n38203', 'url4', iterators.Position(1, 0).to_json()),
+            ('n38203', 'url5', iterators.Position(1, 1).to_json())
+        ]
+        self.assertEqual(results, expected)
+
+    def test_lists_from_earlier_versions_are_moved_to_store(self):
+        os.makedirs(config.app_data_folder)
+        path = config.synset_urls_path('n38203')
+        with open(path, 'w') as f:
+            f.write('url7\n\nurl8\n')
+
+        it = iterators.create_image_net_urls()
+        urls = [url for wn_id, url, pos in it]
+
+        self.assertEqual(urls, ['url1', 'url2', 'url3', 'url7', 'url8'])
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(it.url_store.count('n38203'), 2)
+
+    def test_iterate_over_selected_categories(self):
+        it = iterators.create_image_net_urls(word_net_ids={'n38203'})
+
+        results = [(wn_id, url, pos.to_json()) for wn_id, url, pos in it]
+
+        expected = [
+            ('n38203', 'url4', iterators.Position(1, 0).to_json()),
+            ('n38203', 'url5', iterators.Position(1, 1).to_json())
+        ]
+        self.assertEqual(results, expected)
+        self.assertNotIn('n392093', it.url_store)
+
+    def test_skipping_rest_of_category(self):
+        satisfied = set()
+        it = iterators.create_image_net_urls(
+            skip_category=lambda wn_id: wn_id in satisfied
+        )
+
+        results = []
+        for wn_id, url, pos in it:
+            results.append((wn_id, url, pos.to_json()))
+            satisfied.add(wn_id)
+
+        expected = [
+            ('n392093', 'url1', iterators.Position(0, 0).to_json()),
+            ('n38203', 'url4', iterators.Position(1, 0).to_json())
+        ]
+        self.assertEqual(results, expected)
+
+    def test_satisfied_categories_are_not_fetched(self):
+        it = iterators.create_image_net_urls(
+            skip_category=lambda wn_id: wn_id == 'n392093'
+        )
+
+        results = [(wn_id, url) for wn_id, url, pos in it]
+
+        self.assertEqual(results, [('n38203', 'url4'), ('n38203', 'url5')])
+        self.assertNotIn('n392093', it.url_store)
+
+    def test_iterate_after_all_urls(self):
+        position = iterators.Position(1, 1)
+        it = iterators.create_image_net_urls(start_after_position=position)
+
+        self.assertEqual(list(it), [])
+
+    def test_interleaving_categories(self):
+        it = iterators.create_image_net_urls(interleave=2)
+
+        results = [(url, pos.to_json()) for wn_id, url, pos in it]
+
+        expected = [
+            ('url1', iterators.Position(0, 0).to_json()),
+            ('url4', iterators.Position(1, 0).to_json()),
+            ('url2', iterators.Position(0, 1).to_json()),
+            ('url5', iterators.Position(1, 1).to_json()),
+            ('url3', iterators.Position(0, 2).to_json())
+        ]
+        self.assertEqual(results, expected)
+
+    def test_resuming_interleaved_categories(self):
+        it = iterators.create_image_net_urls(interleave=2)
+
+        seen = []
+        for wn_id, url, pos in it:
+            seen.append(url)
+            it.acknowledge(pos)
+            if len(seen) == 3:
+                break
+
+        frontier, cursors = it.checkpoint()
+        self.assertEqual(frontier, iterators.Position(1, 0))
+        self.assertEqual(cursors, [iterators.Position(0, 1)])
+
+        it = iterators.create_image_net_urls(start_after_position=frontier,
+                                             cursors=cursors, interleave=2)
+        urls = [url for wn_id, url, pos in it]
+
+        self.assertEqual(seen, ['url1', 'url4', 'url2'])
+        self.assertEqual(urls, ['url3', 'url5'])
+
+    def test_interleaving_by_priority(self):
+        priorities = {'url1': 0.1, 'url4': 0.9, 'url5': 0.8}
+        it = iterators.create_image_net_urls(
+            interleave=2,
+            priority=lambda wn_id, url: priorities.get(url, 0.5)
+        )
+
+        urls = [url for wn_id, url, pos in it]
+        self.assertEqual(urls, ['url4', 'url5', 'url1', 'url2', 'url3'])
+
+    def test_deferred_category_waits_for_other_categories(self):
+        deferred = {'n392093'}
+        it = iterators.create_image_net_urls(
+            interleave=2,
+            defer_category=lambda wn_id: wn_id in deferred
+        )
+
+        urls = []
+        for wn_id, url, pos in it:
+            urls.append(url)
+            if url == 'url5':
+                deferred.clear()
+
+        self.assertEqual(urls, ['url4', 'url5', 'url1', 'url2', 'url3'])
+
+    def test_waiting_when_only_deferred_categories_are_left(self):
+        deferred = {'n392093', 'n38203'}
+        waits = []
+
+        def on_wait():
+            waits.append(len(deferred))
+            deferred.clear()
+
+        it = iterators.create_image_net_urls(
+            defer_category=lambda wn_id: wn_id in deferred, on_wait=on_wait
+        )
+
+        urls = [url for wn_id, url, pos in it]
+
+        self.assertEqual(waits, [2])
+        self.assertEqual(urls, ['url1', 'url2', 'url3', 'url4', 'url5'])
+
+    def test_uniform_sample_is_a_seeded_permutation(self):
+        sampling = Sampling.uniform(seed=3)
+        urls = [url for wn_id, url, pos in
+                iterators.create_image_net_urls(sampling=sampling)]
+        again = [url for wn_id, url, pos in
+                 iterators.create_image_net_urls(sampling=sampling)]
+
+        self.assertEqual(sorted(urls),
+                         ['url1', 'url2', 'url3', 'url4', 'url5'])
+        self.assertEqual(urls, again)
+
+    def test_resuming_uniform_sample(self):
+        sampling = Sampling.uniform(seed=3)
+        expected = [url for wn_id, url, pos in
+                    iterators.create_image_net_urls(sampling=sampling)]
+
+        it = iterators.create_image_net_urls(sampling=sampling)
+        for wn_id, url, pos in it:
+            it.acknowledge(pos)
+            if url == expected[1]:
+                break
+
+        self.assertEqual(it.sample_offset, 1)
+        it = iterators.create_image_net_urls(sampling=sampling,
+                                             sample_offset=it.sample_offset)
+        urls = [url for wn_id, url, pos in it]
+        self.assertEqual(urls, expected[2:])
+
+    def test_resumed_uniform_sample_keeps_its_space(self):
+        original_fetch = iterators.ImageNetUrlsMocked.fetch_url_list
+
+        def fetch_url_list(image_net_urls, wn_id):
+            if wn_id == 'n38203':
+                raise iterators.SynsetUrlsUnavailableError('timeout')
+            original_fetch(image_net_urls, wn_id)
+
+        sampling = Sampling.uniform(seed=3)
+        with mock.patch.object(iterators.ImageNetUrlsMocked,
+                               'fetch_url_list', fetch_url_list):
+            it = iterators.create_image_net_urls(sampling=sampling)
+            expected = []
+            for wn_id, url, pos in it:
+                expected.append(url)
+                if len(expected) == 1:
+                    it.acknowledge(pos)
+                    sample_offset = it.sample_offset
+
+        self.assertEqual(sorted(expected), ['url1', 'url2', 'url3'])
+        self.assertEqual(it.sample_sizes, [3, 0])
+
+        # the list which failed before is fetched now, the space the
+        # sample was drawn from stays the same
+        it = iterators.create_image_net_urls(sampling=sampling,
+                                             sample_offset=sample_offset,
+                                             sample_sizes=it.sample_sizes)
+        urls = [url for wn_id, url, pos in it]
+        self.assertEqual(urls, expected[1:])
+
+    def test_stratified_sample_keeps_category_order(self):
+        sampling = Sampling.stratified(seed=3)
+        results = [(wn_id, url, pos) for wn_id, url, pos in
+                   iterators.create_image_net_urls(sampling=sampling)]
+
+        wn_ids = [wn_id for wn_id, url, pos in results]
+        self.assertEqual(wn_ids, ['n392093'] * 3 + ['n38203'] * 2)
+        self.assertEqual(sorted(url for wn_id, url, pos in results[:3]),
+                         ['url1', 'url2', 'url3'])
+
+        position = results[1][2]
+        it = iterators.create_image_net_urls(start_after_position=position,
+                                             sampling=sampling)
+        urls = [url for wn_id, url, pos in it]
+        self.assertEqual(urls, [url for wn_id, url, pos in results[2:]])
+
+    def test_finished_categories_leave_checkpoint(self):
+        it = iterators.create_image_net_urls(interleave=2)
+
+        for wn_id, url, pos in it:
+            it.acknowledge(pos)
+
+        frontier, cursors = it.checkpoint()
+        self.assertEqual(frontier, iterators.Position(1, 1))
+        self.assertEqual(cursors, [])
+
+
+class ImageNetUrlsFromDumpTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.dump_path = os.path.join('fixtures', 'fall11_urls_sample.txt')
+
+    def tearDown(self):
+        if os.path.exists(config.app_data_folder):
+            shutil.rmtree(config.app_data_folder)
+
+    def test_getting_all_urls(self):
+        it = iterators.ImageNetUrlsFromDump(self.dump_path)
+
+        results = [(wn_id, url, pos.to_json()) for wn_id, url, pos in it]
+
+        expected = [
+            ('n392093', 'url1', iterators.Position(0, 0).to_json()),
+            ('n392093', 'url2', iterators.Position(0, 1).to_json()),
+            ('n392093', 'url3', iterators.Position(0, 2).to_json()),
+            ('n38203', 'url4', iterators.Position(1, 0).to_json()),
+            ('n38203', 'url5', iterators.Position(1, 1).to_json())
+        ]
+        self.assertEqual(results, expected)
+
+    def test_iterate_from_initial_index(self):
+        position = iterators.Position(0, 2)
+        it = iterators.ImageNetUrlsFromDump(self.dump_path,
+                                            start_after_position=position)
+
+        results = [(wn_id, url) for wn_id, url, pos in it]
+        self.assertEqual(results, [('n38203', 'url4'), ('n38203', 'url5')])
+
+    def test_dump_is_imported_only_once(self):
+        list(iterators.ImageNetUrlsFromDump(self.dump_path))
+
+        it = iterators.ImageNetUrlsFromDump(self.dump_path)
+        it.url_store.add('n392093', ['url7'])
+
+        urls = [url for wn_id, url, pos in it]
+        self.assertEqual(urls, ['url7', 'url4', 'url5'])
+
+    def test_missing_dump(self):
+        it = iterators.ImageNetUrlsFromDump(os.path.join('fixtures', 'none'))
+
+        def f():
+            list(it)
+
+        self.assertRaises(iterators.WordNetIdsUnavailableError, f)
@@ -0,0 +1,160 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import shutil
+import sys
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from config import config
+from image_net import downloader, metrics
+from image_net.metrics import MetricsFile, MetricsServer, Registry
+
+
+class RegistryTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_with_labels(self):
+        counter = self.registry.counter('requests_total', 'Requests',
+                                        ['outcome'])
+        counter.inc(1, 'ok')
+        counter.inc(2, 'ok')
+        counter.inc(1, 'failed')
+
+        self.assertEqual(counter.value('ok'), 3)
+        self.assertEqual(self.registry.to_prometheus(),
+                         '# HELP requests_total Requests\n'
+                         '# TYPE requests_total counter\n'
+                         'requests_total{outcome="failed"} 1\n'
+                         'requests_total{outcome="ok"} 3\n')
+
+    def test_gauge(self):
+        gauge = self.registry.gauge('in_flight', 'Requests being made')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+
+        self.assertEqual(gauge.value(), 1)
+        self.assertIn('\nin_flight 1\n', self.registry.to_prometheus())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram('seconds', 'Seconds', ['stage'],
+                                            buckets=[0.1, 1])
+        for value in [0.05, 0.5, 0.5, 3]:
+            histogram.observe(value, 'fetch')
+
+        self.assertEqual(histogram.count('fetch'), 4)
+        text = self.registry.to_prometheus()
+        self.assertIn('seconds_bucket{stage="fetch",le="0.1"} 1\n', text)
+        self.assertIn('seconds_bucket{stage="fetch",le="1"} 3\n', text)
+        self.assertIn('seconds_bucket{stage="fetch",le="+Inf"} 4\n', text)
+        self.assertIn('seconds_sum{stage="fetch"} 4.05\n', text)
+        self.assertIn('seconds_count{stage="fetch"} 4\n', text)
+
+    def test_label_values_are_escaped(self):
+        counter = self.registry.counter('total', 'Total', ['name'])
+        counter.inc(1, 'a "quoted"\nname')
+
+        self.assertIn('total{name="a \\"quoted\\"\\nname"} 1',
+                      self.registry.to_prometheus())
+
+    def test_clear(self):
+        counter = self.registry.counter('total', 'Total')
+        counter.inc(5)
+        self.registry.clear()
+
+        self.assertEqual(counter.value(), 0)
+
+
+class ExporterTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.registry = Registry()
+        self.registry.counter('total', 'Total').inc(7)
+        self.folder = os.path.join(config.app_data_folder, 'metrics')
+        if os.path.exists(self.folder):
+            shutil.rmtree(self.folder)
+
+    def test_server_serves_metrics(self):
+        server = MetricsServer(0, registry=self.registry)
+        server.start()
+        try:
+            with urlopen(server.address, timeout=5) as response:
+                text = response.read().decode('utf-8')
+        finally:
+            server.stop()
+
+        self.assertEqual(text, self.registry.to_prometheus())
+
+    def test_server_answers_other_paths_with_not_found(self):
+        server = MetricsServer(0, registry=self.registry)
+        server.start()
+        try:
+            address = server.address.replace('/metrics', '/other')
+            with self.assertRaises(HTTPError) as context:
+                urlopen(address, timeout=5)
+            context.exception.close()
+        finally:
+            server.stop()
+
+        self.assertEqual(context.exception.code, 404)
+
+    def test_file_is_written_on_stop(self):
+        path = os.path.join(self.folder, 'imagenet.prom')
+        metrics_file = MetricsFile(path, interval=60, registry=self.registry)
+        metrics_file.start()
+        metrics_file.stop()
+
+        with open(path) as f:
+            self.assertEqual(f.read(), self.registry.to_prometheus())
+        self.assertFalse(os.path.exists(path + '.part'))
+
+    def test_nothing_is_started_without_settings(self):
+        exporters = metrics.start_exporters(port=0, path='')
+        self.assertEqual(exporters, [])
+
+
+class DownloaderMetricsTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        metrics.default_registry.clear()
+        self.destination = os.path.join(config.app_data_folder,
+                                        'metrics_home')
+        if os.path.exists(self.destination):
+            shutil.rmtree(self.destination)
+        os.makedirs(self.destination)
+
+    def test_outcomes_are_counted(self):
+        urls = ['url{}'.format(i) for i in range(10)]
+        destinations = [os.path.join(self.destination, str(i))
+                        for i in range(10)]
+        threading_downloader = downloader.TestThreadingDownloader()
+        threading_downloader.download(urls, destinations)
+
+        ok = len(threading_downloader.downloaded_urls)
+        invalid = len(threading_downloader.failed_urls)
+        self.assertEqual(metrics.image_requests.value('ok'), ok)
+        self.assertEqual(metrics.image_requests.value('invalid'), invalid)
+        self.assertEqual(metrics.in_flight.value(), 0)
+        self.assertEqual(metrics.stage_seconds.count('fetch'), 10)
+        self.assertEqual(metrics.stage_seconds.count('sink'), ok)
+        self.assertEqual(metrics.bytes_downloaded.value(),
+                         ok * len('Dummy downloader written file'))
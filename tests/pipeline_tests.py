@@ -0,0 +1,123 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from image_net.pipeline import Pipeline, Stage, StageMetrics, bottleneck
+
+
+class PipelineTests(unittest.TestCase, metaclass=Meta):
+    def test_items_pass_through_all_stages(self):
+        seen = []
+        lock = threading.Lock()
+
+        def double(item):
+            item.append(len(item) * 2)
+
+        def collect(item):
+            with lock:
+                seen.append(item)
+
+        pipeline = Pipeline([Stage('double', double, workers=3,
+                                   queue_size=2),
+                             Stage('collect', collect, queue_size=2)])
+        pipeline.run([[i] for i in range(20)])
+
+        self.assertEqual(sorted(seen), [[i, 2] for i in range(20)])
+
+    def test_finished_items_skip_later_stages(self):
+        seen = []
+        pipeline = Pipeline([Stage('filter', lambda item: item % 2 == 0),
+                             Stage('collect', seen.append)])
+        pipeline.run(range(10))
+
+        self.assertEqual(sorted(seen), [0, 2, 4, 6, 8])
+
+    def test_full_queue_holds_back_the_producer(self):
+        release = threading.Event()
+        pipeline = Pipeline([Stage('slow', lambda item: release.wait(),
+                                   queue_size=1)])
+        pipeline.start()
+
+        # one item is being worked on and one is queued
+        pipeline.put(1)
+        pipeline.put(2)
+        producer = threading.Thread(target=pipeline.put, args=(3,))
+        producer.start()
+        producer.join(0.2)
+        self.assertTrue(producer.is_alive())
+
+        release.set()
+        producer.join()
+        pipeline.close()
+
+    def test_join_waits_for_items_put_so_far(self):
+        written = []
+        pipeline = Pipeline([Stage('write',
+                                   lambda item: written.append(item))])
+        pipeline.start()
+        for i in range(5):
+            pipeline.put(i)
+        pipeline.join()
+
+        self.assertEqual(written, list(range(5)))
+        pipeline.close()
+
+    def test_errors_are_raised_when_closing(self):
+        def fail(item):
+            raise ValueError(item)
+
+        pipeline = Pipeline([Stage('fail', fail)])
+        self.assertRaises(ValueError, lambda: pipeline.run([1]))
+
+    def test_slowest_stage_is_the_bottleneck(self):
+        pipeline = Pipeline([Stage('fast', lambda item: None, queue_size=4),
+                             Stage('slow', lambda item: time.sleep(0.02),
+                                   queue_size=4)])
+        pipeline.run(range(10))
+
+        fast, slow = pipeline.metrics
+        self.assertEqual(fast.items, 10)
+        self.assertEqual(slow.items, 10)
+        self.assertGreater(slow.utilization, 0.8)
+        self.assertLess(fast.utilization, 0.5)
+        self.assertGreater(slow.max_queue_depth, 0)
+        self.assertIs(bottleneck(pipeline.metrics), slow)
+
+
+class StageMetricsTests(unittest.TestCase, metaclass=Meta):
+    def test_utilization(self):
+        metrics = StageMetrics('fetch', workers=4)
+        metrics.record(3)
+        metrics.record(1)
+        metrics.add_active_time(2)
+        self.assertEqual(metrics.utilization, 0.5)
+
+    def test_queue_depth(self):
+        metrics = StageMetrics('sink')
+        for depth in [0, 2, 4]:
+            metrics.observe_queue(depth)
+        self.assertEqual(metrics.mean_queue_depth, 2)
+        self.assertEqual(metrics.max_queue_depth, 4)
+        self.assertEqual(metrics.as_dict()['max_queue_depth'], 4)
+
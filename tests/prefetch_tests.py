@@ -0,0 +1,123 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from image_net.prefetch import SynsetPrefetcher
+
+
+class SynsetPrefetcherTests(unittest.TestCase, metaclass=Meta):
+    def test_preserves_order(self):
+        categories = [(0, 'n1'), (1, 'n2'), (2, 'n3'), (3, 'n4')]
+        fetched = []
+        prefetcher = SynsetPrefetcher(fetched.append, categories, depth=2)
+
+        self.assertEqual(list(prefetcher), categories)
+        self.assertEqual(set(fetched), {'n1', 'n2', 'n3', 'n4'})
+
+    def test_failed_lists_are_recorded_and_skipped(self):
+        def fetch(wn_id):
+            if wn_id == 'n2':
+                raise Exception('404')
+
+        categories = [(0, 'n1'), (1, 'n2'), (2, 'n3')]
+        prefetcher = SynsetPrefetcher(fetch, categories, depth=3)
+
+        self.assertEqual(list(prefetcher), [(0, 'n1'), (2, 'n3')])
+        self.assertEqual(prefetcher.failures, {'n2': '404'})
+
+    def test_fetches_ahead_of_cursor(self):
+        started = []
+        fetched_while_blocked = []
+        slow_list_fetched = threading.Event()
+
+        def fetch(wn_id):
+            started.append(wn_id)
+            if wn_id == 'n1':
+                slow_list_fetched.wait(timeout=5)
+                fetched_while_blocked.extend(started)
+
+        categories = [(i, 'n{}'.format(i)) for i in range(1, 10)]
+        prefetcher = SynsetPrefetcher(fetch, categories, depth=3)
+        it = iter(prefetcher)
+
+        t = threading.Timer(0.2, slow_list_fetched.set)
+        t.start()
+        self.assertEqual(next(it), (1, 'n1'))
+        t.join()
+
+        self.assertEqual(set(fetched_while_blocked), {'n1', 'n2', 'n3', 'n4'})
+        self.assertEqual(prefetcher.pending, 3)
+        it.close()
+
+    def test_waits_are_announced(self):
+        ready = threading.Event()
+        waits = []
+
+        def fetch(wn_id):
+            if wn_id == 'n2':
+                ready.wait(timeout=5)
+
+        def on_wait():
+            waits.append(ready.is_set())
+            ready.set()
+
+        categories = [(1, 'n1'), (2, 'n2')]
+        prefetcher = SynsetPrefetcher(fetch, categories, depth=2,
+                                      on_wait=on_wait)
+        it = iter(prefetcher)
+        self.assertEqual(next(it), (1, 'n1'))
+        self.assertEqual(next(it), (2, 'n2'))
+        it.close()
+
+        self.assertEqual(waits, [False])
+
+    def test_cancellation_stops_waiting_for_a_list(self):
+        released = threading.Event()
+        cancellation = threading.Event()
+
+        categories = [(1, 'n1'), (2, 'n2')]
+        prefetcher = SynsetPrefetcher(
+            lambda wn_id: released.wait(timeout=10), categories, depth=2,
+            cancellation=cancellation
+        )
+
+        timer = threading.Timer(0.2, cancellation.set)
+        timer.start()
+        started = time.perf_counter()
+        self.assertEqual(list(prefetcher), [])
+        elapsed = time.perf_counter() - started
+        released.set()
+        timer.join()
+
+        self.assertTrue(prefetcher.cancelled)
+        self.assertLess(elapsed, 0.2 + 2 * SynsetPrefetcher.patience)
+
+    def test_close_drops_pending_fetches(self):
+        categories = [(i, 'n{}'.format(i)) for i in range(100)]
+        prefetcher = SynsetPrefetcher(lambda wn_id: None, categories, depth=5)
+        it = iter(prefetcher)
+        next(it)
+        it.close()
+
+        self.assertEqual(prefetcher.pending, 0)
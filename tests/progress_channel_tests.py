@@ -0,0 +1,102 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import sys
+import threading
+import unittest
+
+from PyQt5 import QtWidgets
+from PyQt5.QtTest import QSignalSpy
+
+from registered_test_cases import Meta
+from util.app_state import AppState, DownloadConfiguration, Result
+from util.progress_channel import ProgressChannel
+
+
+class ProgressChannelTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.app = QtWidgets.QApplication(sys.argv)
+
+        self.app_state = AppState()
+        conf = DownloadConfiguration(number_of_images=10,
+                                     images_per_category=10,
+                                     download_destination='temp')
+        self.app_state.set_configuration(conf)
+        self.channel = ProgressChannel(self.app_state, interval=20)
+        self.spy = QSignalSpy(self.channel.progressUpdated)
+
+    def _add(self, succeeded_urls, failed_urls):
+        result = Result(failed_urls=failed_urls,
+                        succeeded_urls=succeeded_urls)
+        self.app_state.update_progress(result)
+        self.channel.add(succeeded_urls, failed_urls)
+
+    def _updates(self):
+        return [json.loads(args[0]) for args in self.spy]
+
+    def test_batches_are_coalesced(self):
+        threads = [
+            threading.Thread(target=self._add,
+                             args=(['ok'], ['bad{}'.format(i)]))
+            for i in range(5)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.channel.flush()
+
+        updates = self._updates()
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0]['imagesLoaded'], 5)
+        self.assertEqual(updates[0]['failures'], 5)
+        self.assertEqual(sorted(updates[0]['failedUrls']),
+                         ['bad0', 'bad1', 'bad2', 'bad3', 'bad4'])
+
+    def test_updates_carry_only_new_failures(self):
+        self._add([], ['bad1'])
+        self.channel.flush()
+        self._add([], ['bad2'])
+        self.channel.flush()
+
+        updates = self._updates()
+        self.assertEqual(updates[0]['failedUrls'], ['bad1'])
+        self.assertEqual(updates[1]['failedUrls'], ['bad2'])
+        self.assertEqual(updates[1]['failures'], 2)
+
+    def test_nothing_is_sent_without_changes(self):
+        self.channel.flush()
+        self.assertEqual(len(self.spy), 0)
+
+    def test_failed_urls_are_capped(self):
+        urls = ['bad{}'.format(i)
+                for i in range(ProgressChannel.max_failed_urls + 5)]
+        self._add([], urls)
+        self.channel.flush()
+
+        update = self._updates()[0]
+        self.assertEqual(len(update['failedUrls']),
+                         ProgressChannel.max_failed_urls)
+        self.assertEqual(update['droppedFailedUrls'], 5)
+
+    def test_timer_sends_updates(self):
+        self.channel.start()
+        self._add(['ok'], [])
+        self.assertTrue(self.spy.wait(1000))
+        self.channel.stop()
@@ -0,0 +1,69 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sys
+import unittest
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from image_net.sampling import Sampling, IndexPermutation
+
+
+class IndexPermutationTests(unittest.TestCase, metaclass=Meta):
+    def test_permutation_covers_every_index_once(self):
+        for size in [0, 1, 2, 3, 17, 1000]:
+            permutation = IndexPermutation(size, seed=5)
+            self.assertEqual(len(permutation), size)
+            self.assertEqual(sorted(permutation), list(range(size)))
+
+    def test_same_seed_gives_same_order(self):
+        first = list(IndexPermutation(100, seed=7))
+        second = list(IndexPermutation(100, seed=7))
+        self.assertEqual(first, second)
+
+    def test_seed_and_salt_change_order(self):
+        order = list(IndexPermutation(100, seed=7))
+        self.assertNotEqual(order, list(IndexPermutation(100, seed=8)))
+        self.assertNotEqual(order,
+                            list(IndexPermutation(100, seed=7, salt='n1')))
+
+    def test_index_out_of_range(self):
+        permutation = IndexPermutation(10, seed=1)
+        self.assertRaises(IndexError, lambda: permutation[10])
+        self.assertRaises(IndexError, lambda: permutation[-1])
+
+    def test_large_range_is_not_materialized(self):
+        permutation = IndexPermutation(14 * 10 ** 6, seed=3)
+        values = [permutation[i] for i in range(1000)]
+        self.assertEqual(len(set(values)), 1000)
+        self.assertTrue(all(0 <= v < 14 * 10 ** 6 for v in values))
+
+
+class SamplingTests(unittest.TestCase, metaclass=Meta):
+    def test_defaults_to_sequential(self):
+        sampling = Sampling()
+        self.assertFalse(sampling.is_uniform)
+        self.assertFalse(sampling.is_stratified)
+
+    def test_round_trip(self):
+        sampling = Sampling.from_dict(Sampling.uniform(seed=12).as_dict())
+        self.assertTrue(sampling.is_uniform)
+        self.assertEqual(sampling.seed, 12)
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, lambda: Sampling(mode='random'))
@@ -0,0 +1,122 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import multiprocessing
+import os
+import shutil
+import sys
+import unittest
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from config import config
+from image_net.sharding import ShardedDownloader, GlobalBudget, \
+    create_downloader
+from image_net.stateful_downloader import StatefulDownloader
+from util.app_state import AppState, DownloadConfiguration
+
+
+class ShardedDownloaderTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        if os.path.exists(config.app_data_folder):
+            shutil.rmtree(config.app_data_folder)
+        os.makedirs(config.app_data_folder)
+
+        image_net_home = os.path.join('temp', 'image_net_home')
+        if os.path.exists(image_net_home):
+            shutil.rmtree(image_net_home)
+        os.makedirs(image_net_home)
+        self.image_net_home = image_net_home
+
+    def _configure(self, number_of_images, shards=2):
+        app_state = AppState()
+        dconf = DownloadConfiguration(number_of_images=number_of_images,
+                                      images_per_category=10,
+                                      batch_size=1,
+                                      shards=shards,
+                                      download_destination=self.image_net_home)
+        app_state.set_configuration(dconf)
+        return app_state
+
+    def _file_names(self):
+        names = []
+        for wn_id in os.listdir(self.image_net_home):
+            names.extend(os.listdir(os.path.join(self.image_net_home, wn_id)))
+        return names
+
+    def test_downloader_choice(self):
+        app_state = self._configure(10, shards=1)
+        self.assertIsInstance(create_downloader(app_state), StatefulDownloader)
+
+        app_state = self._configure(10, shards=2)
+        self.assertIsInstance(create_downloader(app_state), ShardedDownloader)
+
+    def test_complete_download(self):
+        app_state = self._configure(10)
+        downloader = ShardedDownloader(app_state)
+
+        succeeded_urls = []
+        for result in downloader:
+            succeeded_urls.extend(result.succeeded_urls)
+
+        self.assertEqual(sorted(succeeded_urls),
+                         ['url1', 'url2', 'url3', 'url4', 'url5'])
+        self.assertEqual(downloader.progress_info.total_downloaded, 5)
+        self.assertTrue(downloader.progress_info.finished)
+
+        names = self._file_names()
+        self.assertEqual(len(names), 5)
+        self.assertEqual(len(set(names)), 5)
+
+    def test_number_of_images_is_global(self):
+        app_state = self._configure(3)
+        downloader = ShardedDownloader(app_state)
+
+        for result in downloader:
+            pass
+
+        self.assertEqual(downloader.progress_info.total_downloaded, 3)
+        self.assertEqual(len(self._file_names()), 3)
+
+    def test_stopping_and_resuming(self):
+        app_state = self._configure(10)
+        downloader = ShardedDownloader(app_state)
+
+        succeeded_urls = []
+        for result in downloader:
+            succeeded_urls.extend(result.succeeded_urls)
+            break
+
+        app_state = AppState()
+        downloader = ShardedDownloader(app_state)
+        for result in downloader:
+            succeeded_urls.extend(result.succeeded_urls)
+
+        self.assertEqual(downloader.progress_info.total_downloaded, 5)
+        self.assertEqual(len(set(self._file_names())), 5)
+
+
+class GlobalBudgetTests(unittest.TestCase, metaclass=Meta):
+    def test_take(self):
+        budget = GlobalBudget(multiprocessing.get_context('spawn'), 2)
+
+        self.assertTrue(budget.take())
+        self.assertTrue(budget.take())
+        self.assertTrue(budget.exhausted)
+        self.assertFalse(budget.take())
+        self.assertEqual(budget.left, 0)
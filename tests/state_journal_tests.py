@@ -0,0 +1,77 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import shutil
+import sys
+import unittest
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from util.state_journal import StateJournal
+
+
+class StateJournalTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.directory = os.path.join('temp', 'journal')
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
+        self.path = os.path.join(self.directory, 'state.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_missing_journal_is_empty(self):
+        self.assertEqual(list(StateJournal(self.path).records()), [])
+
+    def test_records_are_read_in_order(self):
+        journal = StateJournal(self.path)
+        journal.append({'a': 1})
+        journal.append({'b': [2, 3]})
+
+        self.assertEqual(list(StateJournal(self.path).records()),
+                         [{'a': 1}, {'b': [2, 3]}])
+
+    def test_torn_record_is_ignored(self):
+        journal = StateJournal(self.path)
+        journal.append({'a': 1})
+        with open(self.path, 'a') as f:
+            f.write('{"b": ')
+
+        self.assertEqual(list(journal.records()), [{'a': 1}])
+
+    def test_records_after_torn_record_are_kept(self):
+        journal = StateJournal(self.path)
+        journal.append({'a': 1})
+        with open(self.path, 'a') as f:
+            f.write('{"b": ')
+
+        self.assertEqual(list(journal.records()), [{'a': 1}])
+        journal.append({'c': 3})
+
+        self.assertEqual(list(StateJournal(self.path).records()),
+                         [{'a': 1}, {'c': 3}])
+
+    def test_clear(self):
+        journal = StateJournal(self.path)
+        journal.append({'a': 1})
+        journal.clear()
+        journal.clear()
+
+        self.assertEqual(list(journal.records()), [])
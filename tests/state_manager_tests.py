@@ -160,12 +160,12 @@ class DownloadManagerTests(unittest.TestCase, metaclass=Meta):
         self.manager.configure('', 10, 0)
         self.assertEqual(self.download_state, 'running')
 
-    def test_reset_in_running_state_does_nothing(self):
+    def test_reset_in_running_state(self):
         path_uri = pathlib.Path(os.path.abspath(self.image_net_home)).as_uri()
         self.manager.configure(path_uri, 10, 30)
         self.manager.start_download()
         self.manager.reset()
-        self.assertEqual(self.download_state, 'running')
+        self.assertEqual(self.download_state, 'initial')
 
     def test_no_action_can_be_made_during_pausing(self):
         path_uri = pathlib.Path(os.path.abspath(self.image_net_home)).as_uri()
@@ -186,8 +186,13 @@ class DownloadManagerTests(unittest.TestCase, metaclass=Meta):
         self.manager.resume()
         self.assertEqual(self.download_state, 'pausing')
 
+    def test_reset_while_pausing(self):
+        path_uri = pathlib.Path(os.path.abspath(self.image_net_home)).as_uri()
+        self.manager.configure(path_uri, 10, 30)
+        self.manager.start_download()
+        self.manager.pause()
         self.manager.reset()
-        self.assertEqual(self.download_state, 'pausing')
+        self.assertEqual(self.download_state, 'initial')
 
     def test_resume_in_paused_state(self):
         self.manager._state = 'paused'
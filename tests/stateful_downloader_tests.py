@@ -17,13 +17,20 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import os
 import shutil
+import threading
+import time
 import unittest
+from unittest import mock
 
 from registered_test_cases import Meta
 from image_net import stateful_downloader
+from image_net.downloader import DummyDownloader
 from config import config
 from image_net.stateful_downloader import StatefulDownloader
 from util.app_state import DownloadConfiguration, AppState
+from image_net.categories import CategorySelection
+from image_net.iterators import ImageNetUrlsMocked, Position
+from image_net.sampling import Sampling
 
 
 class StatefulDownloaderTests(unittest.TestCase, metaclass=Meta):
@@ -113,7 +120,7 @@ class StatefulDownloaderTests(unittest.TestCase, metaclass=Meta):
         app_state = AppState()
 
         dconf = DownloadConfiguration(number_of_images=4,
-                                      images_per_category=1,
+                                      images_per_category=2,
                                       batch_size=2,
                                       download_destination=self.image_net_home)
         app_state.set_configuration(dconf)
@@ -140,7 +147,7 @@ class StatefulDownloaderTests(unittest.TestCase, metaclass=Meta):
         app_state = AppState()
 
         dconf = DownloadConfiguration(number_of_images=4,
-                                      images_per_category=1,
+                                      images_per_category=2,
                                       batch_size=2,
                                       download_destination=self.image_net_home)
 
@@ -214,3 +221,304 @@ class StatefulDownloaderTests(unittest.TestCase, metaclass=Meta):
         expected_names = ['1', '2']
 
         self.assertEqual(set(fnames), set(expected_names))
+
+    def test_download_of_selected_categories(self):
+        app_state = AppState()
+
+        dconf = DownloadConfiguration(
+            number_of_images=10, images_per_category=10,
+            download_destination=self.image_net_home,
+            categories=CategorySelection.from_list(['n38203'])
+        )
+        app_state.set_configuration(dconf)
+        downloader = StatefulDownloader(app_state)
+
+        successful_urls = []
+        for result in downloader:
+            successful_urls.extend(result.succeeded_urls)
+
+        self.assertEqual(successful_urls, ['url4', 'url5'])
+        self.assertEqual(os.listdir(self.image_net_home), ['n38203'])
+
+    def test_does_not_store_images_beyond_category_quota(self):
+        app_state = AppState()
+
+        dconf = DownloadConfiguration(number_of_images=10,
+                                      images_per_category=1,
+                                      batch_size=10,
+                                      download_destination=self.image_net_home)
+        app_state.set_configuration(dconf)
+        downloader = StatefulDownloader(app_state)
+
+        for result in downloader:
+            pass
+
+        self.assertEqual(downloader.progress_info.total_downloaded, 2)
+        for wn_id in ['n392093', 'n38203']:
+            path = os.path.join(self.image_net_home, wn_id)
+            self.assertEqual(len(os.listdir(path)), 1)
+
+    def test_satisfied_categories_are_skipped(self):
+        app_state = AppState()
+
+        dconf = DownloadConfiguration(number_of_images=10,
+                                      images_per_category=1,
+                                      batch_size=1,
+                                      download_destination=self.image_net_home)
+        app_state.set_configuration(dconf)
+        downloader = StatefulDownloader(app_state)
+
+        successful_urls = []
+        for result in downloader:
+            successful_urls.extend(result.succeeded_urls)
+
+        self.assertEqual(successful_urls, ['url1', 'url4'])
+
+        position = app_state.internal_state.iterator_position
+        self.assertEqual(position, Position(1, 0))
+
+    def test_stopping_and_resuming_interleaved_download(self):
+        app_state = AppState()
+
+        dconf = DownloadConfiguration(number_of_images=10,
+                                      images_per_category=12,
+                                      batch_size=3,
+                                      interleaved_categories=2,
+                                      download_destination=self.image_net_home)
+        app_state.set_configuration(dconf)
+        downloader = StatefulDownloader(app_state)
+
+        successful_urls = []
+        for result in downloader:
+            successful_urls.extend(result.succeeded_urls)
+            break
+
+        app_state = AppState()
+        downloader = StatefulDownloader(app_state)
+
+        for result in downloader:
+            successful_urls.extend(result.succeeded_urls)
+
+        self.assertEqual(sorted(successful_urls),
+                         ['url1', 'url2', 'url3', 'url4', 'url5'])
+        self.assertEqual(downloader.progress_info.total_downloaded, 5)
+
+    def test_resuming_uniform_sample(self):
+        app_state = AppState()
+
+        dconf = DownloadConfiguration(number_of_images=10,
+                                      images_per_category=12,
+                                      batch_size=2,
+                                      sampling=Sampling.uniform(seed=5),
+                                      download_destination=self.image_net_home)
+        app_state.set_configuration(dconf)
+        downloader = StatefulDownloader(app_state)
+
+        successful_urls = []
+        for result in downloader:
+            successful_urls.extend(result.succeeded_urls)
+            break
+
+        self.assertEqual(app_state.internal_state.sample_offset, 1)
+
+        app_state = AppState()
+        self.assertEqual(app_state.internal_state.sample_sizes, [3, 2])
+        downloader = StatefulDownloader(app_state)
+
+        for result in downloader:
+            successful_urls.extend(result.succeeded_urls)
+
+        self.assertEqual(sorted(successful_urls),
+                         ['url1', 'url2', 'url3', 'url4', 'url5'])
+        self.assertEqual(downloader.progress_info.total_downloaded, 5)
+
+    def test_url_statuses_are_tracked(self):
+        with mock.patch.object(config, 'track_url_status', True):
+            app_state = AppState()
+
+            dconf = DownloadConfiguration(
+                number_of_images=10, images_per_category=10, batch_size=2,
+                download_destination=self.image_net_home
+            )
+            app_state.set_configuration(dconf)
+            downloader = StatefulDownloader(app_state)
+
+            for result in downloader:
+                pass
+
+            statuses = app_state.url_statuses
+            self.assertTrue(statuses.is_fetched('n392093', 'url1'))
+            self.assertEqual(statuses.counts(), {'ok': 5})
+
+            app_state.url_statuses.close()
+
+    def test_concurrency_level_is_resumed(self):
+        with mock.patch.object(config, 'initial_workers', 1), \
+                mock.patch.object(config, 'min_workers', 1):
+            app_state = AppState()
+            dconf = DownloadConfiguration(
+                number_of_images=10, images_per_category=10, batch_size=4,
+                download_destination=self.image_net_home
+            )
+            app_state.set_configuration(dconf)
+            downloader = StatefulDownloader(app_state)
+
+            for result in downloader:
+                break
+
+            self.assertEqual(AppState().internal_state.concurrency, 2)
+
+            downloader = StatefulDownloader(AppState())
+            for result in downloader:
+                pass
+
+            self.assertEqual(AppState().internal_state.concurrency, 3)
+
+    def test_batch_is_downloaded_while_a_list_is_fetched(self):
+        downloaded = threading.Event()
+        original_download = DummyDownloader.download
+        original_fetch = ImageNetUrlsMocked.fetch_url_list
+        fetched_in_time = []
+
+        def download(file_downloader, url, cancellation=None):
+            downloaded.set()
+            return original_download(file_downloader, url, cancellation)
+
+        # the second list only arrives once the first batch is downloaded
+        def fetch_url_list(image_net_urls, wn_id):
+            if wn_id == 'n38203':
+                fetched_in_time.append(downloaded.wait(timeout=5))
+            original_fetch(image_net_urls, wn_id)
+
+        with mock.patch.object(DummyDownloader, 'download', download), \
+                mock.patch.object(ImageNetUrlsMocked, 'fetch_url_list',
+                                  fetch_url_list):
+            app_state = AppState()
+            dconf = DownloadConfiguration(
+                number_of_images=10, images_per_category=10, batch_size=10,
+                download_destination=self.image_net_home
+            )
+            app_state.set_configuration(dconf)
+
+            results = list(StatefulDownloader(app_state))
+
+        self.assertEqual(fetched_in_time, [True])
+        self.assertEqual([result.succeeded_urls for result in results],
+                         [['url1', 'url2', 'url3'], ['url4', 'url5']])
+
+    def test_batch_is_filled_from_other_categories(self):
+        app_state = AppState()
+        dconf = DownloadConfiguration(
+            number_of_images=2, images_per_category=1, batch_size=4,
+            download_destination=self.image_net_home
+        )
+        app_state.set_configuration(dconf)
+
+        results = list(StatefulDownloader(app_state))
+
+        # the third URL of the first category is not needed in the batch,
+        # the second category fills it instead
+        self.assertEqual(len(results), 1)
+        first, second = sorted(results[0].succeeded_urls)
+        self.assertIn(first, ['url1', 'url2'])
+        self.assertIn(second, ['url4', 'url5'])
+        self.assertTrue(app_state.progress_info.finished)
+
+    def test_pause_while_a_list_is_fetched(self):
+        released = threading.Event()
+        original_fetch = ImageNetUrlsMocked.fetch_url_list
+
+        def fetch_url_list(image_net_urls, wn_id):
+            if wn_id == 'n38203':
+                released.wait(timeout=10)
+            original_fetch(image_net_urls, wn_id)
+
+        for sampling in [Sampling(), Sampling.uniform(seed=1)]:
+            if os.path.exists(config.app_data_folder):
+                shutil.rmtree(config.app_data_folder)
+
+            cancellation = threading.Event()
+            with mock.patch.object(ImageNetUrlsMocked, 'fetch_url_list',
+                                   fetch_url_list):
+                app_state = AppState()
+                dconf = DownloadConfiguration(
+                    number_of_images=10, images_per_category=10,
+                    batch_size=10, sampling=sampling,
+                    download_destination=self.image_net_home
+                )
+                app_state.set_configuration(dconf)
+                d = StatefulDownloader(app_state, cancellation=cancellation)
+
+                timer = threading.Timer(0.2, cancellation.set)
+                timer.start()
+                started = time.perf_counter()
+                list(d)
+                elapsed = time.perf_counter() - started
+                timer.join()
+
+            self.assertLess(elapsed, 1.5, sampling.mode)
+            self.assertFalse(app_state.progress_info.finished)
+
+        released.set()
+
+    def test_pause_keeps_interrupted_urls(self):
+        cancellation = threading.Event()
+        original = DummyDownloader.download
+        calls = []
+
+        # the pause comes in the middle of a batch
+        def download(file_downloader, url, cancellation=None):
+            result = original(file_downloader, url, cancellation)
+            calls.append(url)
+            if len(calls) == 2:
+                cancellation.set()
+            return result
+
+        with mock.patch.object(config, 'initial_workers', 1), \
+                mock.patch.object(config, 'min_workers', 1), \
+                mock.patch.object(DummyDownloader, 'download', download):
+            app_state = AppState()
+            dconf = DownloadConfiguration(
+                number_of_images=10, images_per_category=10, batch_size=5,
+                download_destination=self.image_net_home
+            )
+            app_state.set_configuration(dconf)
+            d = StatefulDownloader(app_state, cancellation=cancellation)
+
+            succeeded_urls = []
+            for result in d:
+                succeeded_urls.extend(result.succeeded_urls)
+
+        app_state = AppState()
+        self.assertFalse(app_state.progress_info.finished)
+        self.assertEqual(app_state.progress_info.total_downloaded, 2)
+        self.assertEqual(len(app_state.internal_state.pending_urls), 3)
+
+        d = StatefulDownloader(app_state)
+        for result in d:
+            succeeded_urls.extend(result.succeeded_urls)
+
+        self.assertEqual(sorted(succeeded_urls),
+                         ['url1', 'url2', 'url3', 'url4', 'url5'])
+        self.assertEqual(AppState().progress_info.total_downloaded, 5)
+        self.assertEqual(AppState().internal_state.pending_urls, [])
+
+        files = []
+        for dirname, dirs, file_names in os.walk(self.image_net_home):
+            files.extend(file_names)
+        self.assertEqual(len(files), 5)
+
+    def test_cancellation_before_start(self):
+        cancellation = threading.Event()
+        cancellation.set()
+
+        app_state = AppState()
+        dconf = DownloadConfiguration(
+            number_of_images=10, images_per_category=10, batch_size=2,
+            download_destination=self.image_net_home
+        )
+        app_state.set_configuration(dconf)
+        d = StatefulDownloader(app_state, cancellation=cancellation)
+
+        self.assertEqual(list(d), [])
+        self.assertFalse(app_state.progress_info.finished)
@@ -18,6 +18,9 @@
 import unittest
 import os
 import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 sys.path.insert(0, './')
 
@@ -62,3 +65,107 @@ class ThreadingDownloaderTests(unittest.TestCase, metaclass=Meta):
         for path in file_list:
             with open(path, 'r') as f:
                 self.assertEqual(f.read(), 'Dummy downloader written file')
+
+    def test_stats_with_limited_concurrency(self):
+        url2file_name = Url2FileName()
+
+        urls = ['url{}'.format(i) for i in range(10)]
+        destinations = [os.path.join(self.destination,
+                                     url2file_name.convert(url))
+                        for url in urls]
+        self.downloader.set_concurrency(2)
+        self.downloader.download(urls, destinations)
+
+        stats = self.downloader.stats
+        self.assertEqual(stats.images, len(self.downloader.downloaded_urls))
+        self.assertEqual(stats.failures, len(self.downloader.failed_urls))
+        self.assertEqual(stats.images + stats.failures, 10)
+        self.assertEqual(stats.bytes_downloaded,
+                         stats.images * len('Dummy downloader written file'))
+
+    def test_cancelled_downloads_are_interrupted(self):
+        url2file_name = Url2FileName()
+
+        urls = ['url{}'.format(i) for i in range(4)]
+        destinations = [os.path.join(self.destination,
+                                     url2file_name.convert(url))
+                        for url in urls]
+        cancellation = threading.Event()
+        cancellation.set()
+        self.downloader.download(urls, destinations,
+                                 cancellation=cancellation)
+
+        self.assertEqual(self.downloader.interrupted_urls, urls)
+        self.assertEqual(self.downloader.downloaded_urls, [])
+        self.assertEqual(self.downloader.failed_urls, [])
+        self.assertEqual(os.listdir(self.destination), [])
+
+    def test_stages_are_measured(self):
+        url2file_name = Url2FileName()
+
+        urls = ['url{}'.format(i) for i in range(6)]
+        destinations = [os.path.join(self.destination,
+                                     url2file_name.convert(url))
+                        for url in urls]
+        self.downloader.download(urls, destinations)
+
+        fetch, validate, sink = self.downloader.stage_metrics
+        self.assertEqual(fetch.items, 6)
+        self.assertEqual(validate.items, 6)
+        self.assertEqual(sink.items, len(self.downloader.downloaded_urls))
+
+        # files are only named once they have gone through every stage
+        self.assertEqual(sorted(os.listdir(self.destination)),
+                         sorted(os.path.basename(path)
+                                for path in destinations))
+
+
+class SlowImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(1000 * 1024))
+        self.end_headers()
+        try:
+            for i in range(1000):
+                self.wfile.write(b'x' * 1024)
+                self.wfile.flush()
+                time.sleep(0.01)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FileDownloaderTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowImageHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+        self.destination = os.path.join('temp', 'slow_download.jpg')
+        if os.path.isfile(self.destination):
+            os.remove(self.destination)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_cancellation_aborts_the_transfer(self):
+        host, port = self.server.server_address
+        url = 'http://{}:{}/image.jpg'.format(host, port)
+
+        cancellation = threading.Event()
+        timer = threading.Timer(0.2, cancellation.set)
+        timer.start()
+
+        file_downloader = downloader.FileDownloader(self.destination)
+        started = time.perf_counter()
+        result = file_downloader.download(url, cancellation)
+        elapsed = time.perf_counter() - started
+        timer.join()
+
+        self.assertIsNone(result)
+        self.assertLess(elapsed, 2)
+        self.assertFalse(os.path.exists(self.destination))
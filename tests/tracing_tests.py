@@ -0,0 +1,173 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import shutil
+import sys
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from config import config
+from image_net import downloader, tracing
+from image_net.metrics import Registry
+from image_net.tracing import RequestTrace, Tracer
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'image'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TracerTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.tracer = Tracer(Registry(), sample_rate=1, capacity=2)
+
+    def tearDown(self):
+        tracing.activate(None)
+
+    def test_phase_starts_where_previous_one_ended(self):
+        trace = RequestTrace('http://example.com/1.jpg')
+        trace.add('dns', 1.0, 1.5)
+        trace.mark('connect')
+
+        self.assertEqual(trace.host, 'example.com')
+        self.assertEqual(trace.phases[1][1], 1.5)
+        self.assertEqual(trace.seconds('dns'), 0.5)
+
+    def test_started_trace_is_current(self):
+        trace = self.tracer.start('http://example.com/1.jpg')
+        self.assertIs(tracing.current(), trace)
+
+        tracing.activate(None)
+        tracing.mark('body')
+        self.assertEqual(trace.phases, [])
+
+    def test_collect_fills_histograms(self):
+        for host in ['a.com', 'a.com', 'b.com']:
+            trace = RequestTrace('http://{}/1.jpg'.format(host))
+            trace.add('dns', 0, 0.5)
+            trace.add('body', 0.5, 2.5)
+            self.tracer.finish(trace)
+        self.tracer.collect()
+
+        self.assertEqual(self.tracer.phase_seconds.count('dns'), 3)
+        self.assertEqual(self.tracer.host_seconds.seconds('b.com'), 2.5)
+        self.assertEqual(self.tracer.slowest_hosts(1), [('a.com', 5)])
+
+    def test_number_of_hosts_is_bounded(self):
+        tracer = Tracer(Registry(), sample_rate=0, max_hosts=2)
+        for i in range(100):
+            trace = RequestTrace('http://{}.com/1.jpg'.format(i))
+            trace.add('body', 0, 1 + i % 3 + (i == 50) * 10)
+            tracer.finish(trace)
+        tracer.collect()
+
+        self.assertLessEqual(len(tracer.host_seconds), 4)
+        self.assertEqual(tracer.slowest_hosts(1), [('50.com', 13)])
+
+    def test_only_recent_sampled_traces_are_kept(self):
+        urls = ['http://example.com/{}'.format(i) for i in range(3)]
+        for url in urls:
+            self.tracer.finish(RequestTrace(url, sampled=True))
+        self.tracer.finish(RequestTrace('http://example.com/other'))
+        self.tracer.collect()
+
+        self.assertEqual([trace.url for trace in self.tracer.samples],
+                         urls[1:])
+
+    def test_chrome_trace(self):
+        trace = RequestTrace('http://example.com/1.jpg', sampled=True)
+        trace.mark('first_byte')
+        self.tracer.finish(trace)
+
+        events = self.tracer.chrome_trace()['traceEvents']
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertEqual(event['name'], 'first_byte')
+        self.assertEqual(event['ph'], 'X')
+        self.assertEqual(event['cat'], 'example.com')
+        self.assertEqual(event['args'], {'url': 'http://example.com/1.jpg'})
+        self.assertGreaterEqual(event['dur'], 0)
+
+    def test_write_chrome_trace(self):
+        path = os.path.join(config.app_data_folder, 'traces', 'trace.json')
+        self.tracer.write_chrome_trace(path)
+
+        with open(path) as f:
+            self.assertEqual(json.load(f)['traceEvents'], [])
+
+
+class RequestPhasesTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.destination = os.path.join(config.app_data_folder,
+                                        'tracing_home')
+        if os.path.exists(self.destination):
+            shutil.rmtree(self.destination)
+        os.makedirs(self.destination)
+        tracing.default_tracer.clear()
+
+    def tearDown(self):
+        tracing.activate(None)
+
+    def _download_traced(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:{}/1.jpg'.format(server.server_port)
+            trace = Tracer(Registry()).start(url)
+            path = os.path.join(self.destination, '1.jpg')
+            success = downloader.FileDownloader(path).download(url)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertTrue(success)
+        return [phase[0] for phase in trace.phases]
+
+    def test_network_phases_are_recorded(self):
+        self.assertEqual(self._download_traced(),
+                         ['dns', 'connect', 'first_byte', 'body'])
+
+    def test_connections_are_not_traced_with_old_urllib3(self):
+        with mock.patch.object(tracing, 'NameResolutionError', None):
+            self.assertEqual(self._download_traced(), ['first_byte', 'body'])
+
+    def test_stages_are_recorded(self):
+        urls = ['url{}'.format(i) for i in range(10)]
+        destinations = [os.path.join(self.destination, str(i))
+                        for i in range(10)]
+        threading_downloader = downloader.TestThreadingDownloader()
+        threading_downloader.download(urls, destinations)
+
+        phase_seconds = tracing.default_tracer.phase_seconds
+        self.assertEqual(phase_seconds.count('validate'), 10)
+        self.assertEqual(phase_seconds.count('write'),
+                         len(threading_downloader.downloaded_urls))
@@ -0,0 +1,75 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import shutil
+import sys
+import unittest
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from image_net.url_status import UrlStatusStore
+
+
+class UrlStatusStoreTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.directory = os.path.join('temp', 'url_status')
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
+        self.path = os.path.join(self.directory, 'status.sqlite')
+        self.store = UrlStatusStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_unknown_url(self):
+        self.assertIsNone(self.store.status('n1', 'url1'))
+        self.assertFalse(self.store.is_fetched('n1', 'url1'))
+
+    def test_statuses_persist(self):
+        self.store.mark([('n1', 'url1'), ('n1', 'url2')],
+                        UrlStatusStore.in_flight)
+        self.store.record([
+            ('n1', 'url1', UrlStatusStore.ok, None, 'n1/1.jpg'),
+            ('n1', 'url2', UrlStatusStore.failed, 'HTTP 404', None)
+        ])
+        self.store.close()
+
+        self.store = UrlStatusStore(self.path)
+        self.assertTrue(self.store.is_fetched('n1', 'url1'))
+        self.assertEqual(self.store.status('n1', 'url2'),
+                         UrlStatusStore.failed)
+        self.assertEqual(self.store.reason('n1', 'url2'), 'HTTP 404')
+        self.assertEqual(self.store.counts(), {'ok': 1, 'failed': 1})
+
+    def test_same_url_in_different_categories(self):
+        self.store.record([('n1', 'url1', UrlStatusStore.ok, None, None)])
+        self.assertFalse(self.store.is_fetched('n2', 'url1'))
+
+    def test_recover_interrupted_downloads(self):
+        self.store.mark([('n1', 'url1')], UrlStatusStore.in_flight)
+        self.store.recover()
+        self.assertEqual(self.store.status('n1', 'url1'),
+                         UrlStatusStore.pending)
+
+    def test_clear(self):
+        self.store.mark([('n1', 'url1')], UrlStatusStore.in_flight)
+        self.store.clear()
+        self.assertEqual(self.store.counts(), {})
@@ -0,0 +1,145 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import shutil
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, './')
+
+from registered_test_cases import Meta
+from image_net.url_store import SynsetUrlStore
+
+
+class SynsetUrlStoreTests(unittest.TestCase, metaclass=Meta):
+    def setUp(self):
+        self.location = os.path.join('temp', 'url_store')
+        if os.path.exists(self.location):
+            shutil.rmtree(self.location)
+        os.makedirs(self.location)
+
+        self.path = os.path.join(self.location, 'synset_urls.store')
+
+    def _urls(self, count):
+        return ['http://example.com/{}.jpg'.format(i) for i in range(count)]
+
+    def test_skips_blank_lines(self):
+        store = SynsetUrlStore(self.path)
+        store.add('n1', ['', 'url1 ', '  ', ' url2', 'url3\n'])
+
+        self.assertEqual(store.count('n1'), 3)
+        self.assertEqual(list(store.urls('n1')), ['url1', 'url2', 'url3'])
+
+    def test_urls_starting_from_offset(self):
+        store = SynsetUrlStore(self.path, urls_per_block=3)
+        urls = self._urls(10)
+        store.add('n1', urls)
+
+        for start in range(12):
+            self.assertEqual(list(store.urls('n1', start=start)),
+                             urls[start:])
+
+    def test_categories_are_kept_apart(self):
+        store = SynsetUrlStore(self.path, urls_per_block=2)
+        store.add('n1', ['url1', 'url2', 'url3'])
+        store.add('n2', ['url4'])
+        store.add('n3', [])
+
+        self.assertEqual(list(store.urls('n1')), ['url1', 'url2', 'url3'])
+        self.assertEqual(list(store.urls('n2')), ['url4'])
+        self.assertEqual(list(store.urls('n3')), [])
+        self.assertNotIn('n4', store)
+
+    def test_store_is_compressed(self):
+        store = SynsetUrlStore(self.path)
+        urls = self._urls(1000)
+        store.add('n1', urls)
+
+        text_size = len('\n'.join(urls))
+        self.assertLess(os.path.getsize(self.path), text_size / 4)
+
+    def test_store_is_reused_by_new_instance(self):
+        SynsetUrlStore(self.path, urls_per_block=2).add('n1', self._urls(5))
+
+        store = SynsetUrlStore(self.path)
+        self.assertIn('n1', store)
+        self.assertEqual(store.count('n1'), 5)
+        self.assertEqual(list(store.urls('n1', start=3)), self._urls(5)[3:])
+
+    def test_adding_again_replaces_category(self):
+        store = SynsetUrlStore(self.path)
+        store.add('n1', ['url1', 'url2'])
+        store.add('n1', ['url3'])
+
+        self.assertEqual(list(store.urls('n1')), ['url3'])
+        self.assertEqual(list(SynsetUrlStore(self.path).urls('n1')),
+                         ['url3'])
+
+    def test_append(self):
+        store = SynsetUrlStore(self.path)
+        store.add('n1', ['url1', 'url2'])
+        store.add('n2', ['url4'])
+        store.add('n1', ['url3'], append=True)
+
+        self.assertEqual(list(store.urls('n1')), ['url1', 'url2', 'url3'])
+        self.assertEqual(list(SynsetUrlStore(self.path).urls('n1')),
+                         ['url1', 'url2', 'url3'])
+
+    def test_failed_add_leaves_no_trace(self):
+        store = SynsetUrlStore(self.path, urls_per_block=2)
+        store.add('n1', ['url1'])
+        size = os.path.getsize(self.path)
+
+        def broken_list():
+            yield 'url2'
+            yield 'url3'
+            yield 'url4'
+            raise IOError()
+
+        self.assertRaises(IOError, lambda: store.add('n2', broken_list()))
+        self.assertNotIn('n2', store)
+        self.assertEqual(os.path.getsize(self.path), size)
+
+    def test_partially_written_category_is_discarded(self):
+        SynsetUrlStore(self.path).add('n1', ['url1'])
+        size = os.path.getsize(self.path)
+
+        store = SynsetUrlStore(self.path, urls_per_block=1)
+        with mock.patch.object(SynsetUrlStore, 'last_block', 0):
+            store.add('n2', ['url2', 'url3'])
+
+        store = SynsetUrlStore(self.path)
+        self.assertNotIn('n2', store)
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertEqual(list(store.urls('n1')), ['url1'])
+
+    def test_shared_store_is_reused_for_a_path(self):
+        store = SynsetUrlStore.shared(self.path)
+        store.add('n1', ['url1'])
+
+        self.assertIs(SynsetUrlStore.shared(self.path), store)
+
+    def test_shared_store_is_reloaded_after_removal(self):
+        store = SynsetUrlStore.shared(self.path)
+        store.add('n1', ['url1'])
+        os.remove(self.path)
+
+        reloaded = SynsetUrlStore.shared(self.path)
+        self.assertIsNot(reloaded, store)
+        self.assertNotIn('n1', reloaded)
@@ -19,21 +19,53 @@
 
 import os
 import json
+import time
+import shutil
+import hashlib
 from urllib.parse import urlparse
 
 from image_net.iterators import Position
+from image_net.categories import CategorySelection
+from image_net.sampling import Sampling
 from config import config
 from util.average import RunningAverage
+from util.state_journal import StateJournal
+from image_net.url_status import UrlStatusStore
+from image_net.counts import CountTable
+from image_net.pipeline import Pipeline, Stage, StageMetrics
+from image_net import metrics
 
 
 class AppState:
-    def __init__(self):
+    def __init__(self, path=None):
         self._running_avg = RunningAverage()
 
+        # worker processes of a sharded download keep their own states
+        # next to the main one, only the main state owns shared data
+        if path is None:
+            self._path = config.app_state_path
+            self._backup_path = config.app_state_backup_path
+            journal_path = config.app_state_journal_path
+        else:
+            self._path = path
+            self._backup_path = path + '.prev'
+            journal_path = os.path.splitext(path)[0] + '.journal'
+        self._owns_shared_data = path is None
+        self._directory = os.path.dirname(self._path)
+
+        self._journal = StateJournal(journal_path)
+        self._generation = 0
+        self._journal_length = 0
+        self._url_statuses = None
+        self._writer = None
+        self.journal_metrics = StageMetrics('journal')
+
         self.reset()
 
         try:
             self.load()
+        except CorruptedStateError as e:
+            self.add_error(str(e))
         except:
             pass
 
@@ -65,6 +97,10 @@ class AppState:
         self.configured = False
         self._errors = []
 
+        # data of the previous download is dropped on the next save,
+        # unless the saved state is loaded back before that
+        self._stale_download_data = True
+
     def add_error(self, message):
         self._errors.append(message)
 
@@ -93,9 +129,10 @@ class AppState:
         self.internal_state = internal_state
 
     def save(self):
-        if not os.path.exists(config.app_data_folder):
-            os.mkdir(config.app_data_folder)
+        self.wait_for_checkpoints()
+        self._prepare_save()()
 
+    def _prepare_save(self):
         conf_dict = self.download_configuration.as_dict()
 
         progress_info = self.progress_info.as_dict()
@@ -107,12 +144,148 @@ class AppState:
             'progress_info': progress_info,
             'internal_state': internal_state,
             'configured': self.configured,
-            'errors': self._errors
+            'errors': list(self._errors)
         }
 
-        path = config.app_state_path
-        with open(path, 'w') as f:
-            f.write(json.dumps(d))
+        # journal records of an older generation are ignored, so it
+        # does not matter if the process dies before clearing the journal
+        self._generation += 1
+        d['journal_generation'] = self._generation
+        self._journal_length = 0
+
+        drop_download_data = self._stale_download_data and \
+            self._owns_shared_data
+        self._stale_download_data = False
+
+        def write():
+            started = time.perf_counter()
+            os.makedirs(self._directory, exist_ok=True)
+            self._write_checkpoint(d)
+            self._journal.clear()
+            metrics.checkpoint_seconds.observe(
+                time.perf_counter() - started, 'full'
+            )
+
+            if drop_download_data:
+                self._drop_download_data()
+        return write
+
+    def _drop_download_data(self):
+        if self.url_statuses is not None:
+            self.url_statuses.clear()
+
+        for folder in [config.shards_folder, config.units_folder]:
+            if os.path.exists(folder):
+                shutil.rmtree(folder)
+
+        for path in [config.coordinator_state_path, config.manifest_path]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _write_checkpoint(self, state_dict):
+        # the new state is made durable under a temporary name before it
+        # replaces the current one, which is kept as the previous generation.
+        # The current state stays in place until it is replaced, so there
+        # is always a state under the usual name
+        path = self._path
+        body = json.dumps(state_dict)
+        checksum = hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+        temp_path = path + '.part'
+        with open(temp_path, 'w') as f:
+            f.write('sha256 {}\n'.format(checksum))
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if os.path.isfile(path):
+            self._keep_previous(path)
+        os.replace(temp_path, path)
+        self._sync_directory(self._directory)
+
+    def _keep_previous(self, path):
+        temp_path = self._backup_path + '.part'
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+        # a hard link costs nothing, a copy is made where there are none
+        try:
+            os.link(path, temp_path)
+        except OSError:
+            shutil.copyfile(path, temp_path)
+        os.replace(temp_path, self._backup_path)
+
+    def _sync_directory(self, path):
+        # renames are only durable once the directory itself is synced,
+        # which is not possible on every platform
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def checkpoint(self, background=False, on_written=None):
+        # appends only what has changed since the previous checkpoint,
+        # the full state is rewritten every state_compaction_interval times.
+        # The state is copied right away, so in the background it is
+        # written while the download goes on; checkpoints are written
+        # one at a time in the order they were made. A failed write is
+        # raised by the next checkpoint
+        if background:
+            writer = self._checkpoint_writer()
+            writer.raise_errors()
+            writer.put((self._prepare_checkpoint(), on_written))
+            return
+
+        self.wait_for_checkpoints()
+        self._prepare_checkpoint()()
+        if on_written is not None:
+            on_written()
+
+    def _prepare_checkpoint(self):
+        if self._generation == 0 or \
+                self._journal_length + 1 >= config.state_compaction_interval:
+            return self._prepare_save()
+
+        record = {
+            'generation': self._generation,
+            'progress_info': self.progress_info.as_dict(),
+            'internal_state': self.internal_state.changes_as_dict(),
+            'errors': list(self._errors)
+        }
+        self._journal_length += 1
+
+        def write():
+            started = time.perf_counter()
+            os.makedirs(self._directory, exist_ok=True)
+            self._journal.append(record)
+            metrics.checkpoint_seconds.observe(
+                time.perf_counter() - started, 'journal'
+            )
+        return write
+
+    def _checkpoint_writer(self):
+        if self._writer is None:
+            self._writer = Pipeline([
+                Stage('journal', self._write_in_background,
+                      queue_size=config.journal_queue_size,
+                      metrics=self.journal_metrics)
+            ])
+            self._writer.start()
+        return self._writer
+
+    def _write_in_background(self, item):
+        write, on_written = item
+        write()
+        if on_written is not None:
+            on_written()
+
+    def wait_for_checkpoints(self):
+        if self._writer is not None:
+            self._writer.join()
 
     def to_json(self):
         download_conf = self.download_configuration
@@ -134,24 +307,92 @@ class AppState:
         if not os.path.exists(config.app_data_folder):
             os.mkdir(config.app_data_folder)
 
-        with open(config.app_state_path, 'r') as f:
-            s = f.read()
-            d = json.loads(s)
-            conf_dict = d['download_configuration']
+        path = self._path
+        backup_path = self._backup_path
+        if not os.path.isfile(path) and not os.path.isfile(backup_path):
+            raise FileNotFoundError(path)
 
-            self.download_configuration = DownloadConfiguration.from_dict(
-                conf_dict
+        try:
+            state = self._read_checkpoint(path)
+            restored = False
+        except Exception:
+            try:
+                state = self._read_checkpoint(backup_path)
+            except Exception:
+                # kept aside for inspection, it would be overwritten
+                # by the next save otherwise
+                if os.path.isfile(path):
+                    os.replace(path, path + '.corrupt')
+                raise CorruptedStateError(
+                    'Saved download state is damaged and could not be restored'
+                )
+            restored = True
+
+        (self.download_configuration, self.progress_info,
+         self.internal_state, self.configured, self._errors,
+         self._generation) = state
+        self._stale_download_data = False
+
+        if restored:
+            # kept aside, the next save would make it the previous
+            # generation otherwise
+            if os.path.isfile(path):
+                os.replace(path, path + '.corrupt')
+
+        # only records made after the loaded state are replayed, the ones
+        # of the damaged generation are dropped by the save
+        replayed = 0
+        for record in self._journal.records():
+            if record['generation'] != self._generation:
+                continue
+
+            self.progress_info = ProgressInfo.from_dict(
+                record['progress_info']
+            )
+            self.internal_state.apply_changes(record['internal_state'])
+            self._errors = record['errors']
+            replayed += 1
+
+        if restored:
+            self.add_error(
+                'Saved download state was damaged, '
+                'progress was restored from the previous checkpoint'
             )
 
-            progress_info_dict = d['progress_info']
+        if replayed or restored:
+            self.save()
+
+    def _read_checkpoint(self, path):
+        with open(path, 'r') as f:
+            s = f.read()
+
+        # states saved by earlier versions have no checksum line
+        if s.startswith('sha256 '):
+            header, _, s = s.partition('\n')
+            checksum = hashlib.sha256(s.encode('utf-8')).hexdigest()
+            if header.split()[1] != checksum:
+                raise CorruptedStateError('Checksum mismatch in ' + path)
 
-            self.progress_info = ProgressInfo.from_dict(progress_info_dict)
+        d = json.loads(s)
 
-            internal_state = d['internal_state']
-            self.internal_state = InternalState.from_dict(internal_state)
+        conf = DownloadConfiguration.from_dict(d['download_configuration'])
+        progress_info = ProgressInfo.from_dict(d['progress_info'])
+        internal_state = InternalState.from_dict(d['internal_state'])
 
-            self.configured = d['configured']
-            self._errors = d['errors']
+        return (conf, progress_info, internal_state, d['configured'],
+                d['errors'], d.get('journal_generation', 0))
+
+    @property
+    def url_statuses(self):
+        if not config.track_url_status:
+            return None
+
+        if self._url_statuses is None:
+            if not os.path.exists(config.app_data_folder):
+                os.mkdir(config.app_data_folder)
+            self._url_statuses = UrlStatusStore(config.url_status_db_path)
+            self._url_statuses.recover()
+        return self._url_statuses
 
     @property
     def inprogress(self):
@@ -200,30 +441,66 @@ class AppState:
 
 
 class DownloadConfiguration:
+    __slots__ = ('number_of_images', 'images_per_category',
+                 'download_destination', 'batch_size',
+                 'interleaved_categories', 'shards', 'categories', 'sampling')
+
     def __init__(self, number_of_images,
                  images_per_category,
                  download_destination,
-                 batch_size=100):
+                 batch_size=100,
+                 categories=None,
+                 interleaved_categories=1,
+                 sampling=None,
+                 shards=1):
         self.number_of_images = number_of_images
         self.images_per_category = images_per_category
         self.download_destination = download_destination
         self.batch_size = batch_size
+        self.interleaved_categories = interleaved_categories
+        self.shards = shards
+
+        if categories is None:
+            categories = CategorySelection()
+        self.categories = categories
+
+        if sampling is None:
+            sampling = Sampling()
+        self.sampling = sampling
 
     def as_dict(self):
         return {
             'number_of_images': self.number_of_images,
             'images_per_category': self.images_per_category,
             'download_destination': self.download_destination,
-            'batch_size': self.batch_size
+            'batch_size': self.batch_size,
+            'categories': self.categories.as_dict(),
+            'interleaved_categories': self.interleaved_categories,
+            'sampling': self.sampling.as_dict(),
+            'shards': self.shards
         }
 
     @staticmethod
     def from_dict(conf_dict):
+        if 'categories' in conf_dict:
+            categories = CategorySelection.from_dict(conf_dict['categories'])
+        else:
+            categories = CategorySelection()
+
+        if 'sampling' in conf_dict:
+            sampling = Sampling.from_dict(conf_dict['sampling'])
+        else:
+            sampling = Sampling()
+
         return DownloadConfiguration(
             number_of_images=conf_dict['number_of_images'],
             images_per_category=conf_dict['images_per_category'],
             download_destination=conf_dict['download_destination'],
-            batch_size=conf_dict['batch_size']
+            batch_size=conf_dict['batch_size'],
+            categories=categories,
+            interleaved_categories=conf_dict.get('interleaved_categories', 1),
+            sampling=sampling,
+            shards=conf_dict.get('shards', 1)
         )
 
     @property
@@ -233,6 +510,13 @@ class DownloadConfiguration:
 
         path = self._parse_url(self.download_destination)
 
+        if self.categories.kind == 'list' and \
+                not self.categories.word_net_ids:
+            return False
+
+        if self.interleaved_categories <= 0 or self.shards <= 0:
+            return False
+
         return os.path.exists(path) and self.number_of_images > 0 \
                 and self.images_per_category > 0
 
@@ -263,6 +547,22 @@ class DownloadConfiguration:
                 'Images per category must be greater than 0'
             )
 
+        if self.categories.kind == 'list' and \
+                not self.categories.word_net_ids:
+            errors_list.append(
+                'List of categories to download is empty'
+            )
+
+        if self.interleaved_categories <= 0:
+            errors_list.append(
+                'Number of interleaved categories must be greater than 0'
+            )
+
+        if self.shards <= 0:
+            errors_list.append(
+                'Number of download processes must be greater than 0'
+            )
+
         return errors_list
 
     def _parse_url(self, file_uri):
@@ -271,6 +571,9 @@ class DownloadConfiguration:
 
 
 class ProgressInfo:
+    __slots__ = ('total_downloaded', 'total_failed', 'finished',
+                 'last_result')
+
     def __init__(self, total_downloaded, total_failed, finished,
                  last_result):
         self.total_downloaded = total_downloaded
@@ -301,16 +604,67 @@ class ProgressInfo:
 
 
 class InternalState:
-    def __init__(self, iterator_position, category_counts, file_index):
+    def __init__(self, iterator_position, category_counts, file_index,
+                 cursors=None, sample_offset=-1, concurrency=None,
+                 pending_urls=None, sample_sizes=None):
         self.iterator_position = iterator_position
-        self.category_counts = category_counts
+        self.category_counts = CountTable(category_counts)
         self.file_index = file_index
+        self.cursors = cursors or []
+        self.sample_offset = sample_offset
+        self.concurrency = concurrency
+        self.pending_urls = pending_urls or []
+        self.sample_sizes = sample_sizes
+        self._changed_counts = set()
+        self._sample_sizes_changed = False
+
+    def update_counts(self, counts):
+        self.category_counts.update(counts)
+        self._changed_counts.update(counts)
+
+    def set_sample_sizes(self, sizes):
+        self.sample_sizes = list(sizes)
+        self._sample_sizes_changed = True
+
+    def changes_as_dict(self):
+        # only the changed counts are copied, a checkpoint must not cost
+        # time proportional to the number of categories; the sample sizes
+        # are only written once
+        counts = {wn_id: self.category_counts[wn_id]
+                  for wn_id in self._changed_counts}
+        self._changed_counts = set()
+        d = self._as_dict(counts)
+        if self._sample_sizes_changed:
+            d['sample_sizes'] = self.sample_sizes
+            self._sample_sizes_changed = False
+        return d
+
+    def apply_changes(self, changes):
+        changed = InternalState.from_dict(changes)
+        self.iterator_position = changed.iterator_position
+        self.file_index = changed.file_index
+        self.cursors = changed.cursors
+        self.sample_offset = changed.sample_offset
+        self.concurrency = changed.concurrency
+        self.pending_urls = changed.pending_urls
+        self.category_counts.update(changed.category_counts)
+        if changed.sample_sizes is not None:
+            self.sample_sizes = changed.sample_sizes
 
     def as_dict(self):
+        d = self._as_dict(dict(self.category_counts))
+        d['sample_sizes'] = self.sample_sizes
+        return d
+
+    def _as_dict(self, counts):
         return {
             'iterator_position_json': self.iterator_position.to_json(),
-            'category_counts': self.category_counts,
-            'file_index': self.file_index
+            'category_counts': counts,
+            'file_index': self.file_index,
+            'cursors_json': [cursor.to_json() for cursor in self.cursors],
+            'sample_offset': self.sample_offset,
+            'concurrency': self.concurrency,
+            'pending_urls': [list(pair) for pair in self.pending_urls]
         }
 
     @staticmethod
@@ -319,12 +673,23 @@ class InternalState:
         position = Position.from_json(state_dict['iterator_position_json'])
         counts = state_dict['category_counts']
         file_index = state_dict['file_index']
+        cursors = [Position.from_json(s)
+                   for s in state_dict.get('cursors_json', [])]
+        pending_urls = [tuple(pair)
+                        for pair in state_dict.get('pending_urls', [])]
         return InternalState(iterator_position=position,
                              category_counts=counts,
-                             file_index=file_index)
+                             file_index=file_index,
+                             cursors=cursors,
+                             sample_offset=state_dict.get('sample_offset', -1),
+                             concurrency=state_dict.get('concurrency'),
+                             pending_urls=pending_urls,
+                             sample_sizes=state_dict.get('sample_sizes'))
 
 
 class Result:
+    __slots__ = ('failed_urls', 'succeeded_urls')
+
     def __init__(self, failed_urls, succeeded_urls):
         self.failed_urls = failed_urls
         self.succeeded_urls = succeeded_urls
@@ -339,3 +704,6 @@ class Result:
 
 
 class DirectoryNotFoundError(Exception): pass
+
+
+class CorruptedStateError(Exception): pass
@@ -15,11 +15,14 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+
 from PyQt5 import QtCore
 from PyQt5.QtCore import QThread, QMutex, QWaitCondition
 
-from image_net.stateful_downloader import StatefulDownloader
+from image_net.sharding import create_downloader, ShardFailedError
 from image_net.iterators import WordNetIdsUnavailableError
+from image_net.categories import CategoriesUnavailableError
 
 
 class DownloadManager(QThread):
@@ -38,9 +41,14 @@ class DownloadManager(QThread):
         super().__init__()
         self.mutex = QMutex()
         self.download_paused = False
+        self.download_stopped = False
         self.wait_condition = QWaitCondition()
 
-        self.stateful_downloader = StatefulDownloader(app_state)
+        # set on pause and on stop, aborts downloads in flight
+        self._cancellation = threading.Event()
+
+        self._app_state = app_state
+        self.stateful_downloader = None
 
         self._has_started = False
 
@@ -48,28 +56,63 @@ class DownloadManager(QThread):
         try:
             self._has_started = True
 
+            # the number of processes is only known once it is configured
+            self.stateful_downloader = create_downloader(
+                self._app_state, cancellation=self._cancellation
+            )
             stateful_downloader = self.stateful_downloader
 
-            for result in stateful_downloader:
-                self.imagesLoaded.emit(result.succeeded_urls)
-                self.downloadFailed.emit(result.failed_urls)
+            while True:
+                for result in stateful_downloader:
+                    self.imagesLoaded.emit(result.succeeded_urls)
+                    self.downloadFailed.emit(result.failed_urls)
+
+                if not self._cancellation.is_set() or \
+                        stateful_downloader.progress_info.finished:
+                    break
 
-                if self.download_paused:
-                    self.downloadPaused.emit()
-                    self.mutex.lock()
+                stateful_downloader.save()
+                if self.download_stopped:
+                    return
+
+                self.downloadPaused.emit()
+                self.mutex.lock()
+                while self.download_paused and not self.download_stopped:
                     self.wait_condition.wait(self.mutex)
-                    self.mutex.unlock()
+                self.mutex.unlock()
+
+                if self.download_stopped:
+                    return
+
+                # iterating again continues from the saved state
+                self._cancellation.clear()
 
             self.allDownloaded.emit()
         except WordNetIdsUnavailableError:
             msg = 'Failed to fetch a list of WordNet ids. ' \
                   'Check if ImageNet server can be reached'
             self.exceptionRaised.emit(msg)
+        except CategoriesUnavailableError as e:
+            self.exceptionRaised.emit(str(e))
+        except ShardFailedError as e:
+            self.exceptionRaised.emit(
+                'A download process has failed: {}'.format(e)
+            )
 
     def pause_download(self):
         self.mutex.lock()
         self.download_paused = True
         self.mutex.unlock()
+        self._cancellation.set()
+
+    def stop_download(self):
+        # returns once the download thread has saved the state and exited
+        self.mutex.lock()
+        self.download_stopped = True
+        self.mutex.unlock()
+        self._cancellation.set()
+        self.wait_condition.wakeAll()
+        self.wait()
 
     def resume_download(self):
         if not self._has_started:
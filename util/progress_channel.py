@@ -0,0 +1,83 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import threading
+
+from PyQt5 import QtCore
+
+from config import config
+
+
+class ProgressChannel(QtCore.QObject):
+    # Collects the results of batches as they come and reports them to the
+    # interface at a fixed rate, however often batches finish. An update
+    # carries the totals and only the URLs that failed since the last one.
+    progressUpdated = QtCore.pyqtSignal(str)
+
+    max_failed_urls = 200
+
+    def __init__(self, app_state, interval=None):
+        super().__init__()
+        self._app_state = app_state
+        self._lock = threading.Lock()
+        self._failed_urls = []
+        self._dropped_urls = 0
+        self._changed = False
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval or config.progress_refresh_interval)
+        self._timer.timeout.connect(self.flush)
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+        self.flush()
+
+    def add(self, succeeded_urls, failed_urls):
+        with self._lock:
+            room = self.max_failed_urls - len(self._failed_urls)
+            self._failed_urls.extend(failed_urls[:max(0, room)])
+            self._dropped_urls += max(0, len(failed_urls) - max(0, room))
+            self._changed = True
+
+    def clear(self):
+        with self._lock:
+            self._failed_urls = []
+            self._dropped_urls = 0
+            self._changed = False
+
+    def flush(self):
+        with self._lock:
+            if not self._changed:
+                return
+            failed_urls = self._failed_urls
+            dropped_urls = self._dropped_urls
+            self._failed_urls = []
+            self._dropped_urls = 0
+            self._changed = False
+
+        progress_info = self._app_state.progress_info
+        delta = dict(imagesLoaded=progress_info.total_downloaded,
+                     failures=progress_info.total_failed,
+                     progress=self._app_state.calculate_progress(),
+                     timeLeft=self._app_state.time_remaining,
+                     failedUrls=failed_urls,
+                     droppedFailedUrls=dropped_urls)
+        self.progressUpdated.emit(json.dumps(delta))
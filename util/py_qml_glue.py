@@ -20,8 +20,11 @@ import os
 from urllib.parse import urlparse
 
 from util.download_manager import DownloadManager
+from util.progress_channel import ProgressChannel
 from util.app_state import AppState, DownloadConfiguration
 from config import config
+from image_net.categories import CategorySelection, \
+    CategoriesUnavailableError
 
 
 class DummyStrategy(QtCore.QObject):
@@ -45,6 +48,9 @@ class DummyStrategy(QtCore.QObject):
     def resume_download(self):
         pass
 
+    def stop_download(self):
+        pass
+
     def configure(self, destination, number_of_examples,
                   images_per_category, batch_size=100):
         pass
@@ -55,6 +61,7 @@ class DummyStrategy(QtCore.QObject):
 
 class StateManager(QtCore.QObject):
     stateChanged = QtCore.pyqtSignal()
+    progressChanged = QtCore.pyqtSignal(str, arguments=['delta'])
     exceptionRaised = QtCore.pyqtSignal(str, arguments=['message'])
 
     def __init__(self):
@@ -70,25 +77,33 @@ class StateManager(QtCore.QObject):
             self._state = 'initial'
             self._reset_log()
 
+        # results of batches reach the interface through the channel,
+        # stateChanged is only emitted when the state itself changes
+        self._progress = ProgressChannel(self._app_state)
+        self._progress.progressUpdated.connect(self.progressChanged)
+        self._progress.start()
+
         self._strategy = self.get_strategy()
         self._connect_signals()
 
     def _connect_signals(self):
         def handle_loaded(urls):
-            self.stateChanged.emit()
+            self._progress.add(succeeded_urls=urls, failed_urls=[])
 
         def handle_failed(urls):
             self._log_failures(self._log_path, urls)
-            self.stateChanged.emit()
+            self._progress.add(succeeded_urls=[], failed_urls=urls)
 
         def handle_paused():
             self._state = 'paused'
+            self._progress.flush()
             self.stateChanged.emit()
 
         def handle_allDownloaded():
             self._state = 'finished'
             self._app_state.mark_finished()
             self._app_state.save()
+            self._progress.flush()
             self.stateChanged.emit()
 
         def handle_exception(message):
@@ -129,17 +144,35 @@ class StateManager(QtCore.QObject):
             self._strategy.start()
 
     @QtCore.pyqtSlot(str, int, int)
+    @QtCore.pyqtSlot(str, int, int, str)
     def configure(self, destination, number_of_images,
-                  images_per_category):
+                  images_per_category, categories='all'):
         if self._state not in ['initial', 'ready']:
             return
 
         self._app_state.reset()
 
+        # only the selections which need no further input are offered
+        if categories == 'ilsvrc2012':
+            selection = CategorySelection.ilsvrc2012()
+        else:
+            selection = CategorySelection()
+
+        try:
+            selection.resolve()
+        except CategoriesUnavailableError as e:
+            self._state = 'initial'
+            self._app_state.add_error(str(e))
+            self.stateChanged.emit()
+            return
+
         conf = DownloadConfiguration(number_of_images=number_of_images,
                                      images_per_category=images_per_category,
                                      download_destination=destination,
-                                     batch_size=config.default_batch_size)
+                                     batch_size=config.default_batch_size,
+                                     categories=selection,
+                                     interleaved_categories=config.default_interleaved_categories,
+                                     shards=config.default_shards)
         if conf.is_valid:
             self._state = 'ready'
             path = self._parse_url(destination)
@@ -175,16 +208,20 @@ class StateManager(QtCore.QObject):
 
     @QtCore.pyqtSlot()
     def reset(self):
-        if self._state not in ['running', 'pausing']:
-            self._state = 'initial'
-            self._reset_log()
-            self._app_state.reset()
-            self._strategy.quit()
-            self._strategy = self.get_strategy()
-            self._connect_signals()
+        if self._state in ['running', 'pausing', 'paused']:
+            # the download thread must be gone before its state is reset
+            self._strategy.stop_download()
 
-            self._app_state.save()
-            self.stateChanged.emit()
+        self._state = 'initial'
+        self._reset_log()
+        self._progress.clear()
+        self._app_state.reset()
+        self._strategy.quit()
+        self._strategy = self.get_strategy()
+        self._connect_signals()
+
+        self._app_state.save()
+        self.stateChanged.emit()
 
     @QtCore.pyqtProperty(str)
     def download_state(self):
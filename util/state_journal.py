@@ -0,0 +1,64 @@
+# <imagenet-resumable-downloader - a GUI based utility for getting ImageNet images>
+# Copyright © 2019 Evgenii Dolotov. Contacts <supernovaprotocol@gmail.com>
+# Author: Evgenii Dolotov
+# License: https://www.gnu.org/licenses/gpl-3.0.txt
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import json
+
+
+class StateJournal:
+    # Append-only file of JSON records, one per line. A record cut short
+    # by a crash can only be the last one. It is cut off the file on
+    # reading, otherwise the next record would be appended to it and lost.
+    def __init__(self, path):
+        self._path = path
+
+    def append(self, record):
+        with open(self._path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def records(self):
+        if not os.path.isfile(self._path):
+            return
+
+        complete = 0
+        with open(self._path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+
+                complete += len(line)
+                yield record
+
+        if complete < os.path.getsize(self._path):
+            self._truncate(complete)
+
+    def _truncate(self, size):
+        with open(self._path, 'r+b') as f:
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        if os.path.isfile(self._path):
+            os.remove(self._path)